@@ -0,0 +1,97 @@
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class AgentClient:
+    """Общий HTTP-клиент для агентов: отдельная keep-alive сессия с пулом соединений на каждый агент"""
+
+    def __init__(self, pool_maxsize=None, max_retries=None, backoff_factor=None, connect_timeout=None):
+        self.pool_maxsize = pool_maxsize or Config.AGENT_POOL_MAXSIZE
+        self.max_retries = Config.AGENT_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_factor = Config.AGENT_RETRY_BACKOFF if backoff_factor is None else backoff_factor
+        self.connect_timeout = connect_timeout or Config.AGENT_CONNECT_TIMEOUT
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+
+    def _make_session(self):
+        # Повторяем только ошибки соединения для всех методов и 5xx для GET:
+        # POST к агенту (start/stop/upload) не идемпотентен
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=0,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def session_for(self, agent_url):
+        session = self.sessions.get(agent_url)
+        if session is None:
+            with self.sessions_lock:
+                session = self.sessions.get(agent_url)
+                if session is None:
+                    session = self._make_session()
+                    self.sessions[agent_url] = session
+        return session
+
+    def _timeout(self, timeout):
+        return (min(self.connect_timeout, timeout), timeout)
+
+    def get(self, agent_url, path, timeout, **kwargs):
+        return self.session_for(agent_url).get(
+            f"{agent_url}{path}", timeout=self._timeout(timeout), **kwargs
+        )
+
+    def post(self, agent_url, path, timeout, **kwargs):
+        return self.session_for(agent_url).post(
+            f"{agent_url}{path}", timeout=self._timeout(timeout), **kwargs
+        )
+
+    def get_stats(self):
+        stats = {}
+        with self.sessions_lock:
+            sessions = list(self.sessions.items())
+        for agent_url, session in sessions:
+            connections = 0
+            requests_count = 0
+            for adapter in set(session.adapters.values()):
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is None:
+                        continue
+                    connections += pool.num_connections
+                    requests_count += pool.num_requests
+            stats[agent_url] = {
+                'requests': requests_count,
+                'connections_opened': connections,
+                'connections_reused': max(requests_count - connections, 0)
+            }
+        return {
+            'pool_maxsize': self.pool_maxsize,
+            'max_retries': self.max_retries,
+            'agents': stats
+        }
+
+    def close(self):
+        with self.sessions_lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
@@ -0,0 +1,131 @@
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactStore:
+    """Локальное контентно-адресуемое хранилище загруженных файлов (objects/<sha[:2]>/<sha>).
+
+    Индекс имён names.json общий для всех воркеров gunicorn: изменяется только под файловой блокировкой
+    и перечитывается с диска, поэтому загрузки разных воркеров не затирают друг друга.
+    """
+
+    def __init__(self, root, gc_min_age=3600):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.index_path = os.path.join(root, 'names.json')
+        self.lock_path = self.index_path + '.lock'
+        self.gc_min_age = gc_min_age
+        self.lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.names = self._load_index()
+
+    @property
+    def service_files(self):
+        return {os.path.basename(self.index_path), os.path.basename(self.lock_path)}
+
+    @contextmanager
+    def _index_lock(self):
+        # Блокировка между процессами; поток внутри процесса дополнительно держит self.lock
+        with self.lock, open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.names-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(self.names, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def save(self, stream, filename):
+        # Хешируем во время записи во временный файл, затем атомарно переносим в objects/
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.objects_dir, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    f.write(chunk)
+            sha256 = digest.hexdigest()
+            path = self.object_path(sha256)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._index_lock():
+            # Свежий индекс с диска: его могли дополнить другие воркеры
+            names = self._load_index()
+            names[filename] = sha256
+            self.names = names
+            self._save_index()
+            self._collect_garbage()
+        return sha256, path
+
+    def resolve(self, filename):
+        with self.lock:
+            sha256 = self.names.get(filename)
+        if sha256 is None:
+            # Файл мог загрузить другой воркер уже после того, как этот прочитал индекс
+            names = self._load_index()
+            with self.lock:
+                self.names = names
+            sha256 = names.get(filename)
+        if sha256 is None:
+            return None
+        path = self.object_path(sha256)
+        return path if os.path.exists(path) else None
+
+    def _collect_garbage(self):
+        """Удаляет объекты, на которые не ссылается ни одно имя, и брошенные временные файлы.
+
+        Вызывается под блокировкой индекса. Объекты моложе gc_min_age не трогаются: их может ещё рассылать
+        задача, начатая до того, как имя перезаписали новой загрузкой.
+        """
+        referenced = set(self.names.values())
+        cutoff = time.time() - self.gc_min_age
+        removed = 0
+        for directory, _, files in os.walk(self.objects_dir):
+            for name in files:
+                if name in referenced:
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        return removed
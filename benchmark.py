@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import logging
+from artifact_store import file_sha256
+from fleet_sim import Fleet
+from stub_agent import FaultProfile
+
+logger = logging.getLogger('benchmark')
+
+
+def _summary(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        'count': len(values),
+        'min': values[0],
+        'p50': statistics.median(values),
+        'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+        'max': values[-1],
+        'mean': statistics.fmean(values)
+    }
+
+
+def _wait_for(predicate, timeout, step=0.01):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(step)
+    return False
+
+
+def _is_online(monitor, server_key):
+    status = monitor.servers_status.get(server_key)
+    return status is not None and status.is_online
+
+
+def bench_probe_cycle(monitor, servers, cycles):
+    durations = []
+    for _ in range(cycles):
+        started = time.monotonic()
+        monitor._check_servers(list(servers))
+        durations.append(time.monotonic() - started)
+    return _summary(durations)
+
+
+def bench_failover(monitor, fleet, timeout):
+    # Активный сервер падает; замеряем, когда монитор это заметил и когда закончил переключение
+    victim = monitor.active_server
+    outage_at = time.monotonic()
+    fleet.outage(victim)
+    detected = _wait_for(lambda: not _is_online(monitor, victim), timeout)
+    detection = time.monotonic() - outage_at if detected else None
+    switched = _wait_for(
+        lambda: monitor.active_server != victim and monitor.failover.get_state()['state'] == 'settled',
+        timeout
+    )
+    completion = time.monotonic() - outage_at if switched else None
+    fleet.recover(victim)
+    last_switch = monitor.recent_switches[-1] if switched and monitor.recent_switches else {}
+    return {
+        'failed_server': victim,
+        'new_active_server': monitor.active_server,
+        'failure_detection_seconds': detection,
+        'failover_completion_seconds': completion,
+        'start_mode': last_switch.get('start_mode'),
+        'recovery_seconds': last_switch.get('recovery_seconds')
+    }
+
+
+def _warm_standby_ready(monitor, server_key):
+    # Активен server_key, а все боты тёплого резерва прогреты
+    if monitor.active_server != server_key or monitor.failover.get_state()['state'] != 'settled':
+        return False
+    status = monitor.servers_status.get(monitor.warm_server)
+    return status is not None and bool(status.bots) and all(bot.warm for bot in status.bots.values())
+
+
+def bench_upload(upload_jobs, servers, size, timeout, workdir):
+    path = os.path.join(workdir, 'bot1_bench.bin')
+    with open(path, 'wb') as f:
+        f.write(os.urandom(size))
+    started = time.monotonic()
+    job_id = upload_jobs.create_job('bot1_bench.bin', path, file_sha256(path), None, dict(servers))
+    finished = _wait_for(lambda: upload_jobs.get_job(job_id)['status'] != 'running', timeout)
+    elapsed = time.monotonic() - started
+    job = upload_jobs.get_job(job_id)
+    succeeded = sum(1 for result in job['servers'].values() if result['success'])
+    total_bytes = size * succeeded
+    return {
+        'file_bytes': size,
+        'servers': len(servers),
+        'succeeded': succeeded,
+        'finished': finished,
+        'seconds': elapsed,
+        'throughput_mb_s': total_bytes / elapsed / 1e6 if elapsed else None
+    }
+
+
+def bench_status_rps(app, duration, threads, conditional):
+    # Запросы идут через тестовый клиент Flask в нескольких потоках: меряется стоимость обработки, не сеть
+    client = app.test_client()
+    etag = client.get('/api/status').headers.get('ETag')
+    headers = {'If-None-Match': etag} if conditional and etag else {}
+    counts = [0] * threads
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        local_client = app.test_client()
+        while time.monotonic() < deadline:
+            local_client.get('/api/status', headers=headers)
+            counts[index] += 1
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return {'requests': sum(counts), 'seconds': duration, 'rps': sum(counts) / duration, 'threads': threads}
+
+
+def run(args):
+    # Всё, что пишет координатор (журнал, загрузки, состояние), живёт во временном каталоге и удаляется после замера
+    with tempfile.TemporaryDirectory(prefix='coordinator-bench-') as workdir:
+        return _run(args, workdir)
+
+
+def _run(args, workdir):
+    fleet = Fleet(
+        args.agents,
+        root=os.path.join(workdir, 'agents'),
+        faults=lambda index: FaultProfile(args.latency, args.latency_jitter, args.error_rate, seed=index),
+        cold_start=args.cold_start
+    ).start()
+    topology_path = os.path.join(workdir, 'topology.json')
+    with open(topology_path, 'w', encoding='utf-8') as f:
+        json.dump(fleet.topology(), f, ensure_ascii=False)
+
+    # Config читает окружение при импорте, поэтому координатор импортируется только после настройки
+    os.environ.update({
+        'TOPOLOGY_PATH': topology_path,
+        'SHARED_STATE_PATH': os.path.join(workdir, 'state.db'),
+        'SNAPSHOT_PATH': os.path.join(workdir, 'snapshot.json'),
+        'EVENT_JOURNAL_DIR': os.path.join(workdir, 'events'),
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'NOTIFY_TRANSPORT': 'memory',
+        'HEALTH_CHECK_TIMEOUT': str(args.health_timeout),
+        'AGENT_MAX_RETRIES': '0',
+        'PROBE_FAST_INTERVAL': str(args.fast_interval),
+        'MONITORING_INTERVAL': str(args.interval),
+        'FAILOVER_GRACE_PERIOD': str(args.grace_period)
+    })
+    logging.disable(logging.WARNING)
+    import main as coordinator_app
+    from config import Config
+
+    monitor = coordinator_app.monitor
+    results = {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'agents': args.agents,
+            'bots_per_agent': len(fleet.bots),
+            'latency': args.latency,
+            'latency_jitter': args.latency_jitter,
+            'error_rate': args.error_rate,
+            'health_timeout': args.health_timeout,
+            'fast_interval': args.fast_interval,
+            'grace_period': args.grace_period,
+            'cold_start': args.cold_start
+        }
+    }
+    try:
+        results['probe_cycle_seconds'] = bench_probe_cycle(monitor, Config.SERVERS, args.cycles)
+        results['upload'] = bench_upload(coordinator_app.upload_jobs, Config.SERVERS, args.upload_bytes, args.timeout, workdir)
+        results['status_rps'] = bench_status_rps(coordinator_app.app, args.rps_duration, args.rps_threads, False)
+        results['status_rps_not_modified'] = bench_status_rps(coordinator_app.app, args.rps_duration, args.rps_threads, True)
+        # Активный сервер назначается без команд агентам, как при тёплом старте: резервы остаются готовыми
+        monitor.restore_state({}, 'server1', True, [])
+        monitor.start_monitoring()
+        _wait_for(lambda: _is_online(monitor, 'server1'), args.timeout)
+        results['failover'] = bench_failover(monitor, fleet, args.timeout)
+        # Тот же сценарий с тёплым резервом: ждём возврата на server1 и прогрева резерва
+        monitor.warm_standby = True
+        if _wait_for(lambda: _warm_standby_ready(monitor, 'server1'), args.timeout):
+            results['failover_warm'] = bench_failover(monitor, fleet, args.timeout)
+        else:
+            results['failover_warm'] = None
+    finally:
+        monitor.stop_monitoring()
+        fleet.stop()
+        # Журнал дописывается до удаления каталога
+        monitor.journal.close()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Замеры координатора на локальном парке агентов-заглушек (результат в JSON)')
+    parser.add_argument('--agents', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.005, help='секунды задержки ответа агента')
+    parser.add_argument('--latency-jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--cycles', type=int, default=20, help='циклов опроса для замера')
+    parser.add_argument('--health-timeout', type=int, default=2)
+    parser.add_argument('--fast-interval', type=float, default=0.5)
+    parser.add_argument('--interval', type=int, default=2)
+    parser.add_argument('--grace-period', type=float, default=1.0)
+    parser.add_argument('--cold-start', type=float, default=0.5, help='секунды запуска бота с нуля на агенте')
+    parser.add_argument('--upload-bytes', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--rps-duration', type=float, default=3.0)
+    parser.add_argument('--rps-threads', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=60.0, help='предел ожидания каждого сценария')
+    parser.add_argument('--output', help='файл для JSON-результата (по умолчанию stdout)')
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+    else:
+        sys.stdout.write(report + '\n')
@@ -0,0 +1,166 @@
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SwitchGate:
+    """Взаимоисключение переключения активного сервера и операций с ботами.
+
+    Операции с ботами идут параллельно друг с другом; переключение ждёт их завершения и выполняется только одно.
+    Пока переключение идёт или ждёт своей очереди, новые операции не начинаются.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.jobs = 0
+        self.switching = False
+        self.waiting_switches = 0
+
+    @contextmanager
+    def job(self):
+        with self.condition:
+            while self.switching or self.waiting_switches:
+                self.condition.wait()
+            self.jobs += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.jobs -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def switch(self):
+        with self.condition:
+            self.waiting_switches += 1
+            while self.switching or self.jobs:
+                self.condition.wait()
+            self.waiting_switches -= 1
+            self.switching = True
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.switching = False
+                self.condition.notify_all()
+
+    @property
+    def is_switching(self):
+        with self.condition:
+            return self.switching
+
+
+class BotJobQueue:
+    """Очередь операций с ботами: задачи одного ключа (бота) выполняются строго по очереди,
+    одинаковые ещё не начатые задачи склеиваются в одну.
+    """
+
+    def __init__(self, max_workers=None, keep_jobs=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.BOT_JOB_MAX_WORKERS,
+            thread_name_prefix='bot-job'
+        )
+        self.keep_jobs = keep_jobs or Config.BOT_JOBS_KEEP
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.funcs = {}
+        self.queues = {}
+        self.listeners = []
+
+    def submit(self, key, action, func, target=None, coalesce=True, **meta):
+        """Ставит задачу в очередь ключа и сразу возвращает её снимок; дубликат ожидающей задачи не создаётся.
+
+        coalesce=False — задача ставится всегда (её func должна выполниться, например ради обратного вызова).
+        """
+        with self.lock:
+            queue = self.queues.get(key)
+            for job_id in (queue or ()) if coalesce else ():
+                job = self.jobs[job_id]
+                if job['action'] == action and job['target'] == target:
+                    job['coalesced'] += 1
+                    return dict(job)
+            job = dict(
+                meta,
+                id=uuid.uuid4().hex,
+                action=action,
+                target=target,
+                status='queued',
+                created_at=time.time(),
+                started_at=None,
+                finished_at=None,
+                success=None,
+                error=None,
+                coalesced=0
+            )
+            self.jobs[job['id']] = job
+            self.funcs[job['id']] = func
+            while len(self.jobs) > self.keep_jobs:
+                old_id, old_job = next(iter(self.jobs.items()))
+                if old_job['status'] in ('queued', 'running'):
+                    break
+                del self.jobs[old_id]
+            if queue is None:
+                # Первая задача ключа запускает обработчик его очереди; следующие встают за ней
+                self.queues[key] = deque([job['id']])
+                self.executor.submit(self._drain, key)
+            else:
+                queue.append(job['id'])
+            snapshot = dict(job)
+        self._notify(snapshot)
+        return snapshot
+
+    def _drain(self, key):
+        while True:
+            with self.lock:
+                queue = self.queues[key]
+                if not queue:
+                    del self.queues[key]
+                    return
+                job = self.jobs[queue.popleft()]
+                func = self.funcs.pop(job['id'])
+                job['status'] = 'running'
+                job['started_at'] = time.time()
+                snapshot = dict(job)
+            self._notify(snapshot)
+            try:
+                success = bool(func())
+                error = None
+            except Exception as e:
+                logger.error(f"Ошибка задачи {job['action']} для {key}: {e}")
+                success = False
+                error = str(e)
+            with self.lock:
+                job['status'] = 'done' if success else 'failed'
+                job['success'] = success
+                job['error'] = error
+                job['finished_at'] = time.time()
+                snapshot = dict(job)
+            self._notify(snapshot)
+
+    def _notify(self, job):
+        for listener in self.listeners:
+            try:
+                listener(job)
+            except Exception as e:
+                logger.error(f"Ошибка публикации задачи {job['id']}: {e}")
+
+    def get_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_stats(self):
+        with self.lock:
+            statuses = [job['status'] for job in self.jobs.values()]
+            return {
+                'queued': statuses.count('queued'),
+                'running': statuses.count('running'),
+                'busy_keys': len(self.queues)
+            }
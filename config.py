@@ -3,122 +3,128 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _env_bot(prefix, m):
+    bot = {
+        'name': f'Бот {m}',
+        'start_command': os.getenv(f'{prefix}_BOT{m}_COMMAND', f'cd /path/to/bot{m} && python bot{m}.py'),
+        'stop_command': os.getenv(f'{prefix}_BOT{m}_STOP', f'pkill -f bot{m}.py'),
+        'process_name': os.getenv(f'{prefix}_BOT{m}_PROCESS', f'bot{m}.py')
+    }
+    # Команды тёплого резерва необязательны: без них бот на резерве запускается с нуля
+    for field, suffix in (('warm_command', 'WARM'), ('activate_command', 'ACTIVATE')):
+        value = os.getenv(f'{prefix}_BOT{m}_{suffix}')
+        if value:
+            bot[field] = value
+    return bot
+
+def _env_servers(server_count=3, bot_count=4):
+    # Парк по умолчанию из переменных окружения SERVER<N>_URL, SERVER<N>_BOT<M>_COMMAND и т.д.
+    servers = {}
+    for n in range(1, server_count + 1):
+        prefix = f'SERVER{n}'
+        servers[f'server{n}'] = {
+            'id': n,
+            'name': f'Сервер {n}',
+            'url': os.getenv(f'{prefix}_URL', f'http://server{n}:{5000 + n}'),
+            'agent_url': os.getenv(f'{prefix}_AGENT_URL', f'http://server{n}:{5000 + n}'),
+            'is_primary': n == 1,
+            'root_path': os.getenv(f'{prefix}_ROOT', '/home/user/bots'),
+            'bots': {f'bot{m}': _env_bot(prefix, m) for m in range(1, bot_count + 1)}
+        }
+    return servers
+
 class Config:
     # Настройки Flask
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
     DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
     
-    # Настройки серверов с множественными ботами и root_path
-    SERVERS = {
-        'server1': {
-            'id': 1,
-            'name': 'Сервер 1',
-            'url': os.getenv('SERVER1_URL', 'http://server1:5001'),
-            'agent_url': os.getenv('SERVER1_AGENT_URL', 'http://server1:5001'),
-            'is_primary': True,
-            'root_path': os.getenv('SERVER1_ROOT', '/home/user/bots'),
-            'bots': {
-                'bot1': {
-                    'name': 'Бот 1',
-                    'start_command': os.getenv('SERVER1_BOT1_COMMAND', 'cd /path/to/bot1 && python bot1.py'),
-                    'stop_command': os.getenv('SERVER1_BOT1_STOP', 'pkill -f bot1.py'),
-                    'process_name': os.getenv('SERVER1_BOT1_PROCESS', 'bot1.py')
-                },
-                'bot2': {
-                    'name': 'Бот 2',
-                    'start_command': os.getenv('SERVER1_BOT2_COMMAND', 'cd /path/to/bot2 && python bot2.py'),
-                    'stop_command': os.getenv('SERVER1_BOT2_STOP', 'pkill -f bot2.py'),
-                    'process_name': os.getenv('SERVER1_BOT2_PROCESS', 'bot2.py')
-                },
-                'bot3': {
-                    'name': 'Бот 3',
-                    'start_command': os.getenv('SERVER1_BOT3_COMMAND', 'cd /path/to/bot3 && python bot3.py'),
-                    'stop_command': os.getenv('SERVER1_BOT3_STOP', 'pkill -f bot3.py'),
-                    'process_name': os.getenv('SERVER1_BOT3_PROCESS', 'bot3.py')
-                },
-                'bot4': {
-                    'name': 'Бот 4',
-                    'start_command': os.getenv('SERVER1_BOT4_COMMAND', 'cd /path/to/bot4 && python bot4.py'),
-                    'stop_command': os.getenv('SERVER1_BOT4_STOP', 'pkill -f bot4.py'),
-                    'process_name': os.getenv('SERVER1_BOT4_PROCESS', 'bot4.py')
-                }
-            }
-        },
-        'server2': {
-            'id': 2,
-            'name': 'Сервер 2',
-            'url': os.getenv('SERVER2_URL', 'http://server2:5002'),
-            'agent_url': os.getenv('SERVER2_AGENT_URL', 'http://server2:5002'),
-            'is_primary': False,
-            'root_path': os.getenv('SERVER2_ROOT', '/home/user/bots'),
-            'bots': {
-                'bot1': {
-                    'name': 'Бот 1',
-                    'start_command': os.getenv('SERVER2_BOT1_COMMAND', 'cd /path/to/bot1 && python bot1.py'),
-                    'stop_command': os.getenv('SERVER2_BOT1_STOP', 'pkill -f bot1.py'),
-                    'process_name': os.getenv('SERVER2_BOT1_PROCESS', 'bot1.py')
-                },
-                'bot2': {
-                    'name': 'Бот 2',
-                    'start_command': os.getenv('SERVER2_BOT2_COMMAND', 'cd /path/to/bot2 && python bot2.py'),
-                    'stop_command': os.getenv('SERVER2_BOT2_STOP', 'pkill -f bot2.py'),
-                    'process_name': os.getenv('SERVER2_BOT2_PROCESS', 'bot2.py')
-                },
-                'bot3': {
-                    'name': 'Бот 3',
-                    'start_command': os.getenv('SERVER2_BOT3_COMMAND', 'cd /path/to/bot3 && python bot3.py'),
-                    'stop_command': os.getenv('SERVER2_BOT3_STOP', 'pkill -f bot3.py'),
-                    'process_name': os.getenv('SERVER2_BOT3_PROCESS', 'bot3.py')
-                },
-                'bot4': {
-                    'name': 'Бот 4',
-                    'start_command': os.getenv('SERVER2_BOT4_COMMAND', 'cd /path/to/bot4 && python bot4.py'),
-                    'stop_command': os.getenv('SERVER2_BOT4_STOP', 'pkill -f bot4.py'),
-                    'process_name': os.getenv('SERVER2_BOT4_PROCESS', 'bot4.py')
-                }
-            }
-        },
-        'server3': {
-            'id': 3,
-            'name': 'Сервер 3',
-            'url': os.getenv('SERVER3_URL', 'http://server3:5003'),
-            'agent_url': os.getenv('SERVER3_AGENT_URL', 'http://server3:5003'),
-            'is_primary': False,
-            'root_path': os.getenv('SERVER3_ROOT', '/home/user/bots'),
-            'bots': {
-                'bot1': {
-                    'name': 'Бот 1',
-                    'start_command': os.getenv('SERVER3_BOT1_COMMAND', 'cd /path/to/bot1 && python bot1.py'),
-                    'stop_command': os.getenv('SERVER3_BOT1_STOP', 'pkill -f bot1.py'),
-                    'process_name': os.getenv('SERVER3_BOT1_PROCESS', 'bot1.py')
-                },
-                'bot2': {
-                    'name': 'Бот 2',
-                    'start_command': os.getenv('SERVER3_BOT2_COMMAND', 'cd /path/to/bot2 && python bot2.py'),
-                    'stop_command': os.getenv('SERVER3_BOT2_STOP', 'pkill -f bot2.py'),
-                    'process_name': os.getenv('SERVER3_BOT2_PROCESS', 'bot2.py')
-                },
-                'bot3': {
-                    'name': 'Бот 3',
-                    'start_command': os.getenv('SERVER3_BOT3_COMMAND', 'cd /path/to/bot3 && python bot3.py'),
-                    'stop_command': os.getenv('SERVER3_BOT3_STOP', 'pkill -f bot3.py'),
-                    'process_name': os.getenv('SERVER3_BOT3_PROCESS', 'bot3.py')
-                },
-                'bot4': {
-                    'name': 'Бот 4',
-                    'start_command': os.getenv('SERVER3_BOT4_COMMAND', 'cd /path/to/bot4 && python bot4.py'),
-                    'stop_command': os.getenv('SERVER3_BOT4_STOP', 'pkill -f bot4.py'),
-                    'process_name': os.getenv('SERVER3_BOT4_PROCESS', 'bot4.py')
-                }
-            }
-        }
-    }
+    # Топология парка: серверы и боты читаются из TOPOLOGY_PATH и перечитываются на лету (см. topology.py).
+    # Без файла используется парк из переменных SERVER<N>_*; формат — в topology_example.json.
+    # Порядок переключения: необязательные 'priority' (меньше — важнее) и 'weight' (больше — важнее при равном приоритете);
+    # без priority основной сервер идёт первым, остальные — по id. В режиме active_active необязательный 'capacity' —
+    # предел числа ботов на сервере (без него ёмкость равна числу ботов сервера)
+    SERVERS = _env_servers()
+    TOPOLOGY_PATH = os.getenv('TOPOLOGY_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'topology.json'))
+    TOPOLOGY_POLL_INTERVAL = float(os.getenv('TOPOLOGY_POLL_INTERVAL', 5))  # секунды между проверками файла
     
     # Настройки мониторинга
     MONITORING_INTERVAL = int(os.getenv('MONITORING_INTERVAL', 30))  # секунды
     HEALTH_CHECK_TIMEOUT = int(os.getenv('HEALTH_CHECK_TIMEOUT', 10))  # секунды
+    PROBE_MAX_WORKERS = int(os.getenv('PROBE_MAX_WORKERS', 32))  # параллельных проверок
+    PROBE_CYCLE_DEADLINE = float(os.getenv('PROBE_CYCLE_DEADLINE', HEALTH_CHECK_TIMEOUT + 2))  # секунды на весь цикл
+    PROBE_FAST_INTERVAL = float(os.getenv('PROBE_FAST_INTERVAL', 10))  # секунды для активного и подозрительных серверов
+    PROBE_CIRCUIT_THRESHOLD = int(os.getenv('PROBE_CIRCUIT_THRESHOLD', 3))  # неудачных проверок подряд до размыкания цепи
+    PROBE_MAX_BACKOFF = float(os.getenv('PROBE_MAX_BACKOFF', 600))  # секунды, предел задержки при разомкнутой цепи
+    PROBE_OPEN_TIMEOUT = float(os.getenv('PROBE_OPEN_TIMEOUT', 3))  # секунды на пробу при разомкнутой цепи
+    PROBE_JITTER = float(os.getenv('PROBE_JITTER', 0.1))  # доля интервала для случайного смещения
+    HEARTBEAT_TIMEOUT = float(os.getenv('HEARTBEAT_TIMEOUT', 6))  # секунды без heartbeat до перехода на опрос
+    HEARTBEAT_MISSES = int(os.getenv('HEARTBEAT_MISSES', 3))  # пропусков, если агент сообщил свой interval
+    HEARTBEAT_POLL_INTERVAL = float(os.getenv('HEARTBEAT_POLL_INTERVAL', 300))  # секунды между сверочными опросами
+    HEARTBEAT_TOKEN = os.getenv('HEARTBEAT_TOKEN', '')  # общий токен агентов (заголовок X-Agent-Token)
+    FAILOVER_GRACE_PERIOD = float(os.getenv('FAILOVER_GRACE_PERIOD', 60))  # секунды до переключения
+    CONTROL_MAX_WORKERS = int(os.getenv('CONTROL_MAX_WORKERS', 16))  # параллельных команд серверам
+    BOT_JOB_MAX_WORKERS = int(os.getenv('BOT_JOB_MAX_WORKERS', 16))  # ботов, обслуживаемых одновременно
+    BOT_JOBS_KEEP = int(os.getenv('BOT_JOBS_KEEP', 500))  # задач в памяти
+    BOT_RESTART_DELAY = float(os.getenv('BOT_RESTART_DELAY', 2))  # секунды между stop и start при перезапуске
+    BOT_RESTART_MAX_CONCURRENT = int(os.getenv('BOT_RESTART_MAX_CONCURRENT', 8))  # автоперезапусков одновременно
+    BOT_RESTART_BACKOFF_BASE = float(os.getenv('BOT_RESTART_BACKOFF_BASE', 5))  # секунды до повтора, удваиваются с каждым отказом
+    BOT_RESTART_BACKOFF_MAX = float(os.getenv('BOT_RESTART_BACKOFF_MAX', 600))  # секунды, предел задержки
+    BOT_RESTART_STABLE_SECONDS = float(os.getenv('BOT_RESTART_STABLE_SECONDS', 60))  # работа дольше — отказ не считается быстрым
+    BOT_CRASH_LOOP_THRESHOLD = int(os.getenv('BOT_CRASH_LOOP_THRESHOLD', 5))  # быстрых отказов подряд до crash-loop
+    STATUS_KEEP_DETAILS = os.getenv('STATUS_KEEP_DETAILS', 'false').lower() == 'true'  # хранить сырой ответ /health
+    PLACEMENT_MODE = os.getenv('PLACEMENT_MODE', 'active_standby')  # active_standby или active_active
+    # Тёплый резерв (только active_standby): боты с warm_command/activate_command заранее подняты в режиме ожидания
+    # на следующем по приоритету сервере, при переключении их остаётся только активировать
+    WARM_STANDBY = os.getenv('WARM_STANDBY', 'false').lower() == 'true'
+    RECOVERY_SAMPLES = int(os.getenv('RECOVERY_SAMPLES', 50))  # последних переключений в статистике восстановления
+    FAILOVER_TRACES_KEEP = int(os.getenv('FAILOVER_TRACES_KEEP', 100))  # хронологий переключений для /api/failovers
+    PLACEMENT_LOAD_WEIGHT = float(os.getenv('PLACEMENT_LOAD_WEIGHT', 1.0))  # вес нагрузки агента против заполненности
+    
+    # Настройки истории проб (ёмкость кольцевых буферов на сервер и бота)
+    HISTORY_RAW_POINTS = int(os.getenv('HISTORY_RAW_POINTS', 720))  # последних проб
+    HISTORY_MINUTE_POINTS = int(os.getenv('HISTORY_MINUTE_POINTS', 1440))  # минут (сутки)
+    HISTORY_HOUR_POINTS = int(os.getenv('HISTORY_HOUR_POINTS', 720))  # часов (30 дней)
+    
+    # Настройки HTTP-клиента агентов
+    AGENT_POOL_MAXSIZE = int(os.getenv('AGENT_POOL_MAXSIZE', 4))  # соединений на агент
+    AGENT_MAX_RETRIES = int(os.getenv('AGENT_MAX_RETRIES', 2))
+    AGENT_RETRY_BACKOFF = float(os.getenv('AGENT_RETRY_BACKOFF', 0.3))  # секунды
+    AGENT_CONNECT_TIMEOUT = float(os.getenv('AGENT_CONNECT_TIMEOUT', 3))  # секунды
+    
+    # Настройки рассылки файлов
+    UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
+    UPLOAD_TIMEOUT = int(os.getenv('UPLOAD_TIMEOUT', 30))  # секунды
+    UPLOAD_MAX_WORKERS = int(os.getenv('UPLOAD_MAX_WORKERS', 16))  # параллельных отправок
+    UPLOAD_JOBS_KEEP = int(os.getenv('UPLOAD_JOBS_KEEP', 100))  # задач в памяти
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024))  # байт во фрагменте
+    UPLOAD_CHUNK_RETRIES = int(os.getenv('UPLOAD_CHUNK_RETRIES', 5))  # отказов подряд до ошибки рассылки на сервер
+    UPLOAD_RETRY_BACKOFF = float(os.getenv('UPLOAD_RETRY_BACKOFF', 1))  # секунды, удваиваются с каждым отказом подряд
+    UPLOAD_GC_MIN_AGE = float(os.getenv('UPLOAD_GC_MIN_AGE', 3600))  # секунды, затем объект без имени удаляется
+    
+    # Снимки состояния для тёплого рестарта
+    SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'coordinator_snapshot.json'))
+    SNAPSHOT_FLUSH_INTERVAL = float(os.getenv('SNAPSHOT_FLUSH_INTERVAL', 5))  # секунды между записями
+    SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', 600))  # секунды, старше — статусы серверов не восстанавливаются
+    SWITCH_HISTORY_SIZE = int(os.getenv('SWITCH_HISTORY_SIZE', 20))  # последних переключений
+    
+    # Общее состояние воркеров gunicorn (SQLite): выборы ведущего и статус
+    SHARED_STATE_PATH = os.getenv('SHARED_STATE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'coordinator_state.db'))
+    LEADER_LEASE_TTL = float(os.getenv('LEADER_LEASE_TTL', 15))  # секунды
+    SHARED_STATE_POLL_INTERVAL = float(os.getenv('SHARED_STATE_POLL_INTERVAL', 0.5))  # секунды
+    SHARED_COMMAND_TIMEOUT = float(os.getenv('SHARED_COMMAND_TIMEOUT', 60))  # секунды ожидания ответа ведущего
+    METRICS_SHARE_INTERVAL = float(os.getenv('METRICS_SHARE_INTERVAL', 5))  # секунды между выгрузками метрик воркера
+    
+    # Журнал событий (/api/events); пустой EVENT_JOURNAL_DIR отключает журнал
+    EVENT_JOURNAL_DIR = os.getenv('EVENT_JOURNAL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'events'))
+    EVENT_SEGMENT_BYTES = int(os.getenv('EVENT_SEGMENT_BYTES', 16 * 1024 * 1024))  # байт, затем новый сегмент
+    EVENT_SEGMENT_SECONDS = float(os.getenv('EVENT_SEGMENT_SECONDS', 6 * 3600))  # секунды, затем новый сегмент
+    EVENT_FLUSH_INTERVAL = float(os.getenv('EVENT_FLUSH_INTERVAL', 1))  # секунды накопления пачки
+    EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', 10000))  # событий в очереди, лишние отбрасываются
+    EVENT_RETENTION_DAYS = float(os.getenv('EVENT_RETENTION_DAYS', 30))  # 0 — хранить всё
     
     # Настройки веб-интерфейса
+    STATUS_STREAM_KEEPALIVE = int(os.getenv('STATUS_STREAM_KEEPALIVE', 15))  # секунды
+    STATUS_STREAM_MAX_DURATION = int(os.getenv('STATUS_STREAM_MAX_DURATION', 300))  # секунды, затем клиент переподключается
     WEB_PORT = int(os.getenv('WEB_PORT', 5000))
     WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
     
@@ -128,4 +134,11 @@ class Config:
 
     # Telegram уведомления
     TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
-    TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID', '') 
\ No newline at end of file
+    TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID', '')
+    NOTIFY_TRANSPORT = os.getenv('NOTIFY_TRANSPORT', 'telegram')  # telegram или memory (локальный приёмник)
+    NOTIFY_QUEUE_SIZE = int(os.getenv('NOTIFY_QUEUE_SIZE', 100))  # сообщений в очереди
+    NOTIFY_COALESCE_WINDOW = float(os.getenv('NOTIFY_COALESCE_WINDOW', 10))  # секунды склейки всплеска
+    NOTIFY_MIN_INTERVAL = float(os.getenv('NOTIFY_MIN_INTERVAL', 3))  # секунды между сообщениями
+    NOTIFY_MAX_RETRIES = int(os.getenv('NOTIFY_MAX_RETRIES', 3))
+    NOTIFY_RETRY_BACKOFF = float(os.getenv('NOTIFY_RETRY_BACKOFF', 2))  # секунды, удваивается с каждой попыткой
+    NOTIFY_TIMEOUT = float(os.getenv('NOTIFY_TIMEOUT', 10))  # секунды на запрос к Telegram 
\ No newline at end of file
@@ -0,0 +1,316 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = 'events-'
+SEGMENT_SUFFIX = '.jsonl'
+INDEX_SUFFIX = '.idx.json'
+CLOSE_TIMEOUT = 5  # секунды на дозапись очереди при закрытии журнала
+_STOP = object()
+
+
+class _Segment:
+    __slots__ = ('path', 'index_path', 'file', 'opened_at', 'size', 'count', 'first_ts', 'last_ts', 'servers', 'bots', 'types')
+
+    def __init__(self, directory, number):
+        # pid в имени: воркеры gunicorn пишут каждый в свои сегменты и не мешают друг другу
+        self.opened_at = time.time()
+        name = f'{SEGMENT_PREFIX}{int(self.opened_at * 1000)}-{os.getpid()}-{number}'
+        self.path = os.path.join(directory, name + SEGMENT_SUFFIX)
+        self.index_path = os.path.join(directory, name + INDEX_SUFFIX)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.size = 0
+        self.count = 0
+        self.first_ts = None
+        self.last_ts = None
+        self.servers = set()
+        self.bots = set()
+        self.types = set()
+
+    def index(self, closed):
+        return {
+            'segment': os.path.basename(self.path),
+            'first_ts': self.first_ts,
+            'last_ts': self.last_ts,
+            'count': self.count,
+            'bytes': self.size,
+            'servers': sorted(self.servers),
+            'bots': sorted(self.bots),
+            'types': sorted(self.types),
+            'closed': closed
+        }
+
+
+class EventJournal:
+    """Журнал событий координатора в JSONL-сегментах с ротацией по размеру и возрасту.
+
+    record() только ставит событие в очередь: запись идёт пачками в фоновом потоке. Рядом с каждым сегментом лежит
+    маленький индекс (время, серверы, боты, типы), по нему query() читает только подходящие сегменты.
+    """
+
+    def __init__(self, directory=None, segment_bytes=None, segment_seconds=None, flush_interval=None,
+                 queue_size=None, retention_days=None):
+        self.directory = Config.EVENT_JOURNAL_DIR if directory is None else directory
+        self.segment_bytes = segment_bytes or Config.EVENT_SEGMENT_BYTES
+        self.segment_seconds = segment_seconds or Config.EVENT_SEGMENT_SECONDS
+        self.flush_interval = flush_interval or Config.EVENT_FLUSH_INTERVAL
+        self.retention_days = Config.EVENT_RETENTION_DAYS if retention_days is None else retention_days
+        self.queue = queue.Queue(maxsize=queue_size or Config.EVENT_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.closed = False
+        self.segment = None
+        self.index_cache = {}
+        self.stats = {'written': 0, 'dropped': 0, 'segments': 0}
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def record(self, event_type, server=None, bot=None, **data):
+        if not self.enabled or self.closed:
+            return
+        event = {'ts': time.time(), 'type': event_type}
+        if server is not None:
+            event['server'] = server
+        if bot is not None:
+            event['bot'] = bot
+        event.update(data)
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Журнал не должен тормозить монитор и запросы: при переполнении событие теряется
+            with self.lock:
+                self.stats['dropped'] += 1
+
+    def _ensure_worker(self):
+        # Поток запускается лениво: при предзагрузке gunicorn он должен появиться уже в воркере
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._worker, name='event-journal', daemon=True)
+                self.thread.start()
+
+    def _worker(self):
+        while True:
+            batch = []
+            stop = False
+            event = self.queue.get()
+            # Копим пачку не дольше flush_interval: одна запись и flush на много событий
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if event is _STOP:
+                    stop = True
+                    break
+                batch.append(event)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    self._write(batch)
+                if stop:
+                    self._close_segment()
+            except (OSError, ValueError) as e:
+                logger.error(f"Ошибка записи журнала событий: {e}")
+            if stop:
+                return
+
+    def close(self):
+        """Дописывает события из очереди и закрывает текущий сегмент; вызывается при завершении процесса"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            thread = self.thread
+        if thread is None or not thread.is_alive():
+            self._close_segment()
+            return
+        try:
+            self.queue.put(_STOP, timeout=CLOSE_TIMEOUT)
+        except queue.Full:
+            logger.error("Журнал событий не закрыт: очередь не разобрана")
+            return
+        thread.join(CLOSE_TIMEOUT)
+
+    def _write(self, batch):
+        segment = self._current_segment()
+        lines = []
+        pending = 0
+        for event in batch:
+            line = json.dumps(event, ensure_ascii=False, default=str) + '\n'
+            lines.append(line)
+            pending += len(line.encode('utf-8'))
+            if segment.first_ts is None:
+                segment.first_ts = event['ts']
+            segment.last_ts = event['ts']
+            segment.count += 1
+            segment.types.add(event['type'])
+            if 'server' in event:
+                segment.servers.add(event['server'])
+            if 'bot' in event:
+                segment.bots.add(event['bot'])
+            # Большая пачка тоже делится по EVENT_SEGMENT_BYTES, чтобы индекс оставался точным
+            if segment.size + pending >= self.segment_bytes:
+                self._append(segment, lines, pending)
+                lines, pending = [], 0
+                segment = self._current_segment()
+        if lines:
+            self._append(segment, lines, pending)
+        with self.lock:
+            self.stats['written'] += len(batch)
+
+    def _current_segment(self):
+        segment = self.segment
+        if segment is not None and (segment.size >= self.segment_bytes
+                                    or time.time() - segment.opened_at >= self.segment_seconds):
+            self._rotate()
+            segment = None
+        if segment is None:
+            with self.lock:
+                self.stats['segments'] += 1
+                number = self.stats['segments']
+            segment = self.segment = _Segment(self.directory, number)
+        return segment
+
+    def _append(self, segment, lines, size):
+        segment.file.write(''.join(lines))
+        segment.file.flush()
+        segment.size += size
+        self._write_index(segment, closed=False)
+
+    def _write_index(self, segment, closed):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.index-')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(segment.index(closed), f, ensure_ascii=False)
+        os.replace(tmp_path, segment.index_path)
+
+    def _rotate(self):
+        self._close_segment()
+        self._expire()
+
+    def _close_segment(self):
+        segment, self.segment = self.segment, None
+        if segment is None:
+            return
+        segment.file.close()
+        self._write_index(segment, closed=True)
+
+    def _expire(self):
+        if not self.retention_days:
+            return
+        cutoff = time.time() - self.retention_days * 86400
+        # Незакрытые сегменты тоже удаляются по времени: процесс, писавший их, мог завершиться аварийно
+        for index in self._indexes():
+            if index['last_ts'] is not None and index['last_ts'] < cutoff:
+                self._remove_segment(os.path.join(self.directory, index['segment']))
+        # Сегменты без индекса остаются от процессов, завершившихся до первой записи
+        names = set(os.listdir(self.directory))
+        for name in names:
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            if name[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX in names:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    self._remove_segment(path)
+            except OSError:
+                continue
+
+    def _remove_segment(self, path):
+        index_path = path[:-len(SEGMENT_SUFFIX)] + INDEX_SUFFIX
+        # Текущий сегмент этого процесса ещё открыт на запись
+        if self.segment is not None and self.segment.path == path:
+            return
+        for stale in (path, index_path):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+        self.index_cache.pop(index_path, None)
+
+    def _indexes(self):
+        # Индексы закрытых сегментов не меняются, их разбор кэшируется по mtime
+        indexes = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(INDEX_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+                cached = self.index_cache.get(path)
+                if cached is None or cached[0] != mtime:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        cached = (mtime, json.load(f))
+                    self.index_cache[path] = cached
+            except (OSError, ValueError):
+                continue
+            indexes.append(cached[1])
+        return indexes
+
+    def query(self, since=None, until=None, server=None, bot=None, event_type=None, limit=100):
+        """События по фильтрам, новые первыми; читаются только сегменты, чей индекс подходит под фильтр"""
+        if not self.enabled:
+            return {'events': [], 'segments_total': 0, 'segments_read': 0}
+        indexes = self._indexes()
+        selected = [
+            index for index in indexes
+            if index['last_ts'] is not None
+            and (since is None or index['last_ts'] >= since)
+            and (until is None or index['first_ts'] <= until)
+            and (server is None or server in index['servers'])
+            and (bot is None or bot in index['bots'])
+            and (event_type is None or event_type in index['types'])
+        ]
+        selected.sort(key=lambda index: index['last_ts'], reverse=True)
+        events = []
+        segments_read = 0
+        for index in selected:
+            if len(events) >= limit and events[-1]['ts'] > index['last_ts']:
+                break
+            segments_read += 1
+            for event in self._read_segment(os.path.join(self.directory, index['segment'])):
+                if since is not None and event['ts'] < since:
+                    continue
+                if until is not None and event['ts'] > until:
+                    continue
+                if server is not None and event.get('server') != server:
+                    continue
+                if bot is not None and event.get('bot') != bot:
+                    continue
+                if event_type is not None and event['type'] != event_type:
+                    continue
+                events.append(event)
+            events.sort(key=lambda event: event['ts'], reverse=True)
+            del events[limit:]
+        return {'events': events, 'segments_total': len(indexes), 'segments_read': segments_read}
+
+    def _read_segment(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # Последняя строка открытого сегмента может быть дописана не до конца
+                        continue
+        except FileNotFoundError:
+            return
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, queued=self.queue.qsize(), enabled=self.enabled)
@@ -0,0 +1,172 @@
+import threading
+import time
+import logging
+from config import Config
+from tracing import FailoverTrace
+
+logger = logging.getLogger(__name__)
+
+SETTLED = 'settled'
+PENDING_SWITCH = 'pending_switch'
+SWITCHING = 'switching'
+
+
+class FailoverController:
+    """Машина состояний переключения: settled -> pending_switch -> switching -> settled.
+
+    Льготный период отсчитывает таймер, цикл мониторинга при этом не блокируется.
+    Каждый инцидент ведёт хронологию FailoverTrace; switch_callback получает её вторым аргументом.
+    При перенацеливании инцидент и его трасса сохраняются: каждый отсчитанный льготный период остаётся в ней интервалом.
+    status_callback вызывается после каждого перехода состояния (вне lock).
+    """
+
+    def __init__(self, switch_callback, resolve_callback, notify_callback, grace_period=None, status_callback=None):
+        self.switch_callback = switch_callback
+        self.resolve_callback = resolve_callback
+        self.notify_callback = notify_callback
+        self.status_callback = status_callback
+        self.grace_period = Config.FAILOVER_GRACE_PERIOD if grace_period is None else grace_period
+        self.lock = threading.Lock()
+        self.state = SETTLED
+        self.target = None
+        self.detected_at = None
+        self.deadline = None
+        self.scheduled_at = None
+        self.timer = None
+        self.generation = 0
+        self.last_switch = None
+        self.trace = None
+
+    def update(self, target, message=None):
+        with self.lock:
+            if self.state == SWITCHING:
+                return
+            if target is None:
+                if self.state != PENDING_SWITCH:
+                    return
+                logger.info(f"Отложенное переключение на {self.target} отменено: статус изменился")
+                self._reset()
+                trace = None
+            else:
+                if self.state == PENDING_SWITCH and self.target == target:
+                    return
+                if self.state == PENDING_SWITCH:
+                    logger.info(f"Отложенное переключение перенацелено: {self.target} -> {target}")
+                self._schedule(target)
+                trace = self.trace
+        self._status_changed()
+        if trace is not None:
+            self._notify(trace, message)
+
+    def _notify(self, trace, message):
+        if message:
+            span = trace.start_span('notify')
+            self.notify_callback(message)
+            span.finish(True)
+
+    def _status_changed(self):
+        if self.status_callback is not None:
+            self.status_callback()
+
+    def _schedule(self, target):
+        if self.timer:
+            self.timer.cancel()
+        now = time.time()
+        if self.state == PENDING_SWITCH and self.trace is not None:
+            # Отсчитанный льготный период прежней цели остаётся в трассе: время обнаружения не теряется
+            self.trace.start_span('grace', server=self.target, start=self.scheduled_at).finish(
+                False, end=now, grace_period=self.grace_period, retargeted_to=target
+            )
+        self.generation += 1
+        self.state = PENDING_SWITCH
+        self.target = target
+        if self.detected_at is None:
+            self.detected_at = now
+            self.trace = FailoverTrace('auto')
+        self.scheduled_at = now
+        self.deadline = now + self.grace_period
+        self.timer = threading.Timer(self.grace_period, self._fire, args=(self.generation,))
+        self.timer.daemon = True
+        self.timer.start()
+        logger.info(f"Переключение на {target} запланировано через {self.grace_period} с")
+
+    def _reset(self):
+        if self.timer:
+            self.timer.cancel()
+        self.timer = None
+        self.state = SETTLED
+        self.target = None
+        self.detected_at = None
+        self.deadline = None
+        self.scheduled_at = None
+        self.trace = None
+
+    def _fire(self, generation):
+        with self.lock:
+            if self.state != PENDING_SWITCH or generation != self.generation:
+                return
+            target = self.target
+        # Перепроверяем по свежему статусу: за льготный период картина могла измениться
+        current_target, message = self.resolve_callback()
+        with self.lock:
+            if generation != self.generation:
+                return
+            if current_target != target:
+                if current_target is None:
+                    logger.info(f"Переключение на {target} отменено при срабатывании таймера")
+                    self._reset()
+                    trace = None
+                else:
+                    logger.info(f"Переключение перенацелено при срабатывании таймера: {target} -> {current_target}")
+                    self._schedule(current_target)
+                    trace = self.trace
+            else:
+                self.state = SWITCHING
+                detected_at = self.detected_at
+                scheduled_at = self.scheduled_at
+                trace = self.trace
+        if current_target != target:
+            self._status_changed()
+            if trace is not None:
+                self._notify(trace, message)
+            return
+        self._status_changed()
+        started = time.time()
+        # Последний льготный период вместе с перепроверкой статуса перед переключением
+        trace.start_span('grace', server=target, start=scheduled_at).finish(True, end=started, grace_period=self.grace_period)
+        trace.target = target
+        try:
+            self.switch_callback(target, trace)
+        finally:
+            finished = time.time()
+            with self.lock:
+                self.last_switch = {
+                    'target': target,
+                    'detected_at': detected_at,
+                    'completed_at': finished,
+                    'detection_to_switch': finished - detected_at,
+                    'switch_duration': finished - started,
+                    'grace_period': self.grace_period,
+                    'trace_id': trace.trace_id
+                }
+                self._reset()
+            self._status_changed()
+            logger.info(f"Переключение на {target} завершено через {finished - detected_at:.1f} с после обнаружения")
+
+    def cancel(self):
+        with self.lock:
+            if self.state != PENDING_SWITCH:
+                return
+            self._reset()
+        self._status_changed()
+
+    def get_state(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'target': self.target,
+                'detected_at': self.detected_at,
+                'switch_deadline': self.deadline,
+                'grace_period': self.grace_period,
+                'last_switch': self.last_switch
+            }
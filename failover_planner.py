@@ -0,0 +1,65 @@
+import bisect
+import threading
+
+
+def server_rank(server_key, server_config):
+    # Меньший приоритет — предпочтительнее; без явного priority основной сервер идёт первым, остальные по id
+    priority = server_config.get('priority')
+    if priority is None:
+        priority = 0 if server_config.get('is_primary') else server_config['id']
+    return (priority, -server_config.get('weight', 1), server_key)
+
+
+def is_eligible(status):
+    return status.is_ready
+
+
+class FailoverPlanner:
+    """Упорядоченный индекс здоровых серверов по приоритету; обновляется инкрементально по статусам"""
+
+    def __init__(self, servers):
+        self.lock = threading.Lock()
+        self.rebuild(servers)
+
+    def rebuild(self, servers, servers_status=None):
+        with self.lock:
+            self.ranks = {key: server_rank(key, cfg) for key, cfg in servers.items()}
+            self.order = [rank[2] for rank in sorted(self.ranks.values())]
+            self.top_key = min(self.ranks.values())[2] if self.ranks else None
+            self.healthy = []
+            for key, status in (servers_status or {}).items():
+                if key in self.ranks and is_eligible(status):
+                    bisect.insort(self.healthy, self.ranks[key])
+
+    def update(self, server_key, status):
+        rank = self.ranks.get(server_key)
+        if rank is None:
+            return
+        eligible = is_eligible(status)
+        with self.lock:
+            index = bisect.bisect_left(self.healthy, rank)
+            present = index < len(self.healthy) and self.healthy[index] == rank
+            if eligible and not present:
+                self.healthy.insert(index, rank)
+            elif not eligible and present:
+                del self.healthy[index]
+
+    def best(self):
+        with self.lock:
+            return self.healthy[0][2] if self.healthy else None
+
+    def priority_of(self, server_key):
+        rank = self.ranks.get(server_key)
+        return rank[0] if rank else None
+
+    def ordered(self):
+        with self.lock:
+            return list(self.order)
+
+    def get_plan(self):
+        with self.lock:
+            return {
+                'order': list(self.order),
+                'healthy': [rank[2] for rank in self.healthy],
+                'best': self.healthy[0][2] if self.healthy else None
+            }
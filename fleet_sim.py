@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from werkzeug.serving import make_server
+from stub_agent import FaultProfile, create_app, start_heartbeat
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedAgent:
+    """Агент-заглушка в своём потоке; авария — остановка сервера, порт при этом сохраняется"""
+
+    def __init__(self, index, root, bots, faults=None, host='127.0.0.1', heartbeat=None, cold_start=0.0):
+        self.index = index
+        self.host = host
+        self.port = 0
+        self.app = create_app(root, bots, faults, cold_start)
+        self.faults = faults
+        self.heartbeat = heartbeat
+        self.heartbeat_stop = None
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    @property
+    def is_up(self):
+        return self.server is not None
+
+    def start(self):
+        if self.server is not None:
+            return
+        self.server = make_server(self.host, self.port, self.app, threaded=True)
+        self.port = self.server.port
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f'agent-{self.index}', daemon=True)
+        self.thread.start()
+        if self.heartbeat:
+            # heartbeat = (URL координатора, период); при аварии агент замолкает вместе с сервером
+            coordinator_url, interval = self.heartbeat
+            self.heartbeat_stop = start_heartbeat(self.app, coordinator_url, f'server{self.index}', interval)
+
+    def stop(self):
+        if self.heartbeat_stop is not None:
+            self.heartbeat_stop.set()
+            self.heartbeat_stop = None
+        server, self.server = self.server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+
+class Fleet:
+    """Парк из N агентов-заглушек с управляемыми сбоями и сценариями аварий"""
+
+    def __init__(self, size, root=None, bots=('bot1', 'bot2', 'bot3', 'bot4'), faults=None, heartbeat=None, cold_start=0.0):
+        self.root = root or tempfile.mkdtemp(prefix='fleet-')
+        self.bots = tuple(bots)
+        self.agents = []
+        self.timers = []
+        for index in range(1, size + 1):
+            # faults — общий профиль или функция index -> профиль
+            profile = faults(index) if callable(faults) else faults
+            agent_root = os.path.join(self.root, f'server{index}')
+            self.agents.append(SimulatedAgent(index, agent_root, self.bots, profile, heartbeat=heartbeat, cold_start=cold_start))
+
+    def start(self):
+        for agent in self.agents:
+            agent.start()
+        return self
+
+    def stop(self):
+        for timer in self.timers:
+            timer.cancel()
+        for agent in self.agents:
+            agent.stop()
+
+    def agent(self, server_key):
+        return self.agents[int(server_key[len('server'):]) - 1]
+
+    def outage(self, server_key):
+        logger.info(f"Авария агента {server_key}")
+        self.agent(server_key).stop()
+
+    def recover(self, server_key):
+        logger.info(f"Восстановление агента {server_key}")
+        self.agent(server_key).start()
+
+    def schedule_outage(self, server_key, after, duration=None):
+        """Сценарий аварии: агент падает через after секунд и, если задан duration, поднимается обратно"""
+        timer = threading.Timer(after, self.outage, args=(server_key,))
+        timer.daemon = True
+        self.timers.append(timer)
+        timer.start()
+        if duration is not None:
+            timer = threading.Timer(after + duration, self.recover, args=(server_key,))
+            timer.daemon = True
+            self.timers.append(timer)
+            timer.start()
+
+    def topology(self):
+        """Описание парка в формате файла топологии (TOPOLOGY_PATH)"""
+        return {
+            'root_path': '/bots',
+            'bots': {
+                bot_key: {
+                    'name': bot_key,
+                    'start_command': f'start {bot_key}',
+                    'stop_command': f'stop {bot_key}',
+                    'warm_command': f'warm {bot_key}',
+                    'activate_command': f'activate {bot_key}',
+                    'process_name': f'{bot_key}.py'
+                }
+                for bot_key in self.bots
+            },
+            'servers': {
+                f'server{agent.index}': {
+                    'id': agent.index,
+                    'name': f'Сервер {agent.index}',
+                    'agent_url': agent.url,
+                    'is_primary': agent.index == 1
+                }
+                for agent in self.agents
+            }
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Локальный парк агентов-заглушек для нагрузочных проверок координатора')
+    parser.add_argument('--agents', type=int, default=10)
+    parser.add_argument('--bots', default='bot1,bot2,bot3,bot4')
+    parser.add_argument('--latency', type=float, default=0.0, help='секунды задержки каждого ответа')
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='доля зависающих запросов')
+    parser.add_argument('--hang-seconds', type=float, default=30.0)
+    parser.add_argument('--cold-start', type=float, default=0.0, help='секунды запуска бота с нуля')
+    parser.add_argument('--outage', action='append', default=[], metavar='SERVER:AFTER[:DURATION]',
+                        help='сценарий аварии, например server1:30:60')
+    parser.add_argument('--topology', default='fleet_topology.json', help='куда записать файл топологии парка')
+    parser.add_argument('--coordinator', help='URL координатора: агенты будут слать ему heartbeat')
+    parser.add_argument('--heartbeat-interval', type=float, default=2.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    fleet = Fleet(
+        args.agents,
+        bots=args.bots.split(','),
+        faults=lambda index: FaultProfile(args.latency, args.latency_jitter, args.error_rate,
+                                          args.hang_rate, args.hang_seconds, seed=index),
+        heartbeat=(args.coordinator, args.heartbeat_interval) if args.coordinator else None,
+        cold_start=args.cold_start
+    ).start()
+    for spec in args.outage:
+        parts = spec.split(':')
+        fleet.schedule_outage(parts[0], float(parts[1]), float(parts[2]) if len(parts) > 2 else None)
+    with open(args.topology, 'w', encoding='utf-8') as f:
+        json.dump(fleet.topology(), f, ensure_ascii=False, indent=2)
+    logger.info(f"Запущено {args.agents} агентов, топология: {args.topology} (укажите её в TOPOLOGY_PATH)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fleet.stop()
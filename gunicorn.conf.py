@@ -0,0 +1,11 @@
+# Каждый воркер после старта участвует в выборах ведущего; мониторинг запускает только победитель
+
+
+def post_worker_init(worker):
+    from main import coordinator
+    coordinator.start()
+
+
+def worker_exit(server, worker):
+    from main import coordinator
+    coordinator.stop()
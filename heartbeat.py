@@ -0,0 +1,65 @@
+import heapq
+import threading
+import time
+from config import Config
+
+
+class HeartbeatTracker:
+    """Дедлайны heartbeat агентов на куче: проверка просрочки стоит O(log n) на истёкший дедлайн, а не обход всех агентов"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.heap = []
+        self.deadlines = {}
+        self.last_seen = {}
+
+    def record(self, server_key, interval=None):
+        # Агент может сообщить свой период; дедлайн — несколько пропущенных heartbeat подряд
+        timeout = interval * Config.HEARTBEAT_MISSES if interval else Config.HEARTBEAT_TIMEOUT
+        now = self.clock()
+        deadline = now + timeout
+        with self.lock:
+            self.deadlines[server_key] = deadline
+            self.last_seen[server_key] = time.time()
+            heapq.heappush(self.heap, (deadline, server_key))
+
+    def expired(self):
+        """Серверы, пропустившие дедлайн; после просрочки сервер снова опрашивается, пока heartbeat не вернётся"""
+        now = self.clock()
+        result = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                deadline, server_key = heapq.heappop(self.heap)
+                if self.deadlines.get(server_key) != deadline:
+                    continue
+                del self.deadlines[server_key]
+                result.append(server_key)
+        return result
+
+    def seconds_until_next(self):
+        with self.lock:
+            while self.heap:
+                deadline, server_key = self.heap[0]
+                if self.deadlines.get(server_key) == deadline:
+                    return max(0.0, deadline - self.clock())
+                heapq.heappop(self.heap)
+        return None
+
+    def is_tracking(self, server_key):
+        with self.lock:
+            return server_key in self.deadlines
+
+    def forget(self, server_keys):
+        with self.lock:
+            for server_key in list(self.deadlines):
+                if server_key not in server_keys:
+                    del self.deadlines[server_key]
+                    self.last_seen.pop(server_key, None)
+
+    def get_state(self):
+        with self.lock:
+            return {
+                server_key: {'last_seen': last_seen, 'push_active': server_key in self.deadlines}
+                for server_key, last_seen in self.last_seen.items()
+            }
@@ -0,0 +1,216 @@
+import math
+import threading
+import time
+from array import array
+from config import Config
+
+# Границы корзин гистограммы задержки (секунды); перцентили считаются по сумме гистограмм окна
+LATENCY_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0, float('inf'))
+RESOLUTIONS = ('raw', 'minute', 'hour')
+BUCKET_SECONDS = {'raw': 0, 'minute': 60, 'hour': 3600}
+
+
+def _latency_bin(latency):
+    for i, bound in enumerate(LATENCY_BOUNDS):
+        if latency <= bound:
+            return i
+    return len(LATENCY_BOUNDS) - 1
+
+
+class _Ring:
+    """Кольцевой буфер на массивах фиксированной ёмкости; каждая ячейка — корзина времени"""
+
+    def __init__(self, capacity, bucket_seconds):
+        self.capacity = capacity
+        self.bucket_seconds = bucket_seconds
+        self.head = -1
+        self.size = 0
+        self.ts = array('d', [0.0]) * capacity
+
+    def _slot_for(self, timestamp):
+        # Возвращает (индекс ячейки, True если ячейка новая)
+        bucket = math.floor(timestamp / self.bucket_seconds) * self.bucket_seconds if self.bucket_seconds else timestamp
+        if self.head >= 0 and self.bucket_seconds and self.ts[self.head] == bucket:
+            return self.head, False
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.ts[self.head] = bucket
+        return self.head, True
+
+    def indexes(self, start, end):
+        # Индексы ячеек окна в хронологическом порядке
+        first = (self.head - self.size + 1) % self.capacity
+        for n in range(self.size):
+            i = (first + n) % self.capacity
+            if start <= self.ts[i] <= end:
+                yield i
+
+    def oldest(self):
+        if not self.size:
+            return None
+        return self.ts[(self.head - self.size + 1) % self.capacity]
+
+
+class _ServerRing(_Ring):
+    def __init__(self, capacity, bucket_seconds):
+        super().__init__(capacity, bucket_seconds)
+        self.count = array('l', [0]) * capacity
+        self.up = array('l', [0]) * capacity
+        self.latency_sum = array('d', [0.0]) * capacity
+        self.latency_max = array('d', [0.0]) * capacity
+        self.hist = array('l', [0]) * (capacity * len(LATENCY_BOUNDS))
+
+    def add(self, timestamp, up, latency):
+        i, new = self._slot_for(timestamp)
+        nbins = len(LATENCY_BOUNDS)
+        if new:
+            self.count[i] = self.up[i] = 0
+            self.latency_sum[i] = self.latency_max[i] = 0.0
+            for b in range(nbins):
+                self.hist[i * nbins + b] = 0
+        self.count[i] += 1
+        if up:
+            self.up[i] += 1
+        if latency is not None:
+            self.latency_sum[i] += latency
+            self.latency_max[i] = max(self.latency_max[i], latency)
+            self.hist[i * nbins + _latency_bin(latency)] += 1
+
+
+class _BotRing(_Ring):
+    def __init__(self, capacity, bucket_seconds):
+        super().__init__(capacity, bucket_seconds)
+        self.count = array('l', [0]) * capacity
+        self.running = array('l', [0]) * capacity
+
+    def add(self, timestamp, running):
+        i, new = self._slot_for(timestamp)
+        if new:
+            self.count[i] = self.running[i] = 0
+        self.count[i] += 1
+        if running:
+            self.running[i] += 1
+
+
+def _percentile(hist, q):
+    total = sum(hist)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, n in enumerate(hist):
+        if n and seen + n >= rank:
+            # Линейная интерполяция внутри корзины; у последней корзины верхней границы нет
+            lower = LATENCY_BOUNDS[i - 1] if i else 0.0
+            upper = LATENCY_BOUNDS[i]
+            if upper == float('inf'):
+                return lower
+            return lower + (upper - lower) * (rank - seen) / n
+        seen += n
+    return None
+
+
+class ProbeHistory:
+    """История проб с фиксированным объёмом памяти: сырые точки и агрегаты по минутам и часам"""
+
+    def __init__(self):
+        self.capacities = {
+            'raw': Config.HISTORY_RAW_POINTS,
+            'minute': Config.HISTORY_MINUTE_POINTS,
+            'hour': Config.HISTORY_HOUR_POINTS
+        }
+        self.servers = {}
+        self.bots = {}
+        self.lock = threading.Lock()
+
+    def _rings(self, store, key, ring_class):
+        rings = store.get(key)
+        if rings is None:
+            rings = {r: ring_class(self.capacities[r], BUCKET_SECONDS[r]) for r in RESOLUTIONS}
+            store[key] = rings
+        return rings
+
+    def record(self, server_key, status, timestamp=None):
+        timestamp = timestamp or time.time()
+        up = status.is_online
+        latency = status.response_time if up else None
+        with self.lock:
+            for ring in self._rings(self.servers, server_key, _ServerRing).values():
+                ring.add(timestamp, up, latency)
+            for bot_id, bot_status in status.bots.items():
+                running = bot_status.running
+                for ring in self._rings(self.bots.setdefault(server_key, {}), bot_id, _BotRing).values():
+                    ring.add(timestamp, running)
+
+    def _pick_resolution(self, rings, start):
+        for resolution in RESOLUTIONS:
+            oldest = rings[resolution].oldest()
+            if oldest is not None and oldest <= start:
+                return resolution
+        return 'hour'
+
+    def query(self, server_key, window, resolution=None, now=None):
+        now = now or time.time()
+        start = now - window
+        with self.lock:
+            rings = self.servers.get(server_key)
+            if rings is None:
+                return None
+            resolution = resolution or self._pick_resolution(rings, start)
+            ring = rings[resolution]
+            nbins = len(LATENCY_BOUNDS)
+            hist = [0] * nbins
+            points = []
+            samples = up_samples = 0
+            for i in ring.indexes(start, now):
+                count, up = ring.count[i], ring.up[i]
+                latency_samples = sum(ring.hist[i * nbins:(i + 1) * nbins])
+                for b in range(nbins):
+                    hist[b] += ring.hist[i * nbins + b]
+                samples += count
+                up_samples += up
+                points.append({
+                    'ts': ring.ts[i],
+                    'samples': count,
+                    'up_ratio': up / count if count else None,
+                    'avg_latency': ring.latency_sum[i] / latency_samples if latency_samples else None,
+                    'max_latency': ring.latency_max[i] if latency_samples else None
+                })
+            bots = {}
+            for bot_id, bot_rings in self.bots.get(server_key, {}).items():
+                bot_ring = bot_rings[resolution]
+                bots[bot_id] = [
+                    {'ts': bot_ring.ts[i], 'running_ratio': bot_ring.running[i] / bot_ring.count[i]}
+                    for i in bot_ring.indexes(start, now) if bot_ring.count[i]
+                ]
+        return {
+            'server': server_key,
+            'resolution': resolution,
+            'window': window,
+            'samples': samples,
+            'availability': up_samples / samples if samples else None,
+            'latency_p50': _percentile(hist, 0.50),
+            'latency_p95': _percentile(hist, 0.95),
+            'latency_p99': _percentile(hist, 0.99),
+            'points': points,
+            'bots': bots
+        }
+
+    def server_keys(self):
+        with self.lock:
+            return list(self.servers)
+
+    def forget(self, servers):
+        # Буферы серверов и ботов, убранных из топологии, освобождаются: память не растёт со сменой парка
+        with self.lock:
+            for server_key in list(self.servers):
+                if server_key not in servers:
+                    del self.servers[server_key]
+            for server_key in list(self.bots):
+                if server_key not in servers:
+                    del self.bots[server_key]
+                    continue
+                bots = self.bots[server_key]
+                for bot_id in list(bots):
+                    if bot_id not in servers[server_key]['bots']:
+                        del bots[bot_id]
@@ -1,17 +1,24 @@
-from flask import Flask, render_template, jsonify, request, send_from_directory
+from flask import Flask, Response, render_template, jsonify, request, send_file, send_from_directory, abort, stream_with_context
 from flask_cors import CORS
 import logging
 from server_monitor import ServerMonitor
+from upload_jobs import UploadJobManager
+from artifact_store import ArtifactStore
+from history import RESOLUTIONS
+from shared_state import SharedState, CoordinatorNode
+from snapshot import StateSnapshotter
+from response_cache import ResponseCache
+from topology import TopologyManager
 from config import Config
 from datetime import datetime
 import os
-import requests
+import atexit
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-UPLOAD_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), 'uploads'))
+UPLOAD_FOLDER = os.path.abspath(Config.UPLOAD_FOLDER)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app = Flask(__name__)
@@ -21,8 +28,96 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # Настройка CORS для хостинга
 CORS(app, origins=Config.CORS_ORIGINS)
 
+# Топология парка из файла (если он есть) до создания монитора, дальше — перечитывается на лету
+topology_manager = TopologyManager()
+topology_manager.load()
+
 # Инициализация монитора серверов
 monitor = ServerMonitor()
+topology_manager.listeners.append(monitor.apply_topology)
+topology_manager.start()
+upload_jobs = UploadJobManager(monitor.agent_client, journal=monitor.journal)
+artifact_store = ArtifactStore(UPLOAD_FOLDER, gc_min_age=Config.UPLOAD_GC_MIN_AGE)
+
+# Готовые (в т.ч. сжатые) ответы API чтения по версии состояния
+response_cache = ResponseCache()
+
+def _command_start_monitoring():
+    monitor.start_monitoring()
+    return {'success': True, 'message': 'Мониторинг запущен'}
+
+def _command_stop_monitoring():
+    monitor.stop_monitoring()
+    return {'success': True, 'message': 'Мониторинг остановлен'}
+
+def _command_switch_server(server):
+    job = monitor.submit_switch(server)
+    return {'success': True, 'job_id': job['id'], 'coalesced': job['coalesced'] > 0,
+            'message': f'Переключение на сервер {server} поставлено в очередь'}
+
+BOT_JOB_TEXT = {'start': 'Запуск', 'stop': 'Остановка', 'restart': 'Перезапуск'}
+
+def _command_bot_job(server, bot_id, action):
+    job = monitor.submit_bot_job(server, bot_id, action)
+    return {'success': True, 'job_id': job['id'], 'coalesced': job['coalesced'] > 0,
+            'message': f'{BOT_JOB_TEXT[action]} бота {bot_id} на сервере {server} поставлен в очередь'}
+
+def _command_auto_restart(enabled):
+    monitor.set_auto_restart(enabled)
+    status = 'включен' if enabled else 'выключен'
+    return {'success': True, 'message': f'Автоперезапуск {status}'}
+
+def _command_history(server, window, resolution):
+    # История проб копится только у ведущего: он опрашивает агентов
+    server_keys = [server] if server else monitor.history.server_keys()
+    history = {}
+    for key in server_keys:
+        result = monitor.history.query(key, window, resolution)
+        if result is not None:
+            history[key] = result
+    return {'success': True, 'history': history}
+
+def _command_agent_connections():
+    return {'success': True, 'connections': monitor.agent_client.get_stats()}
+
+# Мониторинг ведёт один выбранный воркер, остальные читают его статус из общего хранилища
+coordinator = CoordinatorNode(monitor, SharedState(), {
+    'start_monitoring': _command_start_monitoring,
+    'stop_monitoring': _command_stop_monitoring,
+    'switch_server': _command_switch_server,
+    'bot_job': _command_bot_job,
+    'auto_restart': _command_auto_restart,
+    'history': _command_history,
+    'agent_connections': _command_agent_connections
+}, upload_jobs=upload_jobs)
+
+# Тёплый старт из последнего снимка состояния; пишет снимки только ведущий (или процесс без выборов)
+snapshotter = StateSnapshotter(monitor, is_writer=lambda: coordinator.is_leader or coordinator.thread is None)
+snapshotter.restore()
+atexit.register(snapshotter.close)
+atexit.register(monitor.journal.close)
+
+def _command_response(result):
+    return jsonify(result), (200 if result.get('success') else 500)
+
+def _job_response(result):
+    # Операция принята в очередь: клиент следит за ней по /api/jobs/<id>
+    if not result.get('success'):
+        return jsonify(result), 500
+    return jsonify(dict(result, status_url=f"/api/jobs/{result['job_id']}")), 202
+
+def _bot_job_request(action):
+    try:
+        data = request.get_json()
+        server_key = data.get('server')
+        bot_id = data.get('bot_id')
+
+        if not server_key or not bot_id:
+            return jsonify({'success': False, 'error': 'Не указан сервер или бот'}), 400
+
+        return _job_response(coordinator.run_command('bot_job', server=server_key, bot_id=bot_id, action=action))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/')
 def index():
@@ -32,14 +127,43 @@ def index():
 @app.route('/api/status')
 def get_status():
     """API для получения статуса серверов"""
-    return jsonify(monitor.get_status())
+    return response_cache.respond('status', coordinator.get_status_version(), coordinator.get_status)
+
+@app.route('/api/status/stream')
+def status_stream():
+    """SSE-поток статуса: снимок при подключении, далее только изменения"""
+    # id события содержит эпоху процесса: после переподключения к другому воркеру клиент получит полный снимок
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    events = monitor.status_broadcaster.stream(
+        last_event_id,
+        keepalive=Config.STATUS_STREAM_KEEPALIVE,
+        max_duration=Config.STATUS_STREAM_MAX_DURATION
+    )
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/heartbeat', methods=['POST'])
+def heartbeat():
+    """Приём heartbeat агента: статус ботов без опроса со стороны координатора"""
+    if Config.HEARTBEAT_TOKEN and request.headers.get('X-Agent-Token') != Config.HEARTBEAT_TOKEN:
+        return jsonify({'success': False, 'error': 'Неверный токен агента'}), 403
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('server'):
+        return jsonify({'success': False, 'error': 'Не указан сервер'}), 400
+    try:
+        coordinator.receive_heartbeat(data['server'], data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True})
 
 @app.route('/api/start_monitoring', methods=['POST'])
 def start_monitoring():
     """API для запуска мониторинга"""
     try:
-        monitor.start_monitoring()
-        return jsonify({'success': True, 'message': 'Мониторинг запущен'})
+        return _command_response(coordinator.run_command('start_monitoring'))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -47,8 +171,7 @@ def start_monitoring():
 def stop_monitoring():
     """API для остановки мониторинга"""
     try:
-        monitor.stop_monitoring()
-        return jsonify({'success': True, 'message': 'Мониторинг остановлен'})
+        return _command_response(coordinator.run_command('stop_monitoring'))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -62,67 +185,49 @@ def switch_server():
         if not server_key:
             return jsonify({'success': False, 'error': 'Не указан сервер'}), 400
             
-        monitor.manual_switch(server_key)
-        return jsonify({'success': True, 'message': f'Переключение на сервер {server_key}'})
+        return _job_response(coordinator.run_command('switch_server', server=server_key))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/start_bot', methods=['POST'])
 def start_bot():
-    """API для запуска конкретного бота"""
-    try:
-        data = request.get_json()
-        server_key = data.get('server')
-        bot_id = data.get('bot_id')
-        
-        if not server_key or not bot_id:
-            return jsonify({'success': False, 'error': 'Не указан сервер или бот'}), 400
-            
-        success = monitor.start_specific_bot(server_key, bot_id)
-        if success:
-            return jsonify({'success': True, 'message': f'Бот {bot_id} запущен на сервере {server_key}'})
-        else:
-            return jsonify({'success': False, 'error': f'Ошибка запуска бота {bot_id}'}), 500
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    """API для запуска конкретного бота (в фоне, ответ — id задачи)"""
+    return _bot_job_request('start')
 
 @app.route('/api/stop_bot', methods=['POST'])
 def stop_bot():
-    """API для остановки конкретного бота"""
-    try:
-        data = request.get_json()
-        server_key = data.get('server')
-        bot_id = data.get('bot_id')
-        
-        if not server_key or not bot_id:
-            return jsonify({'success': False, 'error': 'Не указан сервер или бот'}), 400
-            
-        success = monitor.stop_specific_bot(server_key, bot_id)
-        if success:
-            return jsonify({'success': True, 'message': f'Бот {bot_id} остановлен на сервере {server_key}'})
-        else:
-            return jsonify({'success': False, 'error': f'Ошибка остановки бота {bot_id}'}), 500
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+    """API для остановки конкретного бота (в фоне, ответ — id задачи)"""
+    return _bot_job_request('stop')
 
 @app.route('/api/restart_bot', methods=['POST'])
 def restart_bot():
-    """API для перезапуска конкретного бота"""
+    """API для перезапуска конкретного бота (в фоне, ответ — id задачи)"""
+    return _bot_job_request('restart')
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """API для получения состояния фоновой операции с ботом или переключения"""
+    job = coordinator.get_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/failovers')
+def get_failovers():
+    """API для хронологий переключений: интервалы шагов и критический путь, новые первыми"""
     try:
-        data = request.get_json()
-        server_key = data.get('server')
-        bot_id = data.get('bot_id')
-        
-        if not server_key or not bot_id:
-            return jsonify({'success': False, 'error': 'Не указан сервер или бот'}), 400
-            
-        success = monitor.restart_specific_bot(server_key, bot_id)
-        if success:
-            return jsonify({'success': True, 'message': f'Бот {bot_id} перезапущен на сервере {server_key}'})
-        else:
-            return jsonify({'success': False, 'error': f'Ошибка перезапуска бота {bot_id}'}), 500
-    except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit должен быть числом'}), 400
+    return jsonify({'success': True, 'failovers': coordinator.get_failovers(max(1, limit))})
+
+@app.route('/api/failovers/<trace_id>')
+def get_failover(trace_id):
+    """API для хронологии одного переключения по trace_id"""
+    trace = coordinator.get_failover(trace_id)
+    if trace is None:
+        return jsonify({'success': False, 'error': 'Хронология не найдена'}), 404
+    return jsonify({'success': True, 'failover': trace})
 
 @app.route('/api/auto_restart', methods=['POST'])
 def set_auto_restart():
@@ -131,93 +236,147 @@ def set_auto_restart():
         data = request.get_json()
         enabled = data.get('enabled', True)
         
-        monitor.set_auto_restart(enabled)
-        status = 'включен' if enabled else 'выключен'
-        return jsonify({'success': True, 'message': f'Автоперезапуск {status}'})
+        return _command_response(coordinator.run_command('auto_restart', enabled=enabled))
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/servers')
 def get_servers():
     """API для получения списка серверов"""
-    return jsonify(Config.SERVERS)
+    topology = topology_manager.current
+    return response_cache.respond('servers', topology.version, lambda: topology.servers)
 
-@app.route('/api/bots')
-def get_bots():
-    """API для получения списка ботов"""
+def _build_bots_info(servers):
     bots_info = {}
-    for server_key, server_config in Config.SERVERS.items():
+    for server_key, server_config in servers.items():
         bots_info[server_key] = {
             'name': server_config['name'],
             'bots': server_config['bots']
         }
-    return jsonify(bots_info)
+    return bots_info
+
+@app.route('/api/bots')
+def get_bots():
+    """API для получения списка ботов"""
+    # Версия топологии растёт при каждой перезагрузке; версия и серверы берутся из одного снимка
+    topology = topology_manager.current
+    return response_cache.respond('bots', topology.version, lambda: _build_bots_info(topology.servers))
+
+@app.route('/api/topology')
+def get_topology():
+    """API для получения текущей топологии парка и её индексов"""
+    return jsonify({'success': True, 'topology': topology_manager.get_info()})
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """API для загрузки файла и обновления на всех серверах с автоперезапуском нужного бота"""
+    """API для загрузки файла и фоновой рассылки на все серверы с автоперезапуском нужного бота"""
     if 'file' not in request.files:
         return jsonify({'success': False, 'error': 'Файл не найден'}), 400
     file = request.files['file']
     if file.filename == '':
         return jsonify({'success': False, 'error': 'Имя файла не указано'}), 400
-    filename = file.filename
-    save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(save_path)
-
-    # Определяем bot_id по имени файла (например, bot2.py -> bot2)
-    bot_id = None
-    for b in ['bot1', 'bot2', 'bot3', 'bot4']:
-        if filename.startswith(b):
-            bot_id = b
-            break
-
-    results = {}
-    for server_key, server_config in Config.SERVERS.items():
-        try:
-            agent_url = server_config['agent_url']
-            root_path = server_config.get('root_path', '/home/user/bots')
-            with open(save_path, 'rb') as f:
-                files = {'file': (filename, f)}
-                data = {'target_path': root_path, 'filename': filename}
-                resp = requests.post(f"{agent_url}/upload_file", files=files, data=data, timeout=30)
-                if resp.status_code == 200:
-                    # После успешной загрузки — перезапуск только нужного бота
-                    if bot_id and bot_id in server_config['bots']:
-                        restart_resp = requests.post(f"{agent_url}/restart_bot", json={'bot_id': bot_id}, timeout=30)
-                        if restart_resp.status_code == 200:
-                            results[server_key] = {'success': True, 'restarted': True}
-                        else:
-                            results[server_key] = {'success': True, 'restarted': False, 'error': f'Ошибка перезапуска: {restart_resp.status_code}'}
-                    else:
-                        results[server_key] = {'success': True, 'restarted': False, 'error': 'Бот не найден по имени файла'}
-                else:
-                    results[server_key] = {'success': False, 'error': f'HTTP {resp.status_code}'}
-        except Exception as e:
-            results[server_key] = {'success': False, 'error': str(e)}
-    return jsonify({'success': True, 'results': results})
+    filename = os.path.basename(file.filename)
+    sha256, save_path = artifact_store.save(file.stream, filename)
+
+    # Бот по шаблонам имён файлов из топологии (по умолчанию bot2.py -> bot2); файл нужен только его серверам
+    topology = topology_manager.current
+    bot_id = topology.bot_for_file(filename)
+    if bot_id:
+        servers = {key: topology.servers[key] for key in topology.servers_for_bot(bot_id)}
+    else:
+        servers = dict(topology.servers)
+
+    job_id = upload_jobs.create_job(filename, save_path, sha256, bot_id, servers)
+    return jsonify({'success': True, 'job_id': job_id, 'sha256': sha256, 'status_url': f'/api/upload/{job_id}'}), 202
+
+@app.route('/api/upload/<job_id>')
+def get_upload_job(job_id):
+    """API для получения прогресса рассылки файла по серверам"""
+    job = coordinator.get_upload_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Задача не найдена'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/history')
+def get_history():
+    """API для истории проб: окно в секундах, разрешение raw/minute/hour (по умолчанию подбирается)"""
+    try:
+        window = float(request.args.get('window', 3600))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Некорректное окно'}), 400
+    resolution = request.args.get('resolution')
+    if resolution and resolution not in RESOLUTIONS:
+        return jsonify({'success': False, 'error': f'Неизвестное разрешение: {resolution}'}), 400
+    server_key = request.args.get('server')
+    result = coordinator.run_command('history', server=server_key, window=window, resolution=resolution)
+    if not result.get('success'):
+        return _command_response(result)
+    if server_key and not result['history']:
+        return jsonify({'success': False, 'error': f'Нет истории для сервера {server_key}'}), 404
+    return jsonify(result)
+
+@app.route('/api/events')
+def get_events():
+    """API для журнала событий: фильтры since/until (unix-время), server, bot, type; новые первыми"""
+    try:
+        since = float(request.args['since']) if request.args.get('since') else None
+        until = float(request.args['until']) if request.args.get('until') else None
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'since, until и limit должны быть числами'}), 400
+    if not monitor.journal.enabled:
+        return jsonify({'success': False, 'error': 'Журнал событий отключён (EVENT_JOURNAL_DIR)'}), 404
+    result = monitor.journal.query(
+        since, until,
+        server=request.args.get('server') or None,
+        bot=request.args.get('bot') or None,
+        event_type=request.args.get('type') or None,
+        limit=min(max(1, limit), 1000)
+    )
+    return jsonify(dict(result, success=True))
+
+@app.route('/metrics')
+def get_metrics():
+    """Метрики координатора в текстовом формате Prometheus, сложенные по всем воркерам"""
+    return Response(coordinator.render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/agent_connections')
+def get_agent_connections():
+    """API для статистики пула соединений с агентами ведущего воркера (он опрашивает агентов)"""
+    result = coordinator.run_command('agent_connections')
+    if not result.get('success'):
+        return _command_response(result)
+    return jsonify(result['connections'])
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    path = artifact_store.resolve(filename)
+    if path is None:
+        # Файлы, загруженные до хранилища по хешу, лежат прямо в UPLOAD_FOLDER; служебный индекс не отдаём
+        if filename in artifact_store.service_files:
+            abort(404)
+        return send_from_directory(UPLOAD_FOLDER, filename)
+    return send_file(path, download_name=filename)
 
 @app.route('/health')
 def health_check():
     """Проверка здоровья координатора"""
+    status = coordinator.get_status()
     return jsonify({
         'status': 'healthy',
         'service': 'coordinator',
         'timestamp': datetime.now().isoformat(),
-        'monitoring_active': monitor.is_monitoring,
-        'auto_restart_enabled': monitor.auto_restart_enabled
+        'monitoring_active': status['is_monitoring'],
+        'auto_restart_enabled': status['auto_restart_enabled'],
+        'is_leader': coordinator.is_leader
     })
 
 if __name__ == '__main__':
     logger.info("Запуск центрального сервера мониторинга")
     logger.info(f"Веб-панель доступна по адресу: http://{Config.WEB_HOST}:{Config.WEB_PORT}")
     
-    # Автоматический запуск мониторинга при старте
-    monitor.start_monitoring()
+    # Участие в выборах ведущего: победитель автоматически запускает мониторинг
+    coordinator.start()
     
     app.run(
         host=Config.WEB_HOST,
@@ -0,0 +1,167 @@
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dump(self):
+        with self.lock:
+            return [[list(labels), value] for labels, value in self.values.items()]
+
+    def merge(self, dumps):
+        values = {}
+        for dump in dumps:
+            for labels, value in dump:
+                labels = tuple(labels)
+                values[labels] = values.get(labels, 0) + value
+        return values
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        if values is None:
+            with self.lock:
+                values = dict(self.values)
+        for labels, value in values.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики по корзинам..., сумма, количество]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = [0] * (len(self.buckets) + 2)
+                self.values[labels] = series
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def dump(self):
+        with self.lock:
+            return [[list(labels), list(series)] for labels, series in self.values.items()]
+
+    def merge(self, dumps):
+        values = {}
+        for dump in dumps:
+            for labels, series in dump:
+                labels = tuple(labels)
+                total = values.get(labels)
+                values[labels] = series if total is None else [a + b for a, b in zip(total, series)]
+        return values
+
+    def render(self, values=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        if values is None:
+            with self.lock:
+                values = {labels: list(series) for labels, series in self.values.items()}
+        for labels, series in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {series[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(float(series[-2]))}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def dump(self):
+        # Значения всех метрик процесса в JSON-совместимом виде, для сложения по воркерам gunicorn
+        return {metric.name: metric.dump() for metric in self.metrics}
+
+    def render(self, dumps=None):
+        """Текст для Prometheus; dumps — снимки dump() нескольких процессов, которые складываются в общие ряды"""
+        lines = []
+        for metric in self.metrics:
+            values = metric.merge([dump.get(metric.name, []) for dump in dumps]) if dumps is not None else None
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+MONITORING_CYCLE_SECONDS = REGISTRY.register(Histogram(
+    'coordinator_monitoring_cycle_seconds', 'Длительность итерации цикла мониторинга'))
+PROBE_SECONDS = REGISTRY.register(Histogram(
+    'coordinator_probe_seconds', 'Длительность проверки /health агента', ('server',)))
+PROBE_TOTAL = REGISTRY.register(Counter(
+    'coordinator_probe_total', 'Проверки /health по результату', ('server', 'status')))
+BOT_OPERATION_SECONDS = REGISTRY.register(Histogram(
+    'coordinator_bot_operation_seconds', 'Длительность команд start/stop ботам', ('server', 'bot', 'action')))
+BOT_OPERATION_TOTAL = REGISTRY.register(Counter(
+    'coordinator_bot_operation_total', 'Команды start/stop ботам по результату', ('server', 'bot', 'action', 'result')))
+AUTO_RESTART_TOTAL = REGISTRY.register(Counter(
+    'coordinator_auto_restart_total', 'Срабатывания автоперезапуска', ('server', 'bot')))
+AUTO_RESTART_DECISIONS_TOTAL = REGISTRY.register(Counter(
+    'coordinator_auto_restart_decisions_total', 'Решения автоперезапуска по остановленным ботам', ('decision',)))
+FAILOVER_SECONDS = REGISTRY.register(Histogram(
+    'coordinator_failover_seconds', 'Длительность переключения на сервер', ('server', 'trigger')))
+FAILOVER_RECOVERY_SECONDS = REGISTRY.register(Histogram(
+    'coordinator_failover_recovery_seconds', 'Время восстановления от отказа до активного сервера', ('mode',)))
+FAILOVER_TOTAL = REGISTRY.register(Counter(
+    'coordinator_failover_total', 'Переключения серверов', ('server', 'trigger')))
+UPLOAD_SECONDS = REGISTRY.register(Histogram(
+    'coordinator_upload_seconds', 'Длительность рассылки файла на агент', ('server',)))
+UPLOAD_TOTAL = REGISTRY.register(Counter(
+    'coordinator_upload_total', 'Рассылки файла на агенты по результату', ('server', 'result')))
+UPLOAD_BYTES_TOTAL = REGISTRY.register(Counter(
+    'coordinator_upload_bytes_total', 'Отправлено байт файлов на агенты', ('server',)))
+NOTIFICATION_TOTAL = REGISTRY.register(Counter(
+    'coordinator_notification_total', 'Уведомления по результату отправки', ('result',)))
+HEARTBEAT_TOTAL = REGISTRY.register(Counter(
+    'coordinator_heartbeat_total', 'Принятые heartbeat агентов', ('server',)))
+PLACEMENT_MOVES_TOTAL = REGISTRY.register(Counter(
+    'coordinator_placement_moves_total', 'Переносы ботов в режиме active-active', ('server', 'result')))
+RESPONSE_CACHE_TOTAL = REGISTRY.register(Counter(
+    'coordinator_response_cache_total', 'Ответы API чтения из кэша по результату', ('endpoint', 'result')))
@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+import requests
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationRetry(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TelegramTransport:
+    """Отправка сообщения через Bot API Telegram"""
+
+    def __init__(self, token, chat_id, timeout=None):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage"
+        self.chat_id = chat_id
+        self.timeout = Config.NOTIFY_TIMEOUT if timeout is None else timeout
+        self.session = requests.Session()
+
+    def send(self, text):
+        response = self.session.post(self.url, json={"chat_id": self.chat_id, "text": text}, timeout=self.timeout)
+        if response.status_code == 429:
+            # Telegram сообщает, сколько ждать до следующей попытки
+            retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+            raise NotificationRetry(f"Telegram ограничил частоту, повтор через {retry_after} с", retry_after)
+        response.raise_for_status()
+
+
+class MemoryTransport:
+    """Локальный приёмник для отладки и стендов: сообщения пишутся в лог и хранятся в памяти"""
+
+    def __init__(self, keep=100):
+        self.sent = deque(maxlen=keep)
+
+    def send(self, text):
+        self.sent.append({'at': time.time(), 'text': text})
+        logger.info(f"Уведомление (локальный приёмник): {text}")
+
+
+def create_transport():
+    if Config.NOTIFY_TRANSPORT == 'memory':
+        return MemoryTransport()
+    if not Config.TELEGRAM_BOT_TOKEN or not Config.TELEGRAM_CHAT_ID:
+        logger.warning("TELEGRAM_BOT_TOKEN или TELEGRAM_CHAT_ID не заданы, уведомления пишутся только в лог")
+        return MemoryTransport()
+    return TelegramTransport(Config.TELEGRAM_BOT_TOKEN, Config.TELEGRAM_CHAT_ID)
+
+
+class NotificationDispatcher:
+    """Фоновая отправка уведомлений: ограниченная очередь, склейка всплесков, ограничение частоты и повторы.
+
+    notify() никогда не блокирует вызывающего: при переполнении очереди сообщение отбрасывается.
+    """
+
+    def __init__(self, transport, queue_size=None, coalesce_window=None, min_interval=None, max_retries=None):
+        self.transport = transport
+        self.queue = queue.Queue(maxsize=Config.NOTIFY_QUEUE_SIZE if queue_size is None else queue_size)
+        self.coalesce_window = Config.NOTIFY_COALESCE_WINDOW if coalesce_window is None else coalesce_window
+        self.min_interval = Config.NOTIFY_MIN_INTERVAL if min_interval is None else min_interval
+        self.max_retries = Config.NOTIFY_MAX_RETRIES if max_retries is None else max_retries
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_sent = 0.0
+        self.stats = {'queued': 0, 'sent': 0, 'coalesced': 0, 'dropped': 0, 'failed': 0}
+
+    def notify(self, message):
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait(message)
+            self._count('queued')
+        except queue.Full:
+            self._count('dropped')
+            metrics.NOTIFICATION_TOTAL.inc('dropped')
+            logger.warning(f"Очередь уведомлений переполнена, сообщение отброшено: {message}")
+
+    def _ensure_worker(self):
+        # Поток запускается лениво: при предзагрузке gunicorn он должен появиться уже в воркере
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._worker, name='notifier', daemon=True)
+                self.thread.start()
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def _worker(self):
+        while True:
+            batch = [self.queue.get()]
+            # Копим сообщения окно склейки, но не раньше, чем позволит ограничение частоты
+            deadline = max(time.monotonic() + self.coalesce_window, self.last_sent + self.min_interval)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._deliver(self._summarize(batch), len(batch))
+
+    def _summarize(self, batch):
+        # Одинаковые сообщения одного всплеска сворачиваются в строку со счётчиком
+        counts = OrderedDict()
+        for message in batch:
+            counts[message] = counts.get(message, 0) + 1
+        if len(counts) == 1:
+            message, count = next(iter(counts.items()))
+            return message if count == 1 else f"{message} (×{count})"
+        lines = [f"• {message}" + (f" (×{count})" if count > 1 else '') for message, count in counts.items()]
+        return f"Событий за {self.coalesce_window:.0f} с: {len(batch)}\n" + '\n'.join(lines)
+
+    def _deliver(self, text, batch_size):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.transport.send(text)
+                self.last_sent = time.monotonic()
+                self._count('sent')
+                self._count('coalesced', batch_size - 1)
+                metrics.NOTIFICATION_TOTAL.inc('sent')
+                logger.info(f"Отправлено уведомление ({batch_size} событий): {text}")
+                return
+            except NotificationRetry as e:
+                delay = e.retry_after
+                logger.warning(str(e))
+            except Exception as e:
+                delay = Config.NOTIFY_RETRY_BACKOFF * (2 ** attempt)
+                logger.error(f"Ошибка отправки уведомления (попытка {attempt + 1}): {e}")
+            if attempt < self.max_retries:
+                time.sleep(delay)
+        self.last_sent = time.monotonic()
+        self._count('failed')
+        metrics.NOTIFICATION_TOTAL.inc('failed')
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['pending'] = self.queue.qsize()
+        return stats
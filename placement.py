@@ -0,0 +1,134 @@
+import threading
+import time
+from config import Config
+from failover_planner import server_rank
+
+ACTIVE_STANDBY = 'active_standby'
+ACTIVE_ACTIVE = 'active_active'
+
+
+def server_load(status):
+    # Нагрузка из /health агента: поле load (0..1, например loadavg / число ядер); без него — 0
+    return status.load if status.load is not None else 0.0
+
+
+def server_capacity(server_config):
+    return server_config.get('capacity') or len(server_config['bots'])
+
+
+class PlacementEngine:
+    """Размещение active-active: каждый бот работает на одном здоровом сервере, выбранном по ёмкости и нагрузке.
+
+    Размещение липкое: бот переезжает, только если его сервер недоступен дольше льготного периода.
+    """
+
+    def __init__(self, grace_period=None):
+        self.grace_period = Config.FAILOVER_GRACE_PERIOD if grace_period is None else grace_period
+        self.lock = threading.Lock()
+        self.assignments = {}
+        self.unhealthy_since = {}
+
+    def plan(self, servers, servers_status, now=None):
+        """Возвращает (moves, strays): переезды (bot, откуда, куда) и лишние копии (bot, server) для остановки"""
+        now = time.time() if now is None else now
+        healthy = {key for key in servers if key in servers_status and servers_status[key].is_online}
+        bot_hosts = {}
+        for server_key, server_config in servers.items():
+            for bot_key in server_config['bots']:
+                bot_hosts.setdefault(bot_key, []).append(server_key)
+        with self.lock:
+            for server_key in servers:
+                if server_key in healthy:
+                    self.unhealthy_since.pop(server_key, None)
+                else:
+                    self.unhealthy_since.setdefault(server_key, now)
+            for bot_key in [b for b in self.assignments if b not in bot_hosts]:
+                del self.assignments[bot_key]
+            counts = {}
+            for bot_key, server_key in self.assignments.items():
+                counts[server_key] = counts.get(server_key, 0) + 1
+
+            moves = []
+            for bot_key in sorted(bot_hosts):
+                hosts = bot_hosts[bot_key]
+                current = self.assignments.get(bot_key)
+                if current in hosts:
+                    if current in healthy:
+                        continue
+                    if now - self.unhealthy_since.get(current, now) < self.grace_period:
+                        continue
+                target = self._choose(hosts, healthy, servers, servers_status, counts)
+                if target is None:
+                    continue
+                if current in counts:
+                    counts[current] -= 1
+                counts[target] = counts.get(target, 0) + 1
+                moves.append((bot_key, current, target))
+
+            # Сервер вернулся после аварии с ботами, которые уже перенесены: их надо остановить
+            moved = {bot_key for bot_key, _, _ in moves}
+            strays = []
+            for server_key in sorted(healthy):
+                server_status = servers_status[server_key]
+                for bot_key in servers[server_key]['bots']:
+                    owner = self.assignments.get(bot_key)
+                    if bot_key in moved or owner is None or owner == server_key:
+                        continue
+                    if server_status.bot_running(bot_key):
+                        strays.append((bot_key, server_key))
+            return moves, strays
+
+    def _choose(self, hosts, healthy, servers, servers_status, counts):
+        best = None
+        best_score = None
+        for server_key in hosts:
+            if server_key not in healthy:
+                continue
+            server_config = servers[server_key]
+            count = counts.get(server_key, 0)
+            if server_config.get('capacity') and count >= server_config['capacity']:
+                continue
+            score = (
+                (count + 1) / server_capacity(server_config) + Config.PLACEMENT_LOAD_WEIGHT * server_load(servers_status[server_key]),
+                server_rank(server_key, server_config)
+            )
+            if best_score is None or score < best_score:
+                best, best_score = server_key, score
+        return best
+
+    def commit(self, bot_key, server_key):
+        with self.lock:
+            self.assignments[bot_key] = server_key
+
+    def restore(self, assignments, servers):
+        with self.lock:
+            self.assignments = {
+                bot_key: server_key for bot_key, server_key in assignments.items()
+                if server_key in servers and bot_key in servers[server_key]['bots']
+            }
+
+    def forget(self, servers):
+        # Закрепления за серверами, убранными из топологии, снимаются: такие боты размещаются заново
+        with self.lock:
+            self.assignments = {
+                bot_key: server_key for bot_key, server_key in self.assignments.items()
+                if server_key in servers and bot_key in servers[server_key]['bots']
+            }
+            for server_key in list(self.unhealthy_since):
+                if server_key not in servers:
+                    del self.unhealthy_since[server_key]
+
+    def active_servers(self):
+        with self.lock:
+            return set(self.assignments.values())
+
+    def get_state(self):
+        with self.lock:
+            by_server = {}
+            for bot_key, server_key in sorted(self.assignments.items()):
+                by_server.setdefault(server_key, []).append(bot_key)
+            return {
+                'assignments': dict(self.assignments),
+                'by_server': by_server,
+                'unhealthy_since': dict(self.unhealthy_since)
+            }
@@ -0,0 +1,151 @@
+import heapq
+import random
+import threading
+import time
+from config import Config
+
+CLOSED = 'closed'
+OPEN = 'open'
+
+
+class _ServerSchedule:
+    __slots__ = ('next_probe', 'next_probe_at', 'failures', 'offline_since', 'circuit', 'interval')
+
+    def __init__(self, next_probe):
+        self.next_probe = next_probe
+        self.next_probe_at = time.time()
+        self.failures = 0
+        self.offline_since = None
+        self.circuit = CLOSED
+        self.interval = 0.0
+
+
+class ProbeScheduler:
+    """Планировщик проверок на куче таймеров: у каждого сервера своё время следующей пробы.
+
+    Активный и подозрительные (недоступные или недавно сменившие состояние) серверы опрашиваются чаще, давно недоступные — с экспоненциальной
+    задержкой за размыкателем цепи. Время пробы смещается случайным jitter.
+    """
+
+    def __init__(self, server_keys=(), clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.heap = []
+        self.servers = {}
+        self.wakeup = threading.Event()
+        self.sync(server_keys)
+
+    def sync(self, server_keys):
+        # Новые серверы проверяются сразу, удалённые выпадают из расписания (записи в куче отбрасываются лениво)
+        now = self.clock()
+        with self.lock:
+            for key in list(self.servers):
+                if key not in server_keys:
+                    del self.servers[key]
+            for key in server_keys:
+                if key not in self.servers:
+                    self.servers[key] = _ServerSchedule(now)
+                    heapq.heappush(self.heap, (now, key))
+        self.wakeup.set()
+
+    def pop_due(self):
+        now = self.clock()
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                when, key = heapq.heappop(self.heap)
+                schedule = self.servers.get(key)
+                if schedule is None or schedule.next_probe != when or key in due:
+                    continue
+                due.append(key)
+        return due
+
+    def seconds_until_next(self):
+        with self.lock:
+            while self.heap:
+                when, key = self.heap[0]
+                schedule = self.servers.get(key)
+                if schedule is not None and schedule.next_probe == when:
+                    return max(0.0, when - self.clock())
+                heapq.heappop(self.heap)
+        return Config.MONITORING_INTERVAL
+
+    def wait(self, timeout=None):
+        # Сон до ближайшей пробы (или более раннего timeout); внеочередная проба или новый сервер будят цикл раньше
+        self.wakeup.clear()
+        seconds = self.seconds_until_next()
+        self.wakeup.wait(seconds if timeout is None else min(seconds, timeout))
+
+    def wake(self):
+        self.wakeup.set()
+
+    def probe_now(self, server_key):
+        self._schedule(server_key, 0.0)
+        self.wakeup.set()
+
+    def defer(self, server_key, seconds):
+        self._schedule(server_key, seconds)
+
+    def probe_timeout(self, server_key):
+        # Пробная проверка давно недоступного сервера не ждёт полный HEALTH_CHECK_TIMEOUT
+        with self.lock:
+            schedule = self.servers.get(server_key)
+            if schedule is not None and schedule.circuit == OPEN:
+                return min(Config.PROBE_OPEN_TIMEOUT, Config.HEALTH_CHECK_TIMEOUT)
+        return Config.HEALTH_CHECK_TIMEOUT
+
+    def record(self, server_key, status, is_active):
+        with self.lock:
+            schedule = self.servers.get(server_key)
+            if schedule is None:
+                return
+            if status.is_online:
+                schedule.failures = 0
+                schedule.offline_since = None
+                schedule.circuit = CLOSED
+            else:
+                schedule.failures += 1
+                if schedule.offline_since is None:
+                    schedule.offline_since = time.time()
+                if schedule.failures >= Config.PROBE_CIRCUIT_THRESHOLD:
+                    schedule.circuit = OPEN
+            interval = self._interval(schedule, status, is_active)
+        self._schedule(server_key, interval)
+
+    def _interval(self, schedule, status, is_active):
+        if schedule.circuit == OPEN:
+            # Каждая проба при разомкнутой цепи — пробная (half-open); успех сразу замыкает цепь
+            exponent = schedule.failures - Config.PROBE_CIRCUIT_THRESHOLD + 1
+            return min(Config.MONITORING_INTERVAL * (2 ** exponent), Config.PROBE_MAX_BACKOFF)
+        if is_active or not status.is_online:
+            return Config.PROBE_FAST_INTERVAL
+        # Подозрительный — недавно сменивший состояние. Остановленные боты резерва — норма (active_standby
+        # гасит их на всех серверах, кроме активного), по ним частый опрос не включается
+        if time.time() - status.changed_at < Config.MONITORING_INTERVAL:
+            return Config.PROBE_FAST_INTERVAL
+        return Config.MONITORING_INTERVAL
+
+    def _schedule(self, server_key, interval):
+        jitter = interval * Config.PROBE_JITTER * (2 * random.random() - 1)
+        with self.lock:
+            schedule = self.servers.get(server_key)
+            if schedule is None:
+                return
+            schedule.interval = interval
+            schedule.next_probe = self.clock() + interval + jitter
+            schedule.next_probe_at = time.time() + interval + jitter
+            heapq.heappush(self.heap, (schedule.next_probe, server_key))
+
+    def get_state(self):
+        # Отдаём абсолютное время пробы: оно меняется только при перепланировании и не раздувает дельты статуса
+        with self.lock:
+            return {
+                key: {
+                    'next_probe_at': schedule.next_probe_at,
+                    'interval': schedule.interval,
+                    'failures': schedule.failures,
+                    'offline_since': schedule.offline_since,
+                    'circuit': schedule.circuit
+                }
+                for key, schedule in self.servers.items()
+            }
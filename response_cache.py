@@ -0,0 +1,59 @@
+import gzip
+import hashlib
+import json
+import threading
+from flask import Response, request
+import metrics
+
+GZIP_MIN_SIZE = 512  # байт; меньшие ответы не сжимаем
+
+
+class _Entry:
+    __slots__ = ('version', 'body', 'gzipped', 'etag')
+
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+        compressed = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_SIZE else None
+        self.gzipped = compressed if compressed is not None and len(compressed) < len(body) else None
+        # ETag по содержимому одинаков во всех воркерах, куда бы ни попал следующий опрос
+        self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class ResponseCache:
+    """Кэш JSON-ответов чтения: сериализация и gzip один раз на версию состояния, ETag и 304"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def _entry(self, key, version, build):
+        entry = self.entries.get(key)
+        if entry is not None and entry.version == version:
+            metrics.RESPONSE_CACHE_TOTAL.inc(key, 'hit')
+            return entry
+        # Сборку под блокировкой не держим: при гонке два потока соберут одно и то же, победит последний
+        body = json.dumps(build(), ensure_ascii=False, default=str).encode('utf-8')
+        entry = _Entry(version, body)
+        with self.lock:
+            self.entries[key] = entry
+        metrics.RESPONSE_CACHE_TOTAL.inc(key, 'miss')
+        return entry
+
+    def respond(self, key, version, build):
+        entry = self._entry(key, version, build)
+        # У сжатого и несжатого представлений разные ETag: валидатор одного не должен давать 304 для другого
+        use_gzip = entry.gzipped is not None and 'gzip' in request.accept_encodings
+        etag = f'{entry.etag}-gzip' if use_gzip else entry.etag
+        if request.if_none_match.contains(etag):
+            metrics.RESPONSE_CACHE_TOTAL.inc(key, 'not_modified')
+            response = Response(status=304)
+        elif use_gzip:
+            response = Response(entry.gzipped, mimetype='application/json')
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(entry.body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
@@ -0,0 +1,144 @@
+import threading
+import time
+from config import Config
+
+RESTART = 'restart'
+BACKOFF = 'backoff'
+CRASH_LOOP = 'crash_loop'
+IN_FLIGHT = 'in_flight'
+LIMIT = 'limit'
+
+
+class _RestartState:
+    __slots__ = ('attempts', 'fast_failures', 'last_attempt', 'finished_at', 'awaiting', 'next_allowed',
+                 'crash_loop', 'in_flight', 'decision')
+
+    def __init__(self):
+        self.attempts = 0
+        self.fast_failures = 0
+        self.last_attempt = None
+        self.finished_at = None
+        self.awaiting = False
+        self.next_allowed = 0.0
+        self.crash_loop = False
+        self.in_flight = False
+        self.decision = None
+
+
+class RestartPolicy:
+    """Решения автоперезапуска по истории каждого бота (ключ — (server, bot)).
+
+    Падение вскоре после перезапуска считается быстрым отказом: задержка до следующей попытки растёт
+    экспоненциально, после BOT_CRASH_LOOP_THRESHOLD отказов подряд бот помечается как crash-loop
+    и больше не перезапускается автоматически. Бот, проработавший BOT_RESTART_STABLE_SECONDS, начинает с чистой истории.
+    """
+
+    def __init__(self, max_concurrent=None, clock=time.time):
+        self.max_concurrent = max_concurrent or Config.BOT_RESTART_MAX_CONCURRENT
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.states = {}
+        self.in_flight = 0
+
+    def select(self, candidates):
+        """Из остановленных ботов выбирает те, что перезапускаются сейчас; возвращает (к запуску, новые crash-loop).
+
+        candidates — пары (key, checked_at): время проверки, показавшей бот остановленным.
+        """
+        now = self.clock()
+        to_restart = []
+        looping = []
+        with self.lock:
+            for key, checked_at in candidates:
+                state = self.states.get(key)
+                if state is None:
+                    state = self.states[key] = _RestartState()
+                if state.in_flight:
+                    state.decision = IN_FLIGHT
+                    continue
+                if state.crash_loop:
+                    state.decision = CRASH_LOOP
+                    continue
+                if state.awaiting:
+                    if checked_at <= state.finished_at:
+                        # Статус снят до окончания запуска и о результате попытки ещё ничего не говорит
+                        state.decision = IN_FLIGHT
+                        continue
+                    state.awaiting = False
+                    # Бот снова лежит вскоре после попытки — быстрый отказ
+                    if checked_at - state.last_attempt < Config.BOT_RESTART_STABLE_SECONDS:
+                        state.fast_failures += 1
+                    if state.fast_failures >= Config.BOT_CRASH_LOOP_THRESHOLD:
+                        state.crash_loop = True
+                        state.decision = CRASH_LOOP
+                        looping.append(key)
+                        continue
+                if now < state.next_allowed:
+                    state.decision = BACKOFF
+                    continue
+                if self.in_flight >= self.max_concurrent:
+                    state.decision = LIMIT
+                    continue
+                delay = Config.BOT_RESTART_BACKOFF_BASE * (2 ** state.fast_failures)
+                state.next_allowed = now + min(delay, Config.BOT_RESTART_BACKOFF_MAX)
+                state.last_attempt = now
+                state.attempts += 1
+                state.in_flight = True
+                state.awaiting = True
+                state.decision = RESTART
+                self.in_flight += 1
+                to_restart.append(key)
+        return to_restart, looping
+
+    def finish(self, key):
+        with self.lock:
+            state = self.states.get(key)
+            if state is not None and state.in_flight:
+                state.in_flight = False
+                state.finished_at = self.clock()
+                self.in_flight -= 1
+
+    def record_running(self, key):
+        # Проработавший достаточно долго бот забывает прошлые отказы
+        with self.lock:
+            state = self.states.get(key)
+            if state is None or state.in_flight:
+                return
+            if state.last_attempt is None or self.clock() - state.last_attempt >= Config.BOT_RESTART_STABLE_SECONDS:
+                del self.states[key]
+
+    def reset(self, key):
+        # Ручная команда оператора снимает backoff и отметку crash-loop
+        with self.lock:
+            state = self.states.get(key)
+            if state is not None and not state.in_flight:
+                del self.states[key]
+
+    def forget(self, servers):
+        # История ботов, убранных из топологии; незавершённая попытка освобождает место в пределе параллельности
+        with self.lock:
+            for key in list(self.states):
+                server_key, bot_id = key
+                if server_key in servers and bot_id in servers[server_key]['bots']:
+                    continue
+                if self.states.pop(key).in_flight:
+                    self.in_flight -= 1
+
+    def get_state(self):
+        with self.lock:
+            bots = {}
+            for (server_key, bot_id), state in self.states.items():
+                bots.setdefault(server_key, {})[bot_id] = {
+                    'decision': state.decision,
+                    'attempts': state.attempts,
+                    'fast_failures': state.fast_failures,
+                    'last_attempt': state.last_attempt,
+                    'next_allowed': state.next_allowed or None,
+                    'crash_loop': state.crash_loop
+                }
+            return {
+                'in_flight': self.in_flight,
+                'max_concurrent': self.max_concurrent,
+                'crash_looping': sorted(f'{server_key}/{bot_id}' for (server_key, bot_id), state in self.states.items() if state.crash_loop),
+                'bots': bots
+            }
@@ -1,236 +1,688 @@
+import math
 import requests
 import time
 import threading
 import logging
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from config import Config
+from agent_client import AgentClient
+from failover import FailoverController
+from status_stream import StatusBroadcaster
+from history import ProbeHistory
+from failover_planner import FailoverPlanner
+from probe_scheduler import ProbeScheduler
+from notifier import NotificationDispatcher, create_transport
+from placement import PlacementEngine, ACTIVE_ACTIVE
+from heartbeat import HeartbeatTracker
+from bot_jobs import BotJobQueue, SwitchGate
+from status_model import ServerStatus
+from restart_policy import RestartPolicy
+from tracing import FailoverTrace, TraceStore
+from event_journal import EventJournal
+import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+BOT_ACTION_TEXT = {
+    'start': ('запущен', 'запуска'),
+    'stop': ('остановлен', 'остановки'),
+    'warm': ('прогрет', 'прогрева'),
+    'activate': ('активирован', 'активации')
+}
+
+# Поля, которые рисует дашборд: только они уходят в поток статуса. Время и длительность каждой пробы,
+# расписание, heartbeat и очереди меняются на каждом цикле и остаются в /api/status
+STREAM_FIELDS = ('active_server', 'is_monitoring', 'auto_restart_enabled')
+STREAM_SERVER_FIELDS = ('status', 'bots_status', 'all_bots_running', 'changed_at', 'error', 'source')
+
+def supports_warm(bot_config):
+    return 'warm_command' in bot_config and 'activate_command' in bot_config
+
 class ServerMonitor:
-    def __init__(self):
+    def __init__(self, agent_client=None, notifier=None, journal=None):
+        self.agent_client = agent_client or AgentClient()
+        self.journal = journal or EventJournal()
+        self.notifier = notifier or NotificationDispatcher(create_transport())
         self.servers_status = {}
+        self.status_lock = threading.Lock()
         self.active_server = None
         self.monitoring_thread = None
         self.is_monitoring = False
         self.auto_restart_enabled = True
-        self.failover_lock = threading.Lock()
         self.last_switch_time = None
-        self.failover_in_progress = False
+        self.recent_switches = deque(maxlen=Config.SWITCH_HISTORY_SIZE)
+        self.failover_planner = FailoverPlanner(Config.SERVERS)
+        self.probe_scheduler = ProbeScheduler(Config.SERVERS)
+        self.placement_mode = Config.PLACEMENT_MODE
+        self.placement = PlacementEngine()
+        # Переносы и остановки лишних копий в пуле команд: бот -> (futures переносов, futures остановок)
+        self.placement_tasks = {}
+        self.warm_standby = Config.WARM_STANDBY
+        self.warm_server = None
+        self.failover_traces = TraceStore()
+        self.recovery_samples = {
+            'warm': deque(maxlen=Config.RECOVERY_SAMPLES),
+            'cold': deque(maxlen=Config.RECOVERY_SAMPLES)
+        }
+        self.heartbeats = HeartbeatTracker()
+        self.bot_jobs = BotJobQueue()
+        # Переключения (ручные и автоматические) идут по одному и не пересекаются с операциями над ботами
+        self.switch_gate = SwitchGate()
+        self.restart_policy = RestartPolicy()
+        self.pushed_servers = set()
+        # Агенты без /bots_batch (agent_url): им команды сразу уходят по одной, без лишнего запроса с ответом 404
+        self.no_batch_agents = set()
+        self.failover = FailoverController(
+            switch_callback=lambda server_key, trace: self._switch_to_server(server_key, Config.SERVERS[server_key], trace=trace),
+            resolve_callback=self._select_failover_target,
+            notify_callback=self._notify_telegram,
+            status_callback=self._publish_status
+        )
+        self.probe_executor = ThreadPoolExecutor(
+            max_workers=Config.PROBE_MAX_WORKERS,
+            thread_name_prefix='probe'
+        )
+        self.control_executor = ThreadPoolExecutor(
+            max_workers=Config.CONTROL_MAX_WORKERS,
+            thread_name_prefix='control'
+        )
+        self.last_cycle_duration = None
+        self.status_broadcaster = StatusBroadcaster()
+        self.status_listeners = []
+        self.status_version = 0
+        self.stop_event = threading.Event()
+        self.history = ProbeHistory()
         
     def start_monitoring(self):
         if self.monitoring_thread and self.monitoring_thread.is_alive():
             return
         self.is_monitoring = True
+        self.stop_event.clear()
+        # После паузы статусы устарели: первый проход опрашивает все серверы сразу
+        for server_key in Config.SERVERS:
+            self.probe_scheduler.probe_now(server_key)
         self.monitoring_thread = threading.Thread(target=self._monitoring_loop)
         self.monitoring_thread.daemon = True
         self.monitoring_thread.start()
+        self._publish_status()
         logger.info("Мониторинг серверов запущен")
         
     def stop_monitoring(self):
         self.is_monitoring = False
-        if self.monitoring_thread:
+        self.stop_event.set()
+        self.probe_scheduler.wake()
+        self.failover.cancel()
+        if self.monitoring_thread and self.monitoring_thread is not threading.current_thread():
             self.monitoring_thread.join()
+        self._publish_status()
         logger.info("Мониторинг серверов остановлен")
         
     def set_auto_restart(self, enabled):
         self.auto_restart_enabled = enabled
+        self._publish_status()
         logger.info(f"Автоперезапуск ботов: {'включен' if enabled else 'выключен'}")
         
     def _monitoring_loop(self):
+        # Цикл просыпается к ближайшей пробе по расписанию, а не через фиксированный интервал
         while self.is_monitoring:
             try:
-                self._check_all_servers()
-                self._handle_failover_with_delay_and_telegram()
-                if self.auto_restart_enabled:
-                    self._handle_auto_restart()
-                time.sleep(Config.MONITORING_INTERVAL)
+                # Замолчавшие агенты сразу опрашиваются: опрос — запасной путь для тех, кто перестал слать heartbeat
+                for server_key in self.heartbeats.expired():
+                    logger.warning(f"Нет heartbeat от сервера {server_key}, переходим на опрос")
+                    self.journal.record('heartbeat_lost', server_key)
+                    self.probe_scheduler.probe_now(server_key)
+                due = self.probe_scheduler.pop_due()
+                with self.status_lock:
+                    pushed, self.pushed_servers = self.pushed_servers, set()
+                if due or pushed:
+                    cycle_started = time.monotonic()
+                    if due:
+                        self._check_servers(due)
+                    if self.placement_mode == ACTIVE_ACTIVE:
+                        self._handle_placement()
+                    else:
+                        self._handle_failover_with_delay_and_telegram()
+                        if self.warm_standby:
+                            self._maintain_warm_standby()
+                    self._publish_status()
+                    if self.auto_restart_enabled and self._active_servers().intersection(pushed.union(due)):
+                        self._handle_auto_restart()
+                    metrics.MONITORING_CYCLE_SECONDS.observe(time.monotonic() - cycle_started)
+                self.probe_scheduler.wait(self.heartbeats.seconds_until_next())
             except Exception as e:
                 logger.error(f"Ошибка в цикле мониторинга: {e}")
-                time.sleep(Config.MONITORING_INTERVAL)
+                self.stop_event.wait(Config.MONITORING_INTERVAL)
 
-    def _check_all_servers(self):
-        for server_key, server_config in Config.SERVERS.items():
-            status = self._check_server_health(server_config)
-            self.servers_status[server_key] = status
-            logger.info(f"Сервер {server_config['name']}: {status['status']}")
+    def _check_servers(self, server_keys):
+        # Опрашиваем подошедшие по расписанию серверы параллельно, пачка ограничена общим дедлайном
+        started = time.monotonic()
+        servers = Config.SERVERS
+        futures = {
+            self.probe_executor.submit(self._timed_check, server_key, servers[server_key]): server_key
+            for server_key in server_keys
+            if server_key in servers
+        }
+        done, _ = wait(futures, timeout=Config.PROBE_CYCLE_DEADLINE)
+        checked = {}
+        for future, server_key in futures.items():
+            if future not in done:
+                if future.cancel():
+                    # Проба так и не начиналась (пул занят зависшими агентами): о сервере это ничего не говорит,
+                    # прежний статус сохраняется, проба ставится в очередь заново
+                    self.probe_scheduler.probe_now(server_key)
+                    continue
+                checked[server_key] = ServerStatus.failed(
+                    'offline', f"Превышен дедлайн цикла опроса ({Config.PROBE_CYCLE_DEADLINE} с)",
+                    self.servers_status.get(server_key)
+                )
+                continue
+            try:
+                checked[server_key] = future.result()
+            except Exception as e:
+                checked[server_key] = ServerStatus.failed('offline', str(e), self.servers_status.get(server_key))
+        changed = self._apply_statuses(checked)
+        self.last_cycle_duration = time.monotonic() - started
+        for server_key in changed:
+            logger.info(f"Сервер {servers[server_key]['name']}: {checked[server_key].status}")
+        logger.info(f"Опрос {len(checked)} серверов завершён за {self.last_cycle_duration:.2f} с")
+
+    def _apply_statuses(self, checked):
+        """Применяет пробы и возвращает серверы, чьё состояние изменилось.
 
-    def _check_server_health(self, server_config):
+        Неизменившаяся проба возвращает прежний объект статуса (обновлено только время), словарь при этом не пересобирается.
+        """
+        servers = Config.SERVERS
+        with self.status_lock:
+            previous = self.servers_status
+            changed = {
+                server_key for server_key, status in checked.items()
+                if server_key in servers and previous.get(server_key) is not status
+            }
+            if changed:
+                # Статус заменяется целиком, чтобы читатели не видели частично обновлённую пачку
+                self.servers_status = {
+                    server_key: checked[server_key] if server_key in changed else previous[server_key]
+                    for server_key in servers
+                    if server_key in changed or server_key in previous
+                }
+        for server_key in changed:
+            status = checked[server_key]
+            old = previous.get(server_key)
+            self.journal.record(
+                'status', server_key, status=status.status, previous=old.status if old is not None else None,
+                all_bots_running=status.all_bots_running,
+                stopped_bots=sorted(bot_id for bot_id, bot in status.bots.items() if not bot.running),
+                error=status.error, source=status.source
+            )
+        checked_at = time.time()
+        # Тёплый резерв опрашивается так же часто, как активный сервер
+        watched = self._active_servers()
+        if self.warm_server is not None:
+            watched.add(self.warm_server)
+        for server_key, status in checked.items():
+            self.history.record(server_key, status, checked_at)
+            self.failover_planner.update(server_key, status)
+            self.probe_scheduler.record(server_key, status, server_key in watched)
+            if self.heartbeats.is_tracking(server_key):
+                # Пока агент шлёт heartbeat, опрос нужен лишь изредка, для сверки
+                self.probe_scheduler.defer(server_key, Config.HEARTBEAT_POLL_INTERVAL)
+        return changed
+
+    def validate_heartbeat(self, server_key, payload):
+        # Проверка до записи в общее хранилище: некорректный heartbeat не должен дойти до цикла ведущего
+        if server_key not in Config.SERVERS:
+            raise ValueError(f"Неизвестный сервер: {server_key}")
+        if not isinstance(payload.get('bots_status', {}), dict):
+            raise ValueError("bots_status должен быть объектом")
+        interval = payload.get('interval')
+        if interval is not None and (isinstance(interval, bool) or not isinstance(interval, (int, float))
+                                     or not math.isfinite(interval) or interval <= 0):
+            raise ValueError("interval должен быть положительным числом секунд")
+
+    def receive_heartbeat(self, server_key, payload):
+        """Статус, присланный агентом: заменяет очередную пробу и откладывает опрос сервера"""
+        self.validate_heartbeat(server_key, payload)
+        status = ServerStatus.from_health(payload, previous=self.servers_status.get(server_key), source='heartbeat')
+        self.heartbeats.record(server_key, payload.get('interval'))
+        changed = self._apply_statuses({server_key: status})
+        # Цикл мониторинга будим, только если что-то изменилось или на активном сервере стоят боты
+        if changed or (server_key in self._active_servers() and not status.all_bots_running):
+            with self.status_lock:
+                self.pushed_servers.add(server_key)
+            self.probe_scheduler.wake()
+        metrics.HEARTBEAT_TOTAL.inc(server_key)
+
+    def _timed_check(self, server_key, server_config):
+        started = time.monotonic()
+        status = self._check_server_health(
+            server_config, self.probe_scheduler.probe_timeout(server_key), self.servers_status.get(server_key)
+        )
+        metrics.PROBE_SECONDS.observe(time.monotonic() - started, server_key)
+        metrics.PROBE_TOTAL.inc(server_key, status.status)
+        return status
+
+    def _check_server_health(self, server_config, timeout=None, previous=None):
         try:
-            response = requests.get(
-                f"{server_config['agent_url']}/health",
-                timeout=Config.HEALTH_CHECK_TIMEOUT
+            response = self.agent_client.get(
+                server_config['agent_url'],
+                '/health',
+                timeout=timeout or Config.HEALTH_CHECK_TIMEOUT
             )
             if response.status_code == 200:
-                data = response.json()
-                return {
-                    'status': 'online',
-                    'bots_status': data.get('bots_status', {}),
-                    'all_bots_running': data.get('all_bots_running', False),
-                    'last_check': datetime.now().isoformat(),
-                    'response_time': response.elapsed.total_seconds(),
-                    'details': data
-                }
+                return ServerStatus.from_health(response.json(), response.elapsed.total_seconds(), previous)
             else:
-                return {
-                    'status': 'error',
-                    'bots_status': {},
-                    'all_bots_running': False,
-                    'last_check': datetime.now().isoformat(),
-                    'error': f"HTTP {response.status_code}"
-                }
+                return ServerStatus.failed('error', f"HTTP {response.status_code}", previous)
         except requests.exceptions.RequestException as e:
-            return {
-                'status': 'offline',
-                'bots_status': {},
-                'all_bots_running': False,
-                'last_check': datetime.now().isoformat(),
-                'error': str(e)
-            }
+            return ServerStatus.failed('offline', str(e), previous)
+
+    def _active_servers(self):
+        if self.placement_mode == ACTIVE_ACTIVE:
+            return self.placement.active_servers()
+        return {self.active_server} if self.active_server else set()
+
+    def _bot_assignments(self):
+        # Где должен работать каждый бот: в active-active — по размещению, иначе все боты на активном сервере
+        if self.placement_mode == ACTIVE_ACTIVE:
+            return self.placement.get_state()['assignments']
+        server_config = Config.SERVERS.get(self.active_server)
+        if server_config is None:
+            return {}
+        return {bot_id: self.active_server for bot_id in server_config['bots']}
 
     def _handle_auto_restart(self):
-        for server_key, server_config in Config.SERVERS.items():
-            server_status = self.servers_status.get(server_key, {})
-            if server_key != self.active_server:
+        # Решения принимает RestartPolicy (backoff, crash-loop, предел параллельности); запуск идёт в очереди задач
+        candidates = []
+        for bot_id, server_key in self._bot_assignments().items():
+            server_status = self.servers_status.get(server_key)
+            if server_status is None or not server_status.is_online:
                 continue
-            if server_status.get('status') != 'online':
+            if server_status.bot_running(bot_id, default=True):
+                self.restart_policy.record_running((server_key, bot_id))
                 continue
-            bots_status = server_status.get('bots_status', {})
-            for bot_id, bot_status in bots_status.items():
-                if not bot_status.get('running', False):
-                    logger.info(f"Автоперезапуск бота {bot_id} на сервере {server_config['name']}")
-                    self.start_specific_bot(server_key, bot_id)
+            candidates.append(((server_key, bot_id), server_status.checked_at))
+        if not candidates:
+            return
+        to_restart, looping = self.restart_policy.select(candidates)
+        for server_key, bot_id in looping:
+            logger.error(f"Бот {bot_id} на сервере {Config.SERVERS[server_key]['name']} падает после каждого запуска, автоперезапуск остановлен")
+            self._notify_telegram(f"Бот {bot_id} на сервере {Config.SERVERS[server_key]['name']} в crash-loop: автоперезапуск остановлен до ручного запуска")
+            metrics.AUTO_RESTART_DECISIONS_TOTAL.inc('crash_loop')
+            self.journal.record('crash_loop', server_key, bot_id)
+        for server_key, bot_id in to_restart:
+            logger.info(f"Автоперезапуск бота {bot_id} на сервере {Config.SERVERS[server_key]['name']}")
+            metrics.AUTO_RESTART_TOTAL.inc(server_key, bot_id)
+            metrics.AUTO_RESTART_DECISIONS_TOTAL.inc('restart')
+            self.journal.record('auto_restart', server_key, bot_id)
+            self.submit_bot_job(server_key, bot_id, 'start', trigger='auto')
+        skipped = len(candidates) - len(to_restart) - len(looping)
+        if skipped:
+            metrics.AUTO_RESTART_DECISIONS_TOTAL.inc('deferred', amount=skipped)
 
-    def _handle_failover_with_delay_and_telegram(self):
-        with self.failover_lock:
-            if self.failover_in_progress:
-                return
-            self.failover_in_progress = True
+    def _handle_placement(self):
+        # Переезжают только боты недоступных серверов; переезды идут в пуле команд, цикл мониторинга их не ждёт.
+        # Пока у бота есть незавершённые команды, новых для него не планируем; результаты собираются на следующих циклах
+        self._collect_placement_tasks()
+        moves, strays = self.placement.plan(Config.SERVERS, self.servers_status)
+        tasks = {}
+        for bot_id, source, target in moves:
+            if bot_id not in self.placement_tasks:
+                tasks.setdefault(bot_id, ([], []))[0].append(
+                    self.control_executor.submit(self._move_bot, bot_id, source, target)
+                )
+        for bot_id, server_key in strays:
+            if bot_id not in self.placement_tasks:
+                tasks.setdefault(bot_id, ([], []))[1].append(
+                    self.control_executor.submit(self._control_bot, server_key, Config.SERVERS[server_key], bot_id, 'stop')
+                )
+        self.placement_tasks.update(tasks)
+
+    def _collect_placement_tasks(self):
+        moves = moved = stopped = 0
+        for bot_id, (move_futures, stop_futures) in list(self.placement_tasks.items()):
+            if not all(future.done() for future in move_futures + stop_futures):
+                continue
+            del self.placement_tasks[bot_id]
+            moves += len(move_futures)
+            moved += sum(1 for future in move_futures if future.exception() is None and future.result())
+            stopped += sum(1 for future in stop_futures if future.exception() is None and future.result())
+        if moves or stopped:
+            logger.info(f"Размещение ботов: перенесено {moved} из {moves}, остановлено лишних копий: {stopped}")
+
+    def _move_bot(self, bot_id, source, target):
+        started = time.monotonic()
+        servers = Config.SERVERS
+        success = False
+        trace = FailoverTrace('placement', target, source, bot=bot_id)
         try:
-            # Получаем список серверов по приоритету
-            servers_priority = sorted(Config.SERVERS.items(), key=lambda x: x[1]['id'])
-            primary_key = None
-            backup_key = None
-            third_key = None
-            for key, cfg in servers_priority:
-                if cfg['is_primary']:
-                    primary_key = key
-                elif backup_key is None:
-                    backup_key = key
-                else:
-                    third_key = key
-            # Получаем статусы
-            primary_status = self.servers_status.get(primary_key, {})
-            backup_status = self.servers_status.get(backup_key, {})
-            third_status = self.servers_status.get(third_key, {})
-            now = time.time()
-            # Если primary работает и все боты запущены
-            if (primary_status.get('status') == 'online' and primary_status.get('all_bots_running', False)):
-                if self.active_server != primary_key:
-                    self._notify_telegram(f"Переключение обратно на основной сервер: {Config.SERVERS[primary_key]['name']} через 1 минуту...")
-                    time.sleep(60)
-                    self._switch_to_server(primary_key, Config.SERVERS[primary_key])
-            # Если primary не работает, но backup работает
-            elif (primary_status.get('status') != 'online' or not primary_status.get('all_bots_running', False)) and (backup_status.get('status') == 'online' and backup_status.get('all_bots_running', False)):
-                if self.active_server != backup_key:
-                    self._notify_telegram(f"Основной сервер недоступен. Переключение на резервный сервер 2: {Config.SERVERS[backup_key]['name']} через 1 минуту...")
-                    time.sleep(60)
-                    self._switch_to_server(backup_key, Config.SERVERS[backup_key])
-            # Если ни primary, ни backup не работают, но работает третий
-            elif (primary_status.get('status') != 'online' or not primary_status.get('all_bots_running', False)) and (backup_status.get('status') != 'online' or not backup_status.get('all_bots_running', False)) and (third_status.get('status') == 'online' and third_status.get('all_bots_running', False)):
-                if self.active_server != third_key:
-                    self._notify_telegram(f"Основной и резервный 2 серверы недоступны. Переключение на резервный сервер 3: {Config.SERVERS[third_key]['name']} через 1 минуту...")
-                    time.sleep(60)
-                    self._switch_to_server(third_key, Config.SERVERS[third_key])
+            # Сначала гасим бот на остальных доступных серверах, чтобы не было двух копий
+            stop_span = trace.start_span('stop_others')
+            for server_key, server_config in servers.items():
+                if server_key == target or bot_id not in server_config['bots']:
+                    continue
+                server_status = self.servers_status.get(server_key)
+                if server_status is not None and server_status.is_online:
+                    self._control_bot(server_key, server_config, bot_id, 'stop', stop_span)
+            stop_span.finish(True)
+            success = self._control_bot(target, servers[target], bot_id, 'start', trace.start_span('start_target', server=target))
+            if success:
+                self.placement.commit(bot_id, target)
+                if source is not None:
+                    source_name = servers[source]['name'] if source in servers else source
+                    self._notify_telegram(f"Бот {bot_id} перенесён с сервера {source_name} на {servers[target]['name']}")
+        except Exception as e:
+            logger.error(f"Ошибка переноса бота {bot_id} на сервер {target}: {e}")
         finally:
-            self.failover_in_progress = False
+            trace.finish(success)
+            self.failover_traces.add(trace)
+            self.recent_switches.append({
+                'server': target,
+                'bot': bot_id,
+                'from': source,
+                'trigger': 'placement',
+                'at': time.time(),
+                'duration': time.monotonic() - started,
+                'success': success,
+                'trace_id': trace.trace_id
+            })
+            self.journal.record(
+                'placement_move', target, bot_id, source=source, success=success,
+                duration=time.monotonic() - started, trace_id=trace.trace_id
+            )
+            metrics.PLACEMENT_MOVES_TOTAL.inc(target, 'success' if success else 'error')
+        return success
+
+    def _handle_failover_with_delay_and_telegram(self):
+        # Решение о переключении передаётся машине состояний, ожидание идёт по таймеру
+        target, message = self._select_failover_target()
+        self.failover.update(target, message)
+
+    def _select_failover_target(self):
+        # Лучший здоровый сервер берётся из индекса планировщика без сортировки на каждом цикле
+        target = self.failover_planner.best()
+        if target is None or target == self.active_server:
+            return None, None
+        grace = self.failover.grace_period
+        name = Config.SERVERS[target]['name']
+        if target == self.failover_planner.top_key:
+            return target, f"Переключение обратно на основной сервер: {name} через {grace} с..."
+        active_name = Config.SERVERS[self.active_server]['name'] if self.active_server in Config.SERVERS else 'нет'
+        priority = self.failover_planner.priority_of(target)
+        return target, f"Активный сервер ({active_name}) недоступен или не приоритетен. Переключение на резервный сервер {name} (приоритет {priority}) через {grace} с..."
 
     def _notify_telegram(self, message):
-        token = Config.TELEGRAM_BOT_TOKEN
-        chat_id = Config.TELEGRAM_CHAT_ID
-        if not token or not chat_id:
-            logger.warning("TELEGRAM_BOT_TOKEN или TELEGRAM_CHAT_ID не заданы!")
+        # Только постановка в очередь: отправка, склейка и повторы идут в фоновом потоке
+        self.notifier.notify(message)
+
+    def _warm_standby_target(self):
+        # Следующий по приоритету доступный сервер после активного
+        for server_key in self.failover_planner.ordered():
+            if server_key == self.active_server:
+                continue
+            status = self.servers_status.get(server_key)
+            if status is not None and status.is_online:
+                return server_key
+        return None
+
+    def _maintain_warm_standby(self):
+        """Держит ботов резервного сервера прогретыми: при переключении их остаётся только активировать"""
+        target = self._warm_standby_target()
+        previous = self.warm_server
+        if target != previous:
+            self.warm_server = target
+            logger.info(f"Тёплый резерв: {target or 'нет'} (был {previous or 'нет'})")
+            if previous in Config.SERVERS and previous != self.active_server:
+                for bot_id, bot_config in Config.SERVERS[previous]['bots'].items():
+                    if supports_warm(bot_config):
+                        self._submit_standby_command(previous, bot_id, 'stop')
+            if target is not None:
+                self.probe_scheduler.probe_now(target)
+        if target is None:
             return
-        url = f"https://api.telegram.org/bot{token}/sendMessage"
-        try:
-            requests.post(url, json={"chat_id": chat_id, "text": message})
-            logger.info(f"Отправлено уведомление в Telegram: {message}")
-        except Exception as e:
-            logger.error(f"Ошибка отправки Telegram: {e}")
+        status = self.servers_status.get(target)
+        for bot_id, bot_config in Config.SERVERS[target]['bots'].items():
+            if not supports_warm(bot_config):
+                continue
+            bot = status.bots.get(bot_id)
+            if bot is not None and (bot.warm or bot.running):
+                continue
+            self._submit_standby_command(target, bot_id, 'warm')
 
-    def _switch_to_server(self, server_key, server_config):
+    def _submit_standby_command(self, server_key, bot_id, action):
+        # Через очередь задач: команды резерву не задерживают цикл мониторинга, повторные ожидающие склеиваются
+        def run():
+            with self.switch_gate.job():
+                # Пока команда ждала, резерв мог стать активным сервером: его ботов не трогаем
+                if server_key == self.active_server:
+                    logger.info(f"Команда {action} резерву для бота {bot_id} пропущена: сервер {server_key} стал активным")
+                    return False
+                return self._control_bot(server_key, Config.SERVERS[server_key], bot_id, action)
+
+        return self.bot_jobs.submit(
+            (server_key, bot_id),
+            action,
+            run,
+            server=server_key,
+            bot_id=bot_id,
+            trigger='warm_standby'
+        )
+
+    def _activate_all_bots_on_server(self, server_key, server_config, span=None):
+        # Прогретые боты только активируются, остальные запускаются с нуля; warm — если холодных запусков не было
+        status = self.servers_status.get(server_key)
+        actions = {}
+        for bot_key, bot_config in server_config['bots'].items():
+            bot = status.bots.get(bot_key) if status is not None else None
+            warm = bot is not None and bot.warm and supports_warm(bot_config)
+            actions[bot_key] = 'activate' if warm else 'start'
+        results = self._control_bots_on_server(server_key, server_config, actions, span)
+        mode = 'warm' if actions and all(action == 'activate' for action in actions.values()) else 'cold'
+        if span is not None:
+            span.finish(all(results.values()), mode=mode, bots=results)
+        return mode
+
+    def _record_recovery(self, previous_server, mode, duration):
+        # Время восстановления — от первой проверки, показавшей отказ прежнего активного сервера, до конца переключения
+        status = self.servers_status.get(previous_server) if previous_server else None
+        if status is not None and not status.is_ready:
+            duration = max(duration, time.time() - status.changed_at)
+        self.recovery_samples[mode].append(duration)
+        metrics.FAILOVER_RECOVERY_SECONDS.observe(duration, mode)
+        return duration
+
+    def _recovery_stats(self):
+        stats = {}
+        for mode, samples in self.recovery_samples.items():
+            samples = list(samples)
+            stats[mode] = {
+                'count': len(samples),
+                'last': samples[-1] if samples else None,
+                'mean': sum(samples) / len(samples) if samples else None,
+                'max': max(samples) if samples else None
+            }
+        return stats
+
+    def _switch_to_server(self, server_key, server_config, trigger='auto', trace=None):
+        # Ждём завершения начатых операций с ботами и другого переключения; новые операции ждут нас
+        with self.switch_gate.switch():
+            self._run_switch(server_key, server_config, trigger, trace)
+
+    def _run_switch(self, server_key, server_config, trigger, trace):
+        started = time.monotonic()
+        success = False
+        previous_server = self.active_server
+        mode = 'cold'
+        recovery = None
+        trace = trace or FailoverTrace(trigger)
+        trace.trigger = trigger
+        trace.target = server_key
+        trace.source = previous_server
+        if trigger == 'auto':
+            self._trace_detection(trace, previous_server)
         try:
-            for other_key, other_config in Config.SERVERS.items():
-                if other_key != server_key:
-                    self._stop_all_bots_on_server(other_config)
-            self._start_all_bots_on_server(server_config)
+            # Останавливаем боты на всех остальных серверах параллельно, затем запускаем на целевом
+            stop_span = trace.start_span('stop_others')
+            stop_futures = [
+                self.control_executor.submit(self._stop_all_bots_on_server, other_key, other_config, stop_span)
+                for other_key, other_config in Config.SERVERS.items()
+                if other_key != server_key
+            ]
+            wait(stop_futures)
+            stop_span.finish(all(future.exception() is None for future in stop_futures))
+            mode = self._activate_all_bots_on_server(server_key, server_config, trace.start_span('start_target', server=server_key))
             self.active_server = server_key
+            self.last_switch_time = time.time()
+            # Новый активный сервер сразу переходит на частый опрос
+            self.probe_scheduler.probe_now(server_key)
+            success = True
             logger.info(f"Успешно переключились на сервер: {server_config['name']}")
         except Exception as e:
             logger.error(f"Ошибка при переключении на сервер {server_config['name']}: {e}")
+        finally:
+            duration = time.monotonic() - started
+            if success:
+                recovery = self._record_recovery(previous_server if trigger == 'auto' else None, mode, duration)
+            trace.finish(success)
+            self.failover_traces.add(trace)
+            self.recent_switches.append({
+                'server': server_key,
+                'trigger': trigger,
+                'at': time.time(),
+                'duration': duration,
+                'start_mode': mode,
+                'recovery_seconds': recovery,
+                'success': success,
+                'trace_id': trace.trace_id
+            })
+            self.journal.record(
+                'switch', server_key, source=previous_server, trigger=trigger, success=success,
+                duration=duration, start_mode=mode, recovery_seconds=recovery, trace_id=trace.trace_id
+            )
+            self._publish_status()
+            metrics.FAILOVER_SECONDS.observe(duration, server_key, trigger)
+            metrics.FAILOVER_TOTAL.inc(server_key, trigger)
 
-    def _start_all_bots_on_server(self, server_config):
-        for bot_key, bot_config in server_config['bots'].items():
-            try:
-                response = requests.post(
-                    f"{server_config['agent_url']}/start_bot",
-                    json={
-                        'bot_id': bot_key,
-                        'command': bot_config['start_command']
-                    },
-                    timeout=Config.HEALTH_CHECK_TIMEOUT
-                )
-                if response.status_code == 200:
-                    logger.info(f"Бот {bot_config['name']} запущен на сервере: {server_config['name']}")
-                else:
-                    logger.error(f"Ошибка запуска бота {bot_config['name']} на сервере {server_config['name']}: {response.status_code}")
-            except Exception as e:
-                logger.error(f"Ошибка запуска бота {bot_config['name']} на сервере {server_config['name']}: {e}")
+    def _trace_detection(self, trace, server_key):
+        # Обнаружение — от первой проверки, показавшей отказ активного сервера, до решения о переключении
+        status = self.servers_status.get(server_key) if server_key else None
+        if status is None or status.is_ready:
+            return
+        trace.start_span('detection', server=server_key, start=status.changed_at).finish(
+            False, end=max(status.changed_at, trace.started_at), status=status.status, error=status.error
+        )
 
-    def _stop_all_bots_on_server(self, server_config):
-        for bot_key, bot_config in server_config['bots'].items():
-            try:
-                response = requests.post(
-                    f"{server_config['agent_url']}/stop_bot",
-                    json={
-                        'bot_id': bot_key,
-                        'command': bot_config['stop_command']
-                    },
-                    timeout=Config.HEALTH_CHECK_TIMEOUT
-                )
-                if response.status_code == 200:
-                    logger.info(f"Бот {bot_config['name']} остановлен на сервере: {server_config['name']}")
-                else:
-                    logger.error(f"Ошибка остановки бота {bot_config['name']} на сервере {server_config['name']}: {response.status_code}")
-            except Exception as e:
-                logger.error(f"Ошибка остановки бота {bot_config['name']} на сервере {server_config['name']}: {e}")
+    def _stop_all_bots_on_server(self, server_key, server_config, span=None):
+        server_span = span.child('stop', server=server_key) if span is not None else None
+        results = self._control_all_bots_on_server(server_key, server_config, 'stop', server_span)
+        if server_span is not None:
+            server_span.finish(all(results.values()), bots=results)
+        return results
 
-    def start_specific_bot(self, server_key, bot_id):
-        if server_key not in Config.SERVERS:
-            raise ValueError(f"Неизвестный сервер: {server_key}")
-        server_config = Config.SERVERS[server_key]
-        if bot_id not in server_config['bots']:
-            raise ValueError(f"Неизвестный бот: {bot_id}")
-        bot_config = server_config['bots'][bot_id]
+    def _control_all_bots_on_server(self, server_key, server_config, action, span=None):
+        return self._control_bots_on_server(server_key, server_config, {bot_key: action for bot_key in server_config['bots']}, span)
+
+    def _control_bots_on_server(self, server_key, server_config, actions, span=None):
+        # Все команды сервера уходят одним запросом /bots_batch; агенты без него получают их по одной
+        # (тогда в хронологию span попадает отдельный интервал на каждого бота)
+        bots = server_config['bots']
+        commands = [
+            {'action': action, 'bot_id': bot_key, 'command': bots[bot_key][f'{action}_command']}
+            for bot_key, action in actions.items()
+        ]
+        error_text = '/'.join(sorted({BOT_ACTION_TEXT[action][1] for action in actions.values()}))
+        if server_config['agent_url'] in self.no_batch_agents:
+            return self._control_bots_one_by_one(server_key, server_config, actions, span)
+        started = time.monotonic()
         try:
-            response = requests.post(
-                f"{server_config['agent_url']}/start_bot",
+            response = self.agent_client.post(
+                server_config['agent_url'],
+                '/bots_batch',
+                json={'commands': commands},
+                timeout=Config.HEALTH_CHECK_TIMEOUT
+            )
+        except Exception as e:
+            logger.error(f"Ошибка {error_text} ботов на сервере {server_config['name']}: {e}")
+            return self._record_bot_results(server_key, actions, started, {bot_key: False for bot_key in actions})
+        if response.status_code == 404:
+            logger.info(f"Агент сервера {server_config['name']} не поддерживает /bots_batch, команды отправляются по одной")
+            self.no_batch_agents.add(server_config['agent_url'])
+            return self._control_bots_one_by_one(server_key, server_config, actions, span)
+        if response.status_code != 200:
+            logger.error(f"Ошибка {error_text} ботов на сервере {server_config['name']}: {response.status_code}")
+            return self._record_bot_results(server_key, actions, started, {bot_key: False for bot_key in actions})
+        batch_results = response.json().get('results', {})
+        results = {}
+        for bot_key, action in actions.items():
+            done_text, bot_error_text = BOT_ACTION_TEXT[action]
+            bot_result = batch_results.get(bot_key, {})
+            results[bot_key] = bool(bot_result.get('success'))
+            if results[bot_key]:
+                logger.info(f"Бот {bots[bot_key]['name']} {done_text} на сервере: {server_config['name']}")
+            else:
+                logger.error(f"Ошибка {bot_error_text} бота {bots[bot_key]['name']} на сервере {server_config['name']}: {bot_result.get('error')}")
+        return self._record_bot_results(server_key, actions, started, results)
+
+    def _control_bots_one_by_one(self, server_key, server_config, actions, span=None):
+        # Команды ботов идут параллельно в пуле команд. Вызов может прийти из потока того же пула
+        # (остановка серверов при переключении), поэтому ещё не начатую команду выполняем сами, а не ждём:
+        # занятый пул не приводит к взаимной блокировке
+        futures = {
+            bot_key: self.control_executor.submit(self._control_bot, server_key, server_config, bot_key, action, span)
+            for bot_key, action in actions.items()
+        }
+        results = {}
+        for bot_key, future in futures.items():
+            if future.cancel():
+                results[bot_key] = self._control_bot(server_key, server_config, bot_key, actions[bot_key], span)
+            else:
+                results[bot_key] = future.result()
+        return results
+
+    def _record_bot_results(self, server_key, actions, started, results):
+        elapsed = time.monotonic() - started
+        for bot_key, success in results.items():
+            metrics.BOT_OPERATION_SECONDS.observe(elapsed, server_key, bot_key, actions[bot_key])
+            metrics.BOT_OPERATION_TOTAL.inc(server_key, bot_key, actions[bot_key], 'success' if success else 'error')
+            self.journal.record('bot_command', server_key, bot_key, action=actions[bot_key], success=success, duration=elapsed)
+        return results
+
+    def _control_bot(self, server_key, server_config, bot_key, action, span=None):
+        started = time.monotonic()
+        bot_span = span.child(action, server=server_key, bot=bot_key) if span is not None else None
+        success = self._send_bot_command(server_config, bot_key, action)
+        if bot_span is not None:
+            bot_span.finish(success)
+        return self._record_bot_results(server_key, {bot_key: action}, started, {bot_key: success})[bot_key]
+
+    def _send_bot_command(self, server_config, bot_key, action):
+        done_text, error_text = BOT_ACTION_TEXT[action]
+        bot_config = server_config['bots'][bot_key]
+        try:
+            response = self.agent_client.post(
+                server_config['agent_url'],
+                f'/{action}_bot',
                 json={
-                    'bot_id': bot_id,
-                    'command': bot_config['start_command']
+                    'bot_id': bot_key,
+                    'command': bot_config[f'{action}_command']
                 },
                 timeout=Config.HEALTH_CHECK_TIMEOUT
             )
             if response.status_code == 200:
-                logger.info(f"Бот {bot_config['name']} запущен на сервере: {server_config['name']}")
+                logger.info(f"Бот {bot_config['name']} {done_text} на сервере: {server_config['name']}")
                 return True
-            else:
-                logger.error(f"Ошибка запуска бота {bot_config['name']}: {response.status_code}")
-                return False
+            logger.error(f"Ошибка {error_text} бота {bot_config['name']} на сервере {server_config['name']}: {response.status_code}")
         except Exception as e:
-            logger.error(f"Ошибка запуска бота {bot_config['name']}: {e}")
-            return False
+            logger.error(f"Ошибка {error_text} бота {bot_config['name']} на сервере {server_config['name']}: {e}")
+        return False
+
+    def start_specific_bot(self, server_key, bot_id):
+        if server_key not in Config.SERVERS:
+            raise ValueError(f"Неизвестный сервер: {server_key}")
+        server_config = Config.SERVERS[server_key]
+        if bot_id not in server_config['bots']:
+            raise ValueError(f"Неизвестный бот: {bot_id}")
+        return self._control_bot(server_key, server_config, bot_id, 'start')
 
     def stop_specific_bot(self, server_key, bot_id):
         if server_key not in Config.SERVERS:
@@ -238,45 +690,146 @@ class ServerMonitor:
         server_config = Config.SERVERS[server_key]
         if bot_id not in server_config['bots']:
             raise ValueError(f"Неизвестный бот: {bot_id}")
-        bot_config = server_config['bots'][bot_id]
-        try:
-            response = requests.post(
-                f"{server_config['agent_url']}/stop_bot",
-                json={
-                    'bot_id': bot_id,
-                    'command': bot_config['stop_command']
-                },
-                timeout=Config.HEALTH_CHECK_TIMEOUT
-            )
-            if response.status_code == 200:
-                logger.info(f"Бот {bot_config['name']} остановлен на сервере: {server_config['name']}")
-                return True
-            else:
-                logger.error(f"Ошибка остановки бота {bot_config['name']}: {response.status_code}")
-                return False
-        except Exception as e:
-            logger.error(f"Ошибка остановки бота {bot_config['name']}: {e}")
-            return False
+        return self._control_bot(server_key, server_config, bot_id, 'stop')
 
     def restart_specific_bot(self, server_key, bot_id):
+        # Выполняется в потоке очереди задач, пауза между stop и start не держит веб-воркер
         logger.info(f"Перезапуск бота {bot_id} на сервере {server_key}")
         stop_success = self.stop_specific_bot(server_key, bot_id)
         if stop_success:
-            time.sleep(2)
+            time.sleep(Config.BOT_RESTART_DELAY)
             return self.start_specific_bot(server_key, bot_id)
         return False
 
+    def submit_bot_job(self, server_key, bot_id, action, trigger='manual'):
+        """Операция с ботом в фоне: задачи одного бота идут по очереди, повторные ожидающие склеиваются"""
+        if server_key not in Config.SERVERS:
+            raise ValueError(f"Неизвестный сервер: {server_key}")
+        if bot_id not in Config.SERVERS[server_key]['bots']:
+            raise ValueError(f"Неизвестный бот: {bot_id}")
+        handlers = {
+            'start': self.start_specific_bot,
+            'stop': self.stop_specific_bot,
+            'restart': self.restart_specific_bot
+        }
+        key = (server_key, bot_id)
+        if trigger != 'auto' and action != 'stop':
+            self.restart_policy.reset(key)
+
+        def run():
+            try:
+                with self.switch_gate.job():
+                    # Автозапуск, поставленный до переключения, не должен поднять бот на сервере, который уже не активен
+                    if trigger == 'auto' and self._bot_assignments().get(bot_id) != server_key:
+                        logger.info(f"Автоперезапуск бота {bot_id} на сервере {server_key} отменён: бот закреплён за другим сервером")
+                        return False
+                    return handlers[action](server_key, bot_id)
+            finally:
+                if trigger == 'auto':
+                    self.restart_policy.finish(key)
+
+        return self.bot_jobs.submit(
+            key,
+            action,
+            run,
+            # Автозапуск не склеивается с ручной задачей: его завершение должна увидеть RestartPolicy
+            coalesce=trigger != 'auto',
+            server=server_key,
+            bot_id=bot_id,
+            trigger=trigger
+        )
+
+    def submit_switch(self, server_key):
+        if server_key not in Config.SERVERS:
+            raise ValueError(f"Неизвестный сервер: {server_key}")
+        if self.placement_mode == ACTIVE_ACTIVE:
+            raise ValueError("В режиме active_active боты распределены по серверам, ручное переключение недоступно")
+        return self.bot_jobs.submit('switch', 'switch', lambda: self.manual_switch(server_key), target=server_key, server=server_key)
+
     def get_status(self):
         return {
-            'servers': self.servers_status,
+            'servers': {
+                server_key: server_status.to_dict(include_details=True)
+                for server_key, server_status in self.servers_status.items()
+            },
             'active_server': self.active_server,
             'is_monitoring': self.is_monitoring,
-            'auto_restart_enabled': self.auto_restart_enabled
+            'auto_restart_enabled': self.auto_restart_enabled,
+            'last_cycle_duration': self.last_cycle_duration,
+            'failover': self.failover.get_state(),
+            'failover_plan': self.failover_planner.get_plan(),
+            'probe_schedule': self.probe_scheduler.get_state(),
+            'heartbeats': self.heartbeats.get_state(),
+            'placement': dict(self.placement.get_state(), mode=self.placement_mode, in_flight=sorted(self.placement_tasks)),
+            'warm_standby': {
+                'enabled': self.warm_standby,
+                'server': self.warm_server,
+                'recovery_seconds': self._recovery_stats()
+            },
+            'notifications': self.notifier.get_stats(),
+            'bot_jobs': dict(self.bot_jobs.get_stats(), switching=self.switch_gate.is_switching),
+            'auto_restart': self.restart_policy.get_state(),
+            'event_journal': self.journal.get_stats(),
+            'recent_switches': list(self.recent_switches)
         }
     
+    def restore_state(self, servers_status, active_server, auto_restart_enabled, recent_switches, placement_assignments=None):
+        # Тёплый старт: статус, активный сервер и размещение ботов из снимка, чтобы не переключаться заново
+        self.servers_status = {k: ServerStatus.from_dict(v) for k, v in servers_status.items() if k in Config.SERVERS}
+        self.active_server = active_server if active_server in Config.SERVERS else None
+        self.auto_restart_enabled = auto_restart_enabled
+        self.recent_switches.extend(recent_switches)
+        self.failover_planner.rebuild(Config.SERVERS, self.servers_status)
+        if placement_assignments:
+            self.placement.restore(placement_assignments, Config.SERVERS)
+
+    def apply_topology(self, topology, previous):
+        # Горячая перезагрузка парка: расписание проб, индекс переключения и статусы приводятся к новому списку
+        servers = topology.servers
+        with self.status_lock:
+            self.servers_status = {k: v for k, v in self.servers_status.items() if k in servers}
+        self.probe_scheduler.sync(servers)
+        self.heartbeats.forget(servers)
+        self.history.forget(servers)
+        self.restart_policy.forget(servers)
+        self.placement.forget(servers)
+        # После перезагрузки топологии (например, после обновления агентов) /bots_batch пробуется заново
+        self.no_batch_agents.clear()
+        self.failover_planner.rebuild(servers, self.servers_status)
+        for server_key, server_config in servers.items():
+            if previous.servers.get(server_key) != server_config:
+                self.probe_scheduler.probe_now(server_key)
+        if self.active_server is not None and self.active_server not in servers:
+            logger.warning(f"Активный сервер {self.active_server} удалён из топологии")
+            self.active_server = None
+        if self.warm_server is not None and self.warm_server not in servers:
+            # Резерв пересчитается на следующем цикле; до тех пор переключение не опирается на удалённый сервер
+            logger.warning(f"Сервер тёплого резерва {self.warm_server} удалён из топологии")
+            self.warm_server = None
+        self._publish_status()
+
+    def public_status(self, status):
+        # Поток для дашборда: дельта появляется, только когда меняется то, что видно на экране
+        public = {key: status.get(key) for key in STREAM_FIELDS}
+        public['servers'] = {
+            server_key: {k: v for k, v in server_status.items() if k in STREAM_SERVER_FIELDS}
+            for server_key, server_status in status['servers'].items()
+        }
+        return public
+
+    def _publish_status(self):
+        self.status_version += 1
+        status = self.get_status()
+        for listener in self.status_listeners:
+            listener(status)
+        self.status_broadcaster.publish(self.public_status(status))
+
     def manual_switch(self, server_key):
         if server_key not in Config.SERVERS:
             raise ValueError(f"Неизвестный сервер: {server_key}")
+        if self.placement_mode == ACTIVE_ACTIVE:
+            raise ValueError("В режиме active_active боты распределены по серверам, ручное переключение недоступно")
         server_config = Config.SERVERS[server_key]
-        self._switch_to_server(server_key, server_config)
+        self.failover.cancel()
+        self._switch_to_server(server_key, server_config, trigger='manual')
         return True 
\ No newline at end of file
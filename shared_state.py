@@ -0,0 +1,397 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'monitor'
+STOP_TIMEOUT = 5  # секунды на завершение цикла координации при остановке
+
+
+class SharedState:
+    """Общее для всех воркеров gunicorn состояние в SQLite: аренда ведущего, статус и очередь команд"""
+
+    def __init__(self, path=None):
+        self.path = path or Config.SHARED_STATE_PATH
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS lease (name TEXT PRIMARY KEY, holder TEXT, expires_at REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS status (key TEXT PRIMARY KEY, version INTEGER, payload TEXT)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS commands ('
+                'id TEXT PRIMARY KEY, name TEXT, args TEXT, created_at REAL, '
+                'done INTEGER DEFAULT 0, result TEXT)'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, updated_at REAL, payload TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS upload_jobs (id TEXT PRIMARY KEY, updated_at REAL, payload TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS metrics (node TEXT PRIMARY KEY, updated_at REAL, payload TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS failover_traces (id TEXT PRIMARY KEY, started_at REAL, payload TEXT)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS heartbeats ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, server TEXT, payload TEXT)'
+            )
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self.local.conn = conn
+        return conn
+
+    def try_acquire_lease(self, holder, ttl):
+        # BEGIN IMMEDIATE сериализует претендентов: аренду получает/продлевает только один процесс
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT holder, expires_at FROM lease WHERE name = ?', (LEASE_NAME,)).fetchone()
+            if row is None or row[0] == holder or row[1] < now:
+                conn.execute(
+                    'INSERT OR REPLACE INTO lease (name, holder, expires_at) VALUES (?, ?, ?)',
+                    (LEASE_NAME, holder, now + ttl)
+                )
+                conn.execute('COMMIT')
+                return True
+            conn.execute('COMMIT')
+            return False
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release_lease(self, holder):
+        self._connect().execute('DELETE FROM lease WHERE name = ? AND holder = ?', (LEASE_NAME, holder))
+
+    def publish_status(self, status):
+        self._connect().execute(
+            'INSERT INTO status (key, version, payload) VALUES (?, 1, ?) '
+            'ON CONFLICT(key) DO UPDATE SET version = version + 1, payload = excluded.payload',
+            (LEASE_NAME, json.dumps(status, ensure_ascii=False, default=str))
+        )
+
+    def status_version(self):
+        row = self._connect().execute('SELECT version FROM status WHERE key = ?', (LEASE_NAME,)).fetchone()
+        return row[0] if row else 0
+
+    def read_status(self):
+        row = self._connect().execute('SELECT version, payload FROM status WHERE key = ?', (LEASE_NAME,)).fetchone()
+        if row is None:
+            return 0, None
+        return row[0], json.loads(row[1])
+
+    def submit_command(self, name, args, timeout):
+        command_id = uuid.uuid4().hex
+        conn = self._connect()
+        conn.execute(
+            'INSERT INTO commands (id, name, args, created_at) VALUES (?, ?, ?, ?)',
+            (command_id, name, json.dumps(args), time.time())
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            row = conn.execute('SELECT done, result FROM commands WHERE id = ?', (command_id,)).fetchone()
+            if row and row[0] == 1:
+                conn.execute('DELETE FROM commands WHERE id = ?', (command_id,))
+                return json.loads(row[1])
+            time.sleep(0.1)
+        return {'success': False, 'error': 'Ведущий процесс не ответил вовремя', 'command_id': command_id}
+
+    def claim_commands(self):
+        # Забираем новые команды атомарно, чтобы долгая команда не была взята повторно
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute('SELECT id, name, args FROM commands WHERE done = 0 ORDER BY created_at').fetchall()
+            conn.executemany('UPDATE commands SET done = -1 WHERE id = ?', [(row[0],) for row in rows])
+            conn.execute('COMMIT')
+            return rows
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def complete_command(self, command_id, result):
+        conn = self._connect()
+        conn.execute(
+            'UPDATE commands SET done = 1, result = ? WHERE id = ?',
+            (json.dumps(result, ensure_ascii=False, default=str), command_id)
+        )
+        # Забытые результаты (клиент не дождался) не копятся бесконечно
+        conn.execute('DELETE FROM commands WHERE done = 1 AND created_at < ?', (time.time() - 3600,))
+
+
+    def save_job(self, job):
+        # Задачи ведущего видны всем воркерам: /api/jobs/<id> может прийти в любой из них
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO jobs (id, updated_at, payload) VALUES (?, ?, ?)',
+            (job['id'], now, json.dumps(job, ensure_ascii=False, default=str))
+        )
+        if job['status'] in ('done', 'failed'):
+            conn.execute('DELETE FROM jobs WHERE updated_at < ?', (now - 86400,))
+
+    def read_job(self, job_id):
+        row = self._connect().execute('SELECT payload FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_upload_job(self, job):
+        # Рассылку ведёт воркер, принявший файл, а прогресс может спросить любой другой
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO upload_jobs (id, updated_at, payload) VALUES (?, ?, ?)',
+            (job['id'], now, json.dumps(job, ensure_ascii=False, default=str))
+        )
+        if job['status'] == 'completed':
+            conn.execute('DELETE FROM upload_jobs WHERE updated_at < ?', (now - 86400,))
+
+    def read_upload_job(self, job_id):
+        row = self._connect().execute('SELECT payload FROM upload_jobs WHERE id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_metrics(self, node_id, dump):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO metrics (node, updated_at, payload) VALUES (?, ?, ?)',
+            (node_id, time.time(), json.dumps(dump))
+        )
+
+    def read_metrics(self, max_age):
+        # Снимки завершившихся воркеров (давно не обновлялись) удаляются
+        conn = self._connect()
+        conn.execute('DELETE FROM metrics WHERE updated_at < ?', (time.time() - max_age,))
+        return [json.loads(row[0]) for row in conn.execute('SELECT payload FROM metrics').fetchall()]
+
+    def delete_metrics(self, node_id):
+        self._connect().execute('DELETE FROM metrics WHERE node = ?', (node_id,))
+
+    def save_trace(self, trace):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO failover_traces (id, started_at, payload) VALUES (?, ?, ?)',
+            (trace['trace_id'], trace['started_at'], json.dumps(trace, ensure_ascii=False, default=str))
+        )
+        conn.execute(
+            'DELETE FROM failover_traces WHERE id NOT IN (SELECT id FROM failover_traces ORDER BY started_at DESC LIMIT ?)',
+            (Config.FAILOVER_TRACES_KEEP,)
+        )
+
+    def read_traces(self, limit=None):
+        rows = self._connect().execute(
+            'SELECT payload FROM failover_traces ORDER BY started_at DESC LIMIT ?',
+            (limit or Config.FAILOVER_TRACES_KEEP,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def read_trace(self, trace_id):
+        row = self._connect().execute('SELECT payload FROM failover_traces WHERE id = ?', (trace_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store_heartbeat(self, server_key, payload):
+        self._connect().execute(
+            'INSERT INTO heartbeats (server, payload) VALUES (?, ?)',
+            (server_key, json.dumps(payload, ensure_ascii=False))
+        )
+
+    def take_heartbeats(self):
+        # Ведущий забирает накопленные heartbeat пачкой и удаляет их
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute('SELECT id, server, payload FROM heartbeats ORDER BY id').fetchall()
+            if rows:
+                conn.execute('DELETE FROM heartbeats WHERE id <= ?', (rows[-1][0],))
+            conn.execute('COMMIT')
+            return [(server_key, json.loads(payload)) for _, server_key, payload in rows]
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+
+class CoordinatorNode:
+    """Выборы ведущего среди воркеров: ведущий опрашивает агентов и публикует статус, остальные его читают"""
+
+    def __init__(self, monitor, shared_state, command_handlers, upload_jobs=None):
+        self.monitor = monitor
+        self.upload_jobs = upload_jobs
+        self.shared_state = shared_state
+        self.command_handlers = command_handlers
+        self.node_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.status_version = 0
+        self.cached_status = None
+        self.monitor.status_listeners.append(self._on_status)
+        self.monitor.bot_jobs.listeners.append(self._on_job)
+        self.monitor.failover_traces.listeners.append(self._on_trace)
+        if upload_jobs is not None:
+            upload_jobs.listeners.append(self._on_upload_job)
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._loop, name='coordinator-node', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            # Начатая итерация цикла может ещё продлить аренду или записать метрики: дожидаемся её до очистки
+            self.thread.join(STOP_TIMEOUT)
+            if self.thread.is_alive():
+                logger.warning(f"Цикл координации процесса {self.node_id} не завершился за {STOP_TIMEOUT} с")
+            self.shared_state.delete_metrics(self.node_id)
+        if self.is_leader:
+            self.is_leader = False
+            self.monitor.stop_monitoring()
+            self.shared_state.release_lease(self.node_id)
+
+    def _on_status(self, status):
+        if self.is_leader:
+            try:
+                self.shared_state.publish_status(status)
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка публикации статуса в общее хранилище: {e}")
+
+    def _on_job(self, job):
+        if self.thread is not None:
+            self.shared_state.save_job(job)
+
+    def _on_trace(self, trace):
+        if self.thread is not None:
+            self.shared_state.save_trace(trace)
+
+    def _on_upload_job(self, job):
+        if self.thread is not None:
+            self.shared_state.save_upload_job(job)
+
+    def get_upload_job(self, job_id):
+        job = self.upload_jobs.get_job(job_id)
+        if job is None and self.thread is not None:
+            job = self.shared_state.read_upload_job(job_id)
+        return job
+
+    def render_metrics(self):
+        """Метрики всех воркеров: опросы и переключения считает ведущий, рассылки — воркер, принявший файл"""
+        if self.thread is None:
+            return metrics.REGISTRY.render()
+        self.shared_state.save_metrics(self.node_id, metrics.REGISTRY.dump())
+        return metrics.REGISTRY.render(self.shared_state.read_metrics(Config.METRICS_SHARE_INTERVAL * 3))
+
+    def get_failovers(self, limit=None):
+        # Переключения выполняет ведущий; остальные воркеры читают его хронологии из общего хранилища
+        if self.is_leader or self.thread is None:
+            return self.monitor.failover_traces.list(limit)
+        return self.shared_state.read_traces(limit)
+
+    def get_failover(self, trace_id):
+        if self.is_leader or self.thread is None:
+            return self.monitor.failover_traces.get(trace_id)
+        return self.shared_state.read_trace(trace_id)
+
+    def get_job(self, job_id):
+        job = self.monitor.bot_jobs.get_job(job_id)
+        if job is None and self.thread is not None:
+            job = self.shared_state.read_job(job_id)
+        return job
+
+    def _loop(self):
+        next_renew = 0
+        next_metrics = 0
+        while not self.stop_event.is_set():
+            try:
+                now = time.monotonic()
+                if now >= next_renew:
+                    self._elect()
+                    next_renew = now + Config.LEADER_LEASE_TTL / 3
+                if now >= next_metrics:
+                    self.shared_state.save_metrics(self.node_id, metrics.REGISTRY.dump())
+                    next_metrics = now + Config.METRICS_SHARE_INTERVAL
+                if self.is_leader:
+                    self._process_commands()
+                    self._process_heartbeats()
+                else:
+                    self._sync_status()
+            except Exception as e:
+                logger.error(f"Ошибка координации воркеров: {e}")
+            self.stop_event.wait(Config.SHARED_STATE_POLL_INTERVAL)
+
+    def _elect(self):
+        leader = self.shared_state.try_acquire_lease(self.node_id, Config.LEADER_LEASE_TTL)
+        if leader and not self.is_leader:
+            logger.info(f"Процесс {self.node_id} стал ведущим, запускаем мониторинг")
+            self.is_leader = True
+            self.monitor.start_monitoring()
+        elif not leader and self.is_leader:
+            logger.warning(f"Процесс {self.node_id} потерял аренду ведущего, останавливаем мониторинг")
+            self.is_leader = False
+            self.monitor.stop_monitoring()
+
+    def _process_commands(self):
+        # Каждая команда в своём потоке: долгое переключение не должно задерживать продление аренды
+        for command_id, name, args in self.shared_state.claim_commands():
+            threading.Thread(
+                target=self._run_claimed,
+                args=(command_id, name, json.loads(args)),
+                daemon=True
+            ).start()
+
+    def _process_heartbeats(self):
+        # Строки уже удалены из хранилища: ошибка одного heartbeat не должна терять остальные из пачки
+        for server_key, payload in self.shared_state.take_heartbeats():
+            try:
+                self.monitor.receive_heartbeat(server_key, payload)
+            except ValueError as e:
+                logger.warning(f"Отброшен heartbeat: {e}")
+            except Exception as e:
+                logger.error(f"Ошибка обработки heartbeat сервера {server_key}: {e}")
+
+    def receive_heartbeat(self, server_key, payload):
+        # Heartbeat может прийти в любой воркер; не ведущий передаёт его ведущему через общее хранилище
+        if self.is_leader or self.thread is None:
+            self.monitor.receive_heartbeat(server_key, payload)
+            return
+        self.monitor.validate_heartbeat(server_key, payload)
+        self.shared_state.store_heartbeat(server_key, payload)
+
+    def _run_claimed(self, command_id, name, args):
+        self.shared_state.complete_command(command_id, self.execute(name, args))
+
+    def execute(self, name, args):
+        try:
+            return self.command_handlers[name](**args)
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
+
+    def _sync_status(self):
+        # Дешёвая проверка версии; сам статус читается только при изменении
+        version = self.shared_state.status_version()
+        if version == self.status_version:
+            return
+        self.status_version, status = self.shared_state.read_status()
+        if status is not None:
+            self.cached_status = status
+            self.monitor.status_broadcaster.publish(self.monitor.public_status(status))
+
+    def get_status(self):
+        if self.is_leader or self.cached_status is None:
+            return self.monitor.get_status()
+        return self.cached_status
+
+    def get_status_version(self):
+        # Версия того статуса, который вернёт get_status: локального монитора или прочитанного у ведущего
+        if self.is_leader or self.cached_status is None:
+            return ('local', self.monitor.status_version)
+        return ('shared', self.status_version)
+
+    def run_command(self, name, **args):
+        # Команды, меняющие состояние монитора, выполняет только ведущий; без выборов — сам процесс
+        if self.is_leader or self.thread is None:
+            return self.execute(name, args)
+        return self.shared_state.submit_command(name, args, Config.SHARED_COMMAND_TIMEOUT)
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class StateSnapshotter:
+    """Атомарные снимки состояния монитора на диск с пакетной записью и восстановлением при старте"""
+
+    def __init__(self, monitor, path=None, flush_interval=None, is_writer=None):
+        self.monitor = monitor
+        # is_writer — пишет ли снимки этот процесс; из воркеров gunicorn это только ведущий
+        self.is_writer = is_writer or (lambda: True)
+        self.path = path or Config.SNAPSHOT_PATH
+        self.flush_interval = Config.SNAPSHOT_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.lock = threading.Lock()
+        self.pending = None
+        self.timer = None
+        self.monitor.status_listeners.append(self.mark_dirty)
+
+    def mark_dirty(self, status):
+        # Изменения копятся, на диск уходит не чаще раза в flush_interval. Статус не ведущего воркера
+        # (восстановленный при старте и устаревший) не должен затирать снимок ведущего
+        if not self.is_writer():
+            return
+        with self.lock:
+            self.pending = status
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            status = self.pending
+            self.pending = None
+            self.timer = None
+        if status is None:
+            return
+        snapshot = {
+            'saved_at': time.time(),
+            'servers_status': status['servers'],
+            'active_server': status['active_server'],
+            'auto_restart_enabled': status['auto_restart_enabled'],
+            'recent_switches': status.get('recent_switches', []),
+            'placement': status.get('placement', {}).get('assignments', {})
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False, default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Ошибка записи снимка состояния: {e}")
+
+    def close(self):
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+        self.flush()
+
+    def restore(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.error(f"Ошибка чтения снимка состояния: {e}")
+            return False
+        age = time.time() - snapshot.get('saved_at', 0)
+        # Статусы серверов из слишком старого снимка не используем, выбор активного сервера и настройки — всегда
+        servers_status = snapshot.get('servers_status', {}) if age <= Config.SNAPSHOT_MAX_AGE else {}
+        self.monitor.restore_state(
+            servers_status=servers_status,
+            active_server=snapshot.get('active_server'),
+            auto_restart_enabled=snapshot.get('auto_restart_enabled', True),
+            recent_switches=snapshot.get('recent_switches', []),
+            placement_assignments=snapshot.get('placement', {})
+        )
+        logger.info(f"Состояние восстановлено из снимка возрастом {age:.0f} с, активный сервер: {snapshot.get('active_server')}")
+        return True
@@ -0,0 +1,170 @@
+import time
+from datetime import datetime
+from config import Config
+
+ONLINE = 'online'
+
+
+class BotStatus:
+    __slots__ = ('name', 'running', 'warm')
+
+    def __init__(self, name, running, warm=False):
+        self.name = name
+        self.running = running
+        # warm — бот поднят на резерве в режиме ожидания (WARM_STANDBY) и готов к активации
+        self.warm = warm
+
+    def to_dict(self):
+        data = {'name': self.name, 'running': self.running}
+        if self.warm:
+            data['warm'] = True
+        return data
+
+
+def _bots_equal(bots, raw_bots):
+    # Сравнение с сырым ответом агента без построения новых объектов
+    if len(bots) != len(raw_bots):
+        return False
+    for bot_id, raw in raw_bots.items():
+        bot = bots.get(bot_id)
+        if bot is None or not isinstance(raw, dict):
+            return False
+        if bot.running != bool(raw.get('running', False)) or bot.name != raw.get('name', bot_id):
+            return False
+        if bot.warm != bool(raw.get('warm', False)):
+            return False
+    return True
+
+
+def _parse_bots(raw_bots, previous_bots):
+    bots = {}
+    for bot_id, raw in raw_bots.items():
+        raw = raw if isinstance(raw, dict) else {}
+        name = raw.get('name', bot_id)
+        running = bool(raw.get('running', False))
+        warm = bool(raw.get('warm', False))
+        bot = previous_bots.get(bot_id)
+        # Неизменившиеся боты переиспользуются: новые объекты создаются только для изменений
+        if bot is None or bot.running != running or bot.name != name or bot.warm != warm:
+            bot = BotStatus(name, running, warm)
+        bots[bot_id] = bot
+    return bots
+
+
+def _parse_load(data):
+    load = data.get('load')
+    return float(load) if isinstance(load, (int, float)) and not isinstance(load, bool) else None
+
+
+class ServerStatus:
+    """Статус сервера: числовые отметки времени, боты — BotStatus, сырой ответ агента хранится только при STATUS_KEEP_DETAILS"""
+
+    __slots__ = ('status', 'bots', 'all_bots_running', 'checked_at', 'changed_at',
+                 'response_time', 'load', 'source', 'error', 'details')
+
+    def __init__(self, status, bots=None, all_bots_running=False, checked_at=None, changed_at=None,
+                 response_time=None, load=None, source='probe', error=None, details=None):
+        self.status = status
+        self.bots = bots or {}
+        self.all_bots_running = all_bots_running
+        self.checked_at = checked_at or time.time()
+        self.changed_at = changed_at or self.checked_at
+        self.response_time = response_time
+        self.load = load
+        self.source = source
+        self.error = error
+        self.details = details
+
+    @property
+    def is_online(self):
+        return self.status == ONLINE
+
+    @property
+    def is_healthy(self):
+        return self.status == ONLINE and self.all_bots_running
+
+    @property
+    def is_ready(self):
+        # Готов принять нагрузку: боты работают или прогреты и ждут активации
+        if self.is_healthy:
+            return True
+        return self.status == ONLINE and bool(self.bots) and all(bot.running or bot.warm for bot in self.bots.values())
+
+    def bot_running(self, bot_id, default=False):
+        bot = self.bots.get(bot_id)
+        return bot.running if bot is not None else default
+
+    @classmethod
+    def from_health(cls, data, response_time=None, previous=None, source='probe'):
+        """Статус из ответа агента. Если состояние не изменилось, возвращается previous с обновлённым временем"""
+        raw_bots = data.get('bots_status') or {}
+        all_bots_running = bool(data.get('all_bots_running', False))
+        details = data if Config.STATUS_KEEP_DETAILS else None
+        if (previous is not None and previous.status == ONLINE
+                and previous.all_bots_running == all_bots_running and _bots_equal(previous.bots, raw_bots)):
+            previous.checked_at = time.time()
+            previous.response_time = response_time
+            previous.load = _parse_load(data)
+            previous.source = source
+            previous.details = details
+            return previous
+        return cls(
+            ONLINE,
+            _parse_bots(raw_bots, previous.bots if previous is not None else {}),
+            all_bots_running,
+            response_time=response_time,
+            load=_parse_load(data),
+            source=source,
+            details=details
+        )
+
+    @classmethod
+    def failed(cls, status, error, previous=None):
+        # Текст ошибки меняется от пробы к пробе (адреса объектов в исключениях), изменением состояния он не считается
+        if previous is not None and previous.status == status:
+            previous.checked_at = time.time()
+            previous.error = error
+            return previous
+        return cls(status, error=error)
+
+    @classmethod
+    def from_dict(cls, data):
+        # Статус из снимка; в старых снимках last_check — строка ISO
+        checked_at = data.get('last_check')
+        if isinstance(checked_at, str):
+            try:
+                checked_at = datetime.fromisoformat(checked_at).timestamp()
+            except ValueError:
+                checked_at = None
+        return cls(
+            data.get('status', 'offline'),
+            _parse_bots(data.get('bots_status') or {}, {}),
+            bool(data.get('all_bots_running', False)),
+            checked_at=checked_at,
+            changed_at=data.get('changed_at'),
+            response_time=data.get('response_time'),
+            load=_parse_load(data),
+            source=data.get('source', 'probe'),
+            error=data.get('error')
+        )
+
+    def to_dict(self, include_details=False):
+        # Пустые поля не выводятся: на большом парке это заметно уменьшает /api/status
+        data = {
+            'status': self.status,
+            'bots_status': {bot_id: bot.to_dict() for bot_id, bot in self.bots.items()},
+            'all_bots_running': self.all_bots_running,
+            'last_check': self.checked_at,
+            'changed_at': self.changed_at
+        }
+        if self.response_time is not None:
+            data['response_time'] = round(self.response_time, 4)
+        if self.load is not None:
+            data['load'] = self.load
+        if self.source != 'probe':
+            data['source'] = self.source
+        if self.error is not None:
+            data['error'] = self.error
+        if include_details and self.details is not None:
+            data['details'] = self.details
+        return data
@@ -0,0 +1,122 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class StatusBroadcaster:
+    """Версионированный поток изменений статуса: полный снимок плюс дельты по серверам.
+
+    Публикуется только то, что рисует дашборд (ServerMonitor.public_status): иначе почти каждая дельта была бы снимком.
+
+    id события — "<эпоха>:<версия>". Счётчик версий свой у каждого процесса, поэтому Last-Event-ID
+    с чужой эпохой (другой воркер gunicorn или перезапущенный процесс) всегда получает полный снимок.
+    """
+
+    def __init__(self, history_size=256):
+        self.condition = threading.Condition()
+        self.version = 0
+        self.snapshot = {'servers': {}}
+        self.deltas = deque(maxlen=history_size)
+        self.epoch_pid = None
+        self.epoch_value = None
+
+    @property
+    def epoch(self):
+        # Объект может быть создан до fork (предзагрузка gunicorn): эпоха пересоздаётся в каждом процессе
+        pid = os.getpid()
+        if self.epoch_pid != pid:
+            self.epoch_pid = pid
+            self.epoch_value = uuid.uuid4().hex[:8]
+        return self.epoch_value
+
+    def parse_event_id(self, event_id):
+        """Версия из Last-Event-ID; None, если id от другой эпохи или некорректен — тогда нужен снимок"""
+        if not event_id:
+            return None
+        epoch, _, version = event_id.partition(':')
+        if epoch != self.epoch:
+            return None
+        try:
+            return int(version)
+        except ValueError:
+            return None
+
+    def publish(self, state):
+        # state — публичный статус монитора; в дельту попадают только изменившиеся поля
+        with self.condition:
+            delta = {}
+            servers_delta = {}
+            for server_key, server_status in state['servers'].items():
+                if self.snapshot['servers'].get(server_key) != server_status:
+                    servers_delta[server_key] = server_status
+            removed = [key for key in self.snapshot['servers'] if key not in state['servers']]
+            if servers_delta:
+                delta['servers'] = servers_delta
+            if removed:
+                delta['removed_servers'] = removed
+            for key, value in state.items():
+                if key != 'servers' and self.snapshot.get(key) != value:
+                    delta[key] = value
+            if not delta:
+                return self.version
+            self.version += 1
+            delta['version'] = self.version
+            self.snapshot = dict(state, servers=dict(state['servers']))
+            self.deltas.append((self.version, delta))
+            self.condition.notify_all()
+            return self.version
+
+    def get_snapshot(self):
+        with self.condition:
+            return dict(self.snapshot, version=self.version)
+
+    def changes_since(self, version):
+        # None — история уже вытеснена или версия из будущего, клиенту нужен полный снимок
+        with self.condition:
+            if version == self.version:
+                return []
+            if version > self.version or not self.deltas or self.deltas[0][0] > version + 1:
+                return None
+            return [delta for v, delta in self.deltas if v > version]
+
+    def wait_for_change(self, version, timeout):
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def stream(self, last_event_id=None, keepalive=15, max_duration=None):
+        """Генератор SSE-событий: snapshot при подключении (или догоняющие дельты), затем delta"""
+        started = time.monotonic()
+        epoch = self.epoch
+        last_version = self.parse_event_id(last_event_id)
+        changes = self.changes_since(last_version) if last_version is not None else None
+        if changes is None:
+            snapshot = self.get_snapshot()
+            version = snapshot['version']
+            yield _event('snapshot', epoch, version, snapshot)
+        else:
+            version = last_version
+            for delta in changes:
+                version = delta['version']
+                yield _event('delta', epoch, version, delta)
+        while max_duration is None or time.monotonic() - started < max_duration:
+            new_version = self.wait_for_change(version, keepalive)
+            if new_version == version:
+                yield ': keepalive\n\n'
+                continue
+            changes = self.changes_since(version)
+            if changes is None:
+                snapshot = self.get_snapshot()
+                version = snapshot['version']
+                yield _event('snapshot', epoch, version, snapshot)
+                continue
+            for delta in changes:
+                version = delta['version']
+                yield _event('delta', epoch, version, delta)
+
+
+def _event(name, epoch, version, payload):
+    return f"id: {epoch}:{version}\nevent: {name}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,209 @@
+import argparse
+import os
+import random
+import threading
+import time
+import requests
+from flask import Flask, jsonify, request
+from artifact_store import file_sha256
+
+
+class FaultProfile:
+    """Искусственные сбои заглушки: задержка ответа, доля ошибок 500 и доля зависаний"""
+
+    def __init__(self, latency=0.0, latency_jitter=0.0, error_rate=0.0, hang_rate=0.0, hang_seconds=30.0, seed=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+
+    def apply(self):
+        delay = self.latency + self.latency_jitter * self.random.random()
+        if self.hang_rate and self.random.random() < self.hang_rate:
+            delay += self.hang_seconds
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            return jsonify({'success': False, 'error': 'Искусственная ошибка заглушки'}), 500
+        return None
+
+
+def create_app(root, bots=('bot1', 'bot2', 'bot3', 'bot4'), faults=None, cold_start=0.0):
+    """Локальный агент-заглушка с протоколом агента для тестов координатора.
+
+    cold_start — секунды запуска бота с нуля; активация прогретого бота (warm) мгновенная.
+    """
+    app = Flask(__name__)
+    partial_dir = os.path.join(root, '.partial')
+    os.makedirs(partial_dir, exist_ok=True)
+    lock = threading.Lock()
+    bots_running = {bot_id: True for bot_id in bots}
+    bots_warm = {bot_id: False for bot_id in bots}
+
+    if faults is not None:
+        app.before_request(faults.apply)
+
+    def target_file(target_path, filename):
+        # Пути агента откладываем внутрь root заглушки
+        directory = os.path.join(root, target_path.lstrip('/'))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, os.path.basename(filename))
+
+    def partial_file(sha256):
+        return os.path.join(partial_dir, os.path.basename(sha256))
+
+    @app.route('/health')
+    def health():
+        with lock:
+            bots_status = {
+                bot_id: {'name': bot_id, 'running': running, 'warm': bots_warm[bot_id]}
+                for bot_id, running in bots_running.items()
+            }
+        return jsonify({
+            'bots_status': bots_status,
+            'all_bots_running': all(b['running'] for b in bots_status.values()),
+            'load': os.getloadavg()[0] / (os.cpu_count() or 1)
+        })
+
+    def apply_action(bot_id, action):
+        # Возвращает, поднимается ли процесс бота с нуля (start, прогрев или активация непрогретого); вызывается под lock
+        cold = action in ('start', 'restart') or (action in ('warm', 'activate') and not bots_warm[bot_id])
+        bots_running[bot_id] = action not in ('stop', 'warm')
+        bots_warm[bot_id] = action == 'warm'
+        return cold
+
+    def single_action(action):
+        bot_id = (request.get_json(silent=True) or {}).get('bot_id')
+        with lock:
+            if bot_id not in bots_running:
+                return jsonify({'success': False, 'error': f'Неизвестный бот: {bot_id}'}), 404
+            cold = apply_action(bot_id, action)
+        if cold and cold_start:
+            time.sleep(cold_start)
+        return jsonify({'success': True})
+
+    @app.route('/start_bot', methods=['POST'])
+    def start_bot():
+        return single_action('start')
+
+    @app.route('/stop_bot', methods=['POST'])
+    def stop_bot():
+        return single_action('stop')
+
+    @app.route('/restart_bot', methods=['POST'])
+    def restart_bot():
+        return single_action('restart')
+
+    @app.route('/warm_bot', methods=['POST'])
+    def warm_bot():
+        return single_action('warm')
+
+    @app.route('/activate_bot', methods=['POST'])
+    def activate_bot():
+        return single_action('activate')
+
+    @app.route('/bots_batch', methods=['POST'])
+    def bots_batch():
+        results = {}
+        cold = False
+        with lock:
+            for command in request.get_json()['commands']:
+                bot_id = command['bot_id']
+                if bot_id not in bots_running:
+                    results[bot_id] = {'success': False, 'error': f'Неизвестный бот: {bot_id}'}
+                    continue
+                cold = apply_action(bot_id, command['action']) or cold
+                results[bot_id] = {'success': True}
+        # Боты пакета стартуют параллельно: холодный запуск стоит один cold_start на пакет
+        if cold and cold_start:
+            time.sleep(cold_start)
+        return jsonify({'results': results})
+
+    @app.route('/upload_file', methods=['POST'])
+    def upload_file():
+        file = request.files['file']
+        file.save(target_file(request.form['target_path'], request.form['filename']))
+        return jsonify({'success': True})
+
+    @app.route('/artifact_status')
+    def artifact_status():
+        path = target_file(request.args['target_path'], request.args['filename'])
+        sha256 = request.args.get('sha256', '')
+        partial = partial_file(sha256) if sha256 else None
+        return jsonify({
+            'sha256': file_sha256(path) if os.path.exists(path) else None,
+            'received': os.path.getsize(partial) if partial and os.path.exists(partial) else 0
+        })
+
+    @app.route('/upload_chunk', methods=['POST'])
+    def upload_chunk():
+        sha256 = request.args['sha256']
+        offset = int(request.args['offset'])
+        path = partial_file(sha256)
+        with lock:
+            received = os.path.getsize(path) if os.path.exists(path) else 0
+            if offset != received:
+                return jsonify({'success': False, 'received': received}), 409
+            with open(path, 'ab') as f:
+                f.write(request.get_data())
+            received = os.path.getsize(path)
+        return jsonify({'success': True, 'received': received})
+
+    @app.route('/upload_commit', methods=['POST'])
+    def upload_commit():
+        data = request.get_json()
+        path = partial_file(data['sha256'])
+        if not os.path.exists(path) or file_sha256(path) != data['sha256']:
+            if os.path.exists(path):
+                os.remove(path)
+            return jsonify({'success': False, 'error': 'Хеш не совпадает'}), 400
+        os.replace(path, target_file(data['target_path'], data['filename']))
+        return jsonify({'success': True})
+
+    return app
+
+
+def start_heartbeat(app, coordinator_url, server_key, interval=2.0, token=None, stop_event=None):
+    """Фоновая отправка /health заглушки на /api/heartbeat координатора раз в interval секунд"""
+    stop_event = stop_event or threading.Event()
+    headers = {'X-Agent-Token': token} if token else {}
+    url = coordinator_url.rstrip('/') + '/api/heartbeat'
+
+    def loop():
+        client = app.test_client()
+        session = requests.Session()
+        while not stop_event.is_set():
+            payload = dict(client.get('/health').get_json(), server=server_key, interval=interval)
+            try:
+                session.post(url, json=payload, headers=headers, timeout=interval)
+            except requests.exceptions.RequestException:
+                pass
+            stop_event.wait(interval)
+
+    threading.Thread(target=loop, name=f'heartbeat-{server_key}', daemon=True).start()
+    return stop_event
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Агент-заглушка для локальных тестов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--root', default='stub_agent_data')
+    parser.add_argument('--bots', default='bot1,bot2,bot3,bot4')
+    parser.add_argument('--latency', type=float, default=0.0, help='секунды задержки каждого ответа')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 500')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='доля зависающих запросов')
+    parser.add_argument('--hang-seconds', type=float, default=30.0)
+    parser.add_argument('--cold-start', type=float, default=0.0, help='секунды запуска бота с нуля')
+    parser.add_argument('--coordinator', help='URL координатора для отправки heartbeat')
+    parser.add_argument('--server-key', help='ключ сервера в топологии координатора')
+    parser.add_argument('--heartbeat-interval', type=float, default=2.0)
+    parser.add_argument('--token', default=os.getenv('HEARTBEAT_TOKEN'))
+    args = parser.parse_args()
+    faults = FaultProfile(args.latency, 0.0, args.error_rate, args.hang_rate, args.hang_seconds)
+    app = create_app(args.root, tuple(args.bots.split(',')), faults, args.cold_start)
+    if args.coordinator and args.server_key:
+        start_heartbeat(app, args.coordinator, args.server_key, args.heartbeat_interval, args.token)
+    app.run(host=args.host, port=args.port, threaded=True)
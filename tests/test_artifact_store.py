@@ -0,0 +1,35 @@
+import io
+import os
+import time
+from artifact_store import ArtifactStore
+
+
+def test_workers_do_not_overwrite_each_others_names(tmp_path):
+    # Два экземпляра на одном каталоге — как два воркера gunicorn
+    first, second = ArtifactStore(str(tmp_path)), ArtifactStore(str(tmp_path))
+    first.save(io.BytesIO(b'bot1 v1'), 'bot1.py')
+    second.save(io.BytesIO(b'bot2 v1'), 'bot2.py')
+    assert set(ArtifactStore(str(tmp_path)).names) == {'bot1.py', 'bot2.py'}
+    # Второй воркер находит файл первого без перезапуска
+    with open(second.resolve('bot1.py'), 'rb') as f:
+        assert f.read() == b'bot1 v1'
+
+
+def test_superseded_objects_are_collected(tmp_path):
+    store = ArtifactStore(str(tmp_path), gc_min_age=60)
+    _, old_path = store.save(io.BytesIO(b'v1'), 'bot1.py')
+    _, shared_path = store.save(io.BytesIO(b'shared'), 'bot2.py')
+    old = time.time() - 120
+    os.utime(old_path, (old, old))
+    os.utime(shared_path, (old, old))
+    _, new_path = store.save(io.BytesIO(b'v2'), 'bot1.py')
+    assert not os.path.exists(old_path)
+    assert os.path.exists(shared_path) and os.path.exists(new_path)
+
+
+def test_recent_superseded_object_is_kept(tmp_path):
+    # Прежнюю версию ещё может рассылать задача, начатая до перезаписи имени
+    store = ArtifactStore(str(tmp_path), gc_min_age=60)
+    _, old_path = store.save(io.BytesIO(b'v1'), 'bot1.py')
+    store.save(io.BytesIO(b'v2'), 'bot1.py')
+    assert os.path.exists(old_path)
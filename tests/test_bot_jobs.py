@@ -0,0 +1,86 @@
+import threading
+import time
+from bot_jobs import BotJobQueue, SwitchGate
+
+
+def wait_job(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get_job(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError('задача не завершилась')
+
+
+def test_same_key_jobs_run_in_order_and_coalesce():
+    queue = BotJobQueue(max_workers=2, keep_jobs=10)
+    release = threading.Event()
+    order = []
+    first = queue.submit('bot1', 'start', lambda: release.wait(5) and order.append('start') is None)
+    second = queue.submit('bot1', 'stop', lambda: order.append('stop') is None)
+    duplicate = queue.submit('bot1', 'stop', lambda: order.append('лишний stop') is None)
+    assert duplicate['id'] == second['id']
+    release.set()
+    assert wait_job(queue, second['id'])['success']
+    assert wait_job(queue, first['id'])['success']
+    assert order == ['start', 'stop']
+
+
+def test_switch_waits_for_running_job_and_blocks_new_ones():
+    gate = SwitchGate()
+    events = []
+    job_started = threading.Event()
+    release_job = threading.Event()
+
+    def job(name, started=None, release=None):
+        with gate.job():
+            if started is not None:
+                started.set()
+            events.append(f'{name}:начало')
+            if release is not None:
+                release.wait(5)
+            events.append(f'{name}:конец')
+
+    def switch():
+        with gate.switch():
+            events.append('switch:начало')
+            time.sleep(0.05)
+            events.append('switch:конец')
+
+    running = threading.Thread(target=job, args=('job1', job_started, release_job))
+    running.start()
+    job_started.wait(5)
+    switching = threading.Thread(target=switch)
+    switching.start()
+    time.sleep(0.05)
+    # Переключение ждёт начатую операцию, а новая операция — переключение
+    late = threading.Thread(target=job, args=('job2',))
+    late.start()
+    time.sleep(0.05)
+    assert events == ['job1:начало']
+    release_job.set()
+    for thread in (running, switching, late):
+        thread.join(5)
+    assert events == ['job1:начало', 'job1:конец', 'switch:начало', 'switch:конец', 'job2:начало', 'job2:конец']
+
+
+def test_switches_do_not_overlap():
+    gate = SwitchGate()
+    active = []
+    overlaps = []
+
+    def switch():
+        with gate.switch():
+            active.append(1)
+            if len(active) > 1:
+                overlaps.append(True)
+            time.sleep(0.02)
+            active.pop()
+
+    threads = [threading.Thread(target=switch) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert not overlaps
@@ -0,0 +1,67 @@
+import json
+import os
+import time
+from event_journal import EventJournal, INDEX_SUFFIX, SEGMENT_SUFFIX
+
+
+def make_journal(directory, **kwargs):
+    options = dict(flush_interval=10, retention_days=1)
+    options.update(kwargs)
+    return EventJournal(str(directory), **options)
+
+
+def indexes(directory):
+    result = []
+    for name in sorted(os.listdir(str(directory))):
+        if name.endswith(INDEX_SUFFIX):
+            with open(os.path.join(str(directory), name), 'r', encoding='utf-8') as f:
+                result.append(json.load(f))
+    return result
+
+
+def write_old_segment(directory, name, closed, last_ts):
+    path = os.path.join(str(directory), name)
+    with open(path + SEGMENT_SUFFIX, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'ts': last_ts, 'type': 'switch'}) + '\n')
+    with open(path + INDEX_SUFFIX, 'w', encoding='utf-8') as f:
+        json.dump({'segment': name + SEGMENT_SUFFIX, 'first_ts': last_ts, 'last_ts': last_ts, 'count': 1, 'bytes': 1,
+                   'servers': [], 'bots': [], 'types': ['switch'], 'closed': closed}, f)
+    return path
+
+
+def test_close_writes_queued_events_and_closes_segment(tmp_path):
+    journal = make_journal(tmp_path)
+    journal.record('switch', 'server1')
+    journal.record('bot_command', 'server1', 'bot1')
+    # Пачка ещё копится (flush_interval 10 с): без close() эти события потерялись бы
+    started = time.monotonic()
+    journal.close()
+    assert time.monotonic() - started < 5
+    [index] = indexes(tmp_path)
+    assert index['closed'] and index['count'] == 2
+    journal.record('switch', 'server2')
+    assert journal.get_stats()['queued'] == 0
+
+
+def test_expire_removes_old_segments_closed_or_not(tmp_path):
+    old = time.time() - 3 * 86400
+    unclosed = write_old_segment(tmp_path, 'events-1-100-1', False, old)
+    closed = write_old_segment(tmp_path, 'events-2-100-2', True, old)
+    orphan = os.path.join(str(tmp_path), 'events-3-100-1' + SEGMENT_SUFFIX)
+    open(orphan, 'w').close()
+    os.utime(orphan, (old, old))
+    fresh = write_old_segment(tmp_path, 'events-4-100-1', False, time.time())
+    journal = make_journal(tmp_path)
+    journal._expire()
+    assert not os.path.exists(unclosed + SEGMENT_SUFFIX) and not os.path.exists(unclosed + INDEX_SUFFIX)
+    assert not os.path.exists(closed + SEGMENT_SUFFIX)
+    assert not os.path.exists(orphan)
+    assert os.path.exists(fresh + SEGMENT_SUFFIX)
+
+
+def test_expire_keeps_own_open_segment(tmp_path):
+    journal = make_journal(tmp_path, flush_interval=0.01)
+    journal._write([{'ts': time.time() - 3 * 86400, 'type': 'switch'}])
+    journal._expire()
+    assert os.path.exists(journal.segment.path)
+    journal.close()
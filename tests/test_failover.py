@@ -0,0 +1,66 @@
+import time
+from failover import FailoverController, PENDING_SWITCH, SETTLED
+
+
+class Harness:
+    def __init__(self, targets):
+        # Цели, которые вернёт перепроверка при срабатывании таймера, по очереди
+        self.targets = list(targets)
+        self.switched = []
+        self.messages = []
+        self.published = 0
+        self.controller = FailoverController(
+            switch_callback=lambda target, trace: self.switched.append((target, trace)),
+            resolve_callback=self.resolve,
+            notify_callback=self.messages.append,
+            grace_period=0.05,
+            status_callback=self.publish
+        )
+
+    def resolve(self):
+        target = self.targets.pop(0)
+        return target, f'переключение на {target}' if target else None
+
+    def publish(self):
+        self.published += 1
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.01)
+    raise AssertionError('условие не выполнилось')
+
+
+def test_retarget_on_fire_keeps_incident_and_notifies():
+    harness = Harness(['server3', 'server3'])
+    controller = harness.controller
+    controller.update('server2', 'переключение на server2')
+    detected_at = controller.get_state()['detected_at']
+    wait_for(lambda: harness.switched)
+    target, trace = harness.switched[0]
+    assert target == 'server3'
+    assert harness.messages == ['переключение на server2', 'переключение на server3']
+    last_switch = controller.get_state()['last_switch']
+    assert last_switch['detected_at'] == detected_at
+    # Оба льготных периода — до перенацеливания и после — остаются в трассе одного инцидента
+    graces = [span for span in trace.spans if span.name == 'grace']
+    assert [span.server for span in graces] == ['server2', 'server3']
+    assert graces[0].start == detected_at and graces[0].end == graces[1].start
+
+
+def test_every_transition_publishes_status():
+    harness = Harness([None])
+    controller = harness.controller
+    controller.update('server2')
+    assert harness.published == 1 and controller.get_state()['state'] == PENDING_SWITCH
+    controller.cancel()
+    assert harness.published == 2 and controller.get_state()['state'] == SETTLED
+    controller.cancel()
+    assert harness.published == 2
+    controller.update('server2')
+    # Перепроверка не нашла цели: отмена по таймеру тоже публикуется
+    wait_for(lambda: controller.get_state()['state'] == SETTLED)
+    assert harness.published == 4
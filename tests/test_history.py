@@ -0,0 +1,16 @@
+from history import ProbeHistory
+from status_model import BotStatus, ServerStatus, ONLINE
+
+
+def online(*bot_ids):
+    return ServerStatus(ONLINE, {bot_id: BotStatus(bot_id, True) for bot_id in bot_ids}, response_time=0.05)
+
+
+def test_forget_drops_removed_servers_and_bots():
+    history = ProbeHistory()
+    history.record('server1', online('bot1', 'bot2'))
+    history.record('server2', online('bot1'))
+    history.forget({'server1': {'bots': {'bot1': {}}}})
+    assert history.server_keys() == ['server1']
+    assert history.query('server2', 3600) is None
+    assert list(history.query('server1', 3600)['bots']) == ['bot1']
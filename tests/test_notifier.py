@@ -0,0 +1,96 @@
+import time
+from config import Config
+from notifier import MemoryTransport, NotificationDispatcher, NotificationRetry
+
+
+def wait_sent(dispatcher, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = dispatcher.get_stats()
+        if stats['sent'] + stats['failed'] >= count:
+            return stats
+        time.sleep(0.01)
+    raise AssertionError('уведомления не отправлены')
+
+
+def make_dispatcher(transport, **kwargs):
+    options = dict(coalesce_window=0.1, min_interval=0, max_retries=2)
+    options.update(kwargs)
+    return NotificationDispatcher(transport, **options)
+
+
+def test_memory_transport_keeps_last_messages():
+    transport = MemoryTransport(keep=2)
+    for text in ('первое', 'второе', 'третье'):
+        transport.send(text)
+    assert [message['text'] for message in transport.sent] == ['второе', 'третье']
+
+
+def test_burst_of_same_message_is_coalesced():
+    transport = MemoryTransport()
+    dispatcher = make_dispatcher(transport)
+    for _ in range(3):
+        dispatcher.notify('Сервер 1 недоступен')
+    stats = wait_sent(dispatcher, 1)
+    assert [message['text'] for message in transport.sent] == ['Сервер 1 недоступен (×3)']
+    assert stats['coalesced'] == 2
+
+
+def test_burst_of_different_messages_is_summarized():
+    transport = MemoryTransport()
+    dispatcher = make_dispatcher(transport)
+    dispatcher.notify('Сервер 1 недоступен')
+    dispatcher.notify('Сервер 2 недоступен')
+    dispatcher.notify('Сервер 1 недоступен')
+    wait_sent(dispatcher, 1)
+    text = transport.sent[0]['text']
+    assert text.startswith('Событий за 0 с: 3')
+    assert '• Сервер 1 недоступен (×2)' in text
+    assert '• Сервер 2 недоступен' in text
+
+
+def test_full_queue_drops_without_blocking():
+    class BlockedTransport:
+        def send(self, text):
+            time.sleep(1)
+
+    dispatcher = make_dispatcher(BlockedTransport(), queue_size=1, coalesce_window=0)
+    started = time.monotonic()
+    for index in range(20):
+        dispatcher.notify(f'сообщение {index}')
+    assert time.monotonic() - started < 0.5
+    assert dispatcher.get_stats()['dropped'] > 0
+
+
+def test_rate_limited_message_is_retried():
+    class FlakyTransport(MemoryTransport):
+        def __init__(self):
+            super().__init__()
+            self.attempts = 0
+
+        def send(self, text):
+            self.attempts += 1
+            if self.attempts == 1:
+                raise NotificationRetry('429', 0.01)
+            super().send(text)
+
+    transport = FlakyTransport()
+    dispatcher = make_dispatcher(transport)
+    dispatcher.notify('Сервер 1 недоступен')
+    stats = wait_sent(dispatcher, 1)
+    assert transport.attempts == 2
+    assert stats['sent'] == 1 and stats['failed'] == 0
+    assert transport.sent[0]['text'] == 'Сервер 1 недоступен'
+
+
+def test_failed_delivery_is_counted(monkeypatch):
+    monkeypatch.setattr(Config, 'NOTIFY_RETRY_BACKOFF', 0.01)
+
+    class BrokenTransport:
+        def send(self, text):
+            raise IOError('нет сети')
+
+    dispatcher = make_dispatcher(BrokenTransport())
+    dispatcher.notify('Сервер 1 недоступен')
+    stats = wait_sent(dispatcher, 1)
+    assert stats['failed'] == 1 and stats['sent'] == 0
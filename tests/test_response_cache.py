@@ -0,0 +1,32 @@
+from flask import Flask
+from response_cache import ResponseCache
+
+PAYLOAD = {'servers': {f'server{index}': {'status': 'online'} for index in range(100)}}
+
+
+def make_client():
+    app = Flask(__name__)
+    cache = ResponseCache()
+    app.add_url_rule('/status', 'status', lambda: cache.respond('status', 1, lambda: PAYLOAD))
+    return app.test_client()
+
+
+def test_encodings_have_distinct_etags():
+    client = make_client()
+    plain = client.get('/status')
+    gzipped = client.get('/status', headers={'Accept-Encoding': 'gzip'})
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert plain.headers['ETag'] != gzipped.headers['ETag']
+    assert plain.headers['Vary'] == gzipped.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_validator_of_other_encoding_is_not_modified_match():
+    client = make_client()
+    plain_etag = client.get('/status').headers['ETag']
+    gzip_etag = client.get('/status', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    response = client.get('/status', headers={'Accept-Encoding': 'gzip', 'If-None-Match': plain_etag})
+    assert response.status_code == 200 and response.headers['Content-Encoding'] == 'gzip'
+    response = client.get('/status', headers={'If-None-Match': gzip_etag})
+    assert response.status_code == 200 and 'Content-Encoding' not in response.headers
+    assert client.get('/status', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzip_etag}).status_code == 304
+    assert client.get('/status', headers={'If-None-Match': plain_etag}).status_code == 304
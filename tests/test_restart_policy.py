@@ -0,0 +1,130 @@
+import pytest
+from config import Config
+from restart_policy import RestartPolicy, BACKOFF, CRASH_LOOP, IN_FLIGHT, LIMIT
+
+KEY = ('server1', 'bot1')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def policy_config(monkeypatch):
+    monkeypatch.setattr(Config, 'BOT_RESTART_BACKOFF_BASE', 5)
+    monkeypatch.setattr(Config, 'BOT_RESTART_BACKOFF_MAX', 600)
+    monkeypatch.setattr(Config, 'BOT_RESTART_STABLE_SECONDS', 60)
+    monkeypatch.setattr(Config, 'BOT_CRASH_LOOP_THRESHOLD', 3)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def decision(policy, key=KEY):
+    server_key, bot_id = key
+    return policy.get_state()['bots'][server_key][bot_id]['decision']
+
+
+def fail_fast(policy, clock, key=KEY):
+    """Запуск, быстрое завершение и проверка, снова показавшая бот остановленным"""
+    assert policy.select([(key, clock.now)]) == ([key], [])
+    clock.now += 1
+    policy.finish(key)
+    clock.now += 1
+
+
+def crash_loop(policy, clock):
+    """Бот падает сразу после каждого запуска; следующая попытка идёт после любой задержки"""
+    checked_at = clock.now
+    for _ in range(Config.BOT_CRASH_LOOP_THRESHOLD):
+        assert policy.select([(KEY, checked_at)]) == ([KEY], [])
+        clock.now += 1
+        policy.finish(KEY)
+        checked_at = clock.now + 1
+        clock.now += Config.BOT_RESTART_BACKOFF_MAX
+    assert policy.select([(KEY, checked_at)]) == ([], [KEY])
+
+
+def test_backoff_doubles_after_each_fast_failure(clock):
+    policy = RestartPolicy(max_concurrent=8, clock=clock)
+    fail_fast(policy, clock)
+    # Вторая попытка разрешена через BOT_RESTART_BACKOFF_BASE после первой
+    assert policy.select([(KEY, clock.now)]) == ([], [])
+    assert decision(policy) == BACKOFF
+    clock.now += 3
+    fail_fast(policy, clock)
+    # После одного быстрого отказа задержка удваивается: 10 с от второй попытки
+    clock.now += 5
+    assert policy.select([(KEY, clock.now)]) == ([], [])
+    clock.now += 3
+    assert policy.select([(KEY, clock.now)]) == ([KEY], [])
+
+
+def test_fast_failures_lead_to_crash_loop(clock):
+    policy = RestartPolicy(max_concurrent=8, clock=clock)
+    crash_loop(policy, clock)
+    assert policy.get_state()['crash_looping'] == ['server1/bot1']
+    # Крутящийся бот больше не выбирается и не попадает в новые crash-loop повторно
+    clock.now += Config.BOT_RESTART_BACKOFF_MAX
+    assert policy.select([(KEY, clock.now)]) == ([], [])
+    assert decision(policy) == CRASH_LOOP
+
+
+def test_status_checked_before_finish_is_not_a_failure(clock):
+    policy = RestartPolicy(max_concurrent=8, clock=clock)
+    assert policy.select([(KEY, clock.now)]) == ([KEY], [])
+    checked_during_start = clock.now + 0.5
+    clock.now += 1
+    policy.finish(KEY)
+    clock.now += Config.BOT_RESTART_BACKOFF_MAX
+    assert policy.select([(KEY, checked_during_start)]) == ([], [])
+    assert decision(policy) == IN_FLIGHT
+    assert policy.get_state()['bots']['server1']['bot1']['fast_failures'] == 0
+
+
+def test_concurrent_restarts_are_limited(clock):
+    policy = RestartPolicy(max_concurrent=2, clock=clock)
+    keys = [('server1', f'bot{index}') for index in range(1, 5)]
+    to_restart, _ = policy.select([(key, clock.now) for key in keys])
+    assert to_restart == keys[:2]
+    assert decision(policy, keys[2]) == LIMIT
+    assert policy.get_state()['in_flight'] == 2
+    policy.finish(keys[0])
+    clock.now += 1
+    to_restart, _ = policy.select([(key, clock.now) for key in keys[2:]])
+    assert to_restart == [keys[2]]
+
+
+def test_stable_bot_forgets_failures(clock):
+    policy = RestartPolicy(max_concurrent=8, clock=clock)
+    fail_fast(policy, clock)
+    # Бот ещё не проработал BOT_RESTART_STABLE_SECONDS: история сохраняется
+    policy.record_running(KEY)
+    assert 'server1' in policy.get_state()['bots']
+    clock.now += Config.BOT_RESTART_STABLE_SECONDS
+    policy.record_running(KEY)
+    assert policy.get_state()['bots'] == {}
+
+
+def test_manual_reset_clears_crash_loop(clock):
+    policy = RestartPolicy(max_concurrent=8, clock=clock)
+    crash_loop(policy, clock)
+    policy.reset(KEY)
+    assert policy.get_state()['crash_looping'] == []
+    assert policy.select([(KEY, clock.now)]) == ([KEY], [])
+
+
+def test_forget_releases_removed_bots(clock):
+    policy = RestartPolicy(max_concurrent=1, clock=clock)
+    removed = ('server2', 'bot1')
+    assert policy.select([(removed, clock.now)]) == ([removed], [])
+    # Сервер убран из топологии посреди попытки: место в пределе параллельности освобождается
+    policy.forget({'server1': {'bots': {'bot1': {}}}})
+    assert policy.get_state()['in_flight'] == 0
+    assert policy.select([(KEY, clock.now)]) == ([KEY], [])
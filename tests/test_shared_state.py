@@ -0,0 +1,39 @@
+import threading
+import time
+from types import SimpleNamespace
+from shared_state import CoordinatorNode, SharedState
+
+
+class SlowMetricsState(SharedState):
+    """Запись метрик идёт долго: остановка приходит посреди итерации цикла координации"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.saving = threading.Event()
+
+    def save_metrics(self, node_id, dump):
+        self.saving.set()
+        time.sleep(0.3)
+        super().save_metrics(node_id, dump)
+
+
+def make_monitor():
+    return SimpleNamespace(
+        status_listeners=[],
+        bot_jobs=SimpleNamespace(listeners=[]),
+        failover_traces=SimpleNamespace(listeners=[]),
+        start_monitoring=lambda: None,
+        stop_monitoring=lambda: None
+    )
+
+
+def test_stop_waits_for_running_iteration(tmp_path):
+    shared_state = SlowMetricsState(str(tmp_path / 'state.db'))
+    node = CoordinatorNode(make_monitor(), shared_state, {})
+    node.start()
+    assert shared_state.saving.wait(5)
+    node.stop()
+    assert not node.thread.is_alive()
+    # После остановки не остаётся ни аренды, мешающей другим воркерам до истечения TTL, ни снимка метрик
+    assert shared_state._connect().execute('SELECT holder FROM lease').fetchall() == []
+    assert shared_state.read_metrics(60) == []
@@ -0,0 +1,49 @@
+from status_stream import StatusBroadcaster
+
+
+def first_event(broadcaster, last_event_id):
+    event = next(broadcaster.stream(last_event_id, keepalive=0.01, max_duration=0))
+    fields = dict(line.split(': ', 1) for line in event.strip().split('\n'))
+    return fields['event'], fields['id']
+
+
+def publish_two(broadcaster):
+    broadcaster.publish({'servers': {'server1': {'status': 'online'}}})
+    broadcaster.publish({'servers': {'server1': {'status': 'offline'}}})
+
+
+def test_same_epoch_resumes_with_deltas():
+    broadcaster = StatusBroadcaster()
+    publish_two(broadcaster)
+    assert first_event(broadcaster, f'{broadcaster.epoch}:1') == ('delta', f'{broadcaster.epoch}:2')
+
+
+def test_foreign_epoch_gets_snapshot():
+    # Версия 1 есть и в этом процессе, но id выдан другим воркером: дельты от неё были бы чужими
+    leader, follower = StatusBroadcaster(), StatusBroadcaster()
+    publish_two(leader)
+    publish_two(follower)
+    assert first_event(follower, f'{leader.epoch}:1') == ('snapshot', f'{follower.epoch}:2')
+
+
+def test_legacy_numeric_id_gets_snapshot():
+    broadcaster = StatusBroadcaster()
+    publish_two(broadcaster)
+    assert first_event(broadcaster, '1')[0] == 'snapshot'
+
+
+def test_probe_timing_alone_does_not_produce_delta():
+    from server_monitor import ServerMonitor
+    monitor = ServerMonitor.__new__(ServerMonitor)
+    broadcaster = StatusBroadcaster()
+    server = {'status': 'online', 'bots_status': {}, 'all_bots_running': True, 'changed_at': 100.0}
+    status = {'servers': {'server1': dict(server, last_check=101.0, response_time=0.02)},
+              'active_server': 'server1', 'is_monitoring': True, 'auto_restart_enabled': True,
+              'probe_schedule': {'server1': {'next_probe_at': 102.0}}}
+    version = broadcaster.publish(monitor.public_status(status))
+    status = dict(status, servers={'server1': dict(server, last_check=103.0, response_time=0.03)},
+                  probe_schedule={'server1': {'next_probe_at': 104.0}})
+    assert broadcaster.publish(monitor.public_status(status)) == version
+    status = dict(status, servers={'server1': dict(server, status='offline', last_check=105.0)})
+    assert broadcaster.publish(monitor.public_status(status)) == version + 1
+    assert broadcaster.changes_since(version)[0]['servers']['server1']['status'] == 'offline'
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import time
+import pytest
+from flask import jsonify, request
+from agent_client import AgentClient
+from config import Config
+from fleet_sim import SimulatedAgent
+from stub_agent import create_app
+from upload_jobs import UploadJobManager
+
+ROOT_PATH = '/bots'
+PAYLOAD = bytes(range(256)) * 20
+SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(Config, 'UPLOAD_CHUNK_SIZE', 1024)
+
+
+@pytest.fixture
+def source_file(tmp_path):
+    path = tmp_path / 'bot1.zip'
+    path.write_bytes(PAYLOAD)
+    return str(path)
+
+
+@pytest.fixture
+def agents():
+    started = []
+
+    def start(root, before_request=None):
+        agent = SimulatedAgent(len(started) + 1, str(root), ('bot1',))
+        if before_request is not None:
+            agent.app.before_request(before_request)
+        agent.start()
+        started.append(agent)
+        return agent
+
+    yield start
+    for agent in started:
+        agent.stop()
+
+
+def run_upload(agent, source_file):
+    manager = UploadJobManager(AgentClient(max_retries=0), max_workers=2)
+    server_config = {'agent_url': agent.url, 'root_path': ROOT_PATH, 'bots': {'bot1': {'name': 'bot1'}}}
+    job_id = manager.create_job('bot1.zip', source_file, SHA256, 'bot1', {'server1': server_config})
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        job = manager.get_job(job_id)
+        if job['status'] == 'completed':
+            return job['servers']['server1']
+        time.sleep(0.02)
+    raise AssertionError('рассылка не завершилась')
+
+
+def delivered(root):
+    with open(os.path.join(str(root), ROOT_PATH.lstrip('/'), 'bot1.zip'), 'rb') as f:
+        return f.read()
+
+
+def test_chunk_with_wrong_offset_returns_received(tmp_path):
+    client = create_app(str(tmp_path)).test_client()
+    response = client.post(f'/upload_chunk?sha256={SHA256}&offset=0', data=PAYLOAD[:100])
+    assert response.get_json() == {'success': True, 'received': 100}
+    response = client.post(f'/upload_chunk?sha256={SHA256}&offset=50', data=PAYLOAD[50:150])
+    assert response.status_code == 409
+    assert response.get_json()['received'] == 100
+
+
+def test_commit_rejects_hash_mismatch(tmp_path):
+    client = create_app(str(tmp_path)).test_client()
+    client.post(f'/upload_chunk?sha256={SHA256}&offset=0', data=b'not the payload')
+    response = client.post('/upload_commit', json={'sha256': SHA256, 'filename': 'bot1.zip', 'target_path': ROOT_PATH})
+    assert response.status_code == 400
+    # Испорченный фрагмент удаляется: следующая рассылка начнёт с нуля
+    status = client.get('/artifact_status', query_string={'filename': 'bot1.zip', 'target_path': ROOT_PATH, 'sha256': SHA256})
+    assert status.get_json()['received'] == 0
+
+
+def test_upload_resumes_from_partial(tmp_path, agents, source_file):
+    agent = agents(tmp_path / 'agent')
+    partial = tmp_path / 'agent' / '.partial' / SHA256
+    partial.write_bytes(PAYLOAD[:3000])
+    result = run_upload(agent, source_file)
+    assert result['success'] and result['restarted']
+    assert result['resumed_from'] == 3000
+    assert delivered(tmp_path / 'agent') == PAYLOAD
+
+
+def test_upload_resyncs_offset_after_409(tmp_path, agents, source_file):
+    # Агент занижает докачанное в /artifact_status: первый фрагмент получает 409 и продолжает с позиции агента
+    def understate_received():
+        if request.path == '/artifact_status':
+            return jsonify({'sha256': None, 'received': 0})
+        return None
+
+    agent = agents(tmp_path / 'agent', understate_received)
+    (tmp_path / 'agent' / '.partial' / SHA256).write_bytes(PAYLOAD[:2048])
+    result = run_upload(agent, source_file)
+    assert result['success']
+    assert result['resumed_from'] == 0
+    assert delivered(tmp_path / 'agent') == PAYLOAD
+
+
+def test_upload_skips_agent_with_same_hash(tmp_path, agents, source_file):
+    agent = agents(tmp_path / 'agent')
+    run_upload(agent, source_file)
+    result = run_upload(agent, source_file)
+    assert result['success'] and result['skipped']
+    assert result['bytes_sent'] == 0
+
+
+def test_upload_falls_back_to_whole_file(tmp_path, agents, source_file):
+    # Старый агент без протокола артефактов отвечает 404 и получает файл одним multipart-запросом
+    def no_artifact_protocol():
+        if request.path in ('/artifact_status', '/upload_chunk', '/upload_commit'):
+            return jsonify({'error': 'Not Found'}), 404
+        return None
+
+    agent = agents(tmp_path / 'agent', no_artifact_protocol)
+    result = run_upload(agent, source_file)
+    assert result['success'] and not result['skipped']
+    assert result['bytes_sent'] == len(PAYLOAD)
+    assert delivered(tmp_path / 'agent') == PAYLOAD
+
+
+def test_upload_survives_agent_restart(tmp_path, agents, source_file, monkeypatch):
+    # Агент «перезапускается»: фрагменты и проверка статуса несколько раз подряд получают 503
+    monkeypatch.setattr(Config, 'UPLOAD_RETRY_BACKOFF', 0.01)
+    monkeypatch.setattr(Config, 'UPLOAD_CHUNK_RETRIES', 3)
+    outage = {'chunks': 0, 'left': 0}
+
+    def restarting():
+        if request.path == '/upload_chunk':
+            outage['chunks'] += 1
+            if outage['chunks'] in (2, 4):
+                outage['left'] = 3
+        if request.path in ('/upload_chunk', '/artifact_status') and outage['left']:
+            outage['left'] -= 1
+            return jsonify({'error': 'restarting'}), 503
+        return None
+
+    agent = agents(tmp_path / 'agent', restarting)
+    result = run_upload(agent, source_file)
+    # Два сбоя по три отказа подряд укладываются в бюджет из трёх: между ними докачка продвинулась
+    assert result['success']
+    assert delivered(tmp_path / 'agent') == PAYLOAD
@@ -0,0 +1,191 @@
+import fnmatch
+import json
+import os
+import re
+import threading
+import time
+import logging
+from config import Config
+from failover_planner import server_rank
+
+logger = logging.getLogger(__name__)
+
+BOT_FIELDS = ('name', 'start_command', 'stop_command', 'process_name')
+# Команды тёплого резерва: подготовка бота в режиме ожидания и его активация (см. WARM_STANDBY)
+BOT_OPTIONAL_FIELDS = ('warm_command', 'activate_command')
+
+
+class TopologyError(ValueError):
+    pass
+
+
+class Topology:
+    """Неизменяемый снимок парка с индексами: бот -> серверы, шаблон имени файла -> бот, сервер -> приоритет"""
+
+    def __init__(self, servers, file_patterns=None, version=0, source=None):
+        self.servers = servers
+        self.version = version
+        self.source = source
+        self.loaded_at = time.time()
+        bot_servers = {}
+        for server_key, server_config in servers.items():
+            for bot_key in server_config['bots']:
+                bot_servers.setdefault(bot_key, []).append(server_key)
+        self.bot_servers = {bot_key: tuple(keys) for bot_key, keys in bot_servers.items()}
+        self.server_priority = {key: server_rank(key, cfg)[0] for key, cfg in servers.items()}
+        # По умолчанию файл относится к боту, если его имя начинается с id бота (bot2.py -> bot2)
+        patterns = dict(file_patterns or {})
+        for bot_key in self.bot_servers:
+            patterns.setdefault(bot_key, [f'{bot_key}*'])
+        self.file_patterns = patterns
+        self.file_regex, self.regex_bots = _compile_patterns(patterns)
+
+    def bot_for_file(self, filename):
+        # Все шаблоны собраны в одно регулярное выражение: одно сопоставление вместо перебора ботов
+        if self.file_regex is None:
+            return None
+        match = self.file_regex.match(filename)
+        return self.regex_bots[match.lastgroup] if match else None
+
+    def servers_for_bot(self, bot_key):
+        return self.bot_servers.get(bot_key, ())
+
+    def get_info(self):
+        return {
+            'version': self.version,
+            'source': self.source,
+            'loaded_at': self.loaded_at,
+            'servers': len(self.servers),
+            'bots': len(self.bot_servers),
+            'bot_servers': self.bot_servers,
+            'file_patterns': self.file_patterns,
+            'server_priority': self.server_priority
+        }
+
+
+def _compile_patterns(patterns):
+    # Более длинные шаблоны проверяются первыми, чтобы bot10* не перехватывался шаблоном bot1*
+    ordered = sorted(
+        ((pattern, bot_key) for bot_key, bot_patterns in patterns.items() for pattern in bot_patterns),
+        key=lambda item: -len(item[0])
+    )
+    if not ordered:
+        return None, {}
+    groups = []
+    regex_bots = {}
+    for index, (pattern, bot_key) in enumerate(ordered):
+        group = f'p{index}'
+        regex_bots[group] = bot_key
+        groups.append(f'(?P<{group}>{fnmatch.translate(pattern)})')
+    return re.compile('|'.join(groups)), regex_bots
+
+
+def parse_topology(data, version=0, source=None):
+    """Собирает Topology из описания: общий каталог ботов и серверы со списком (или переопределениями) ботов"""
+    if not isinstance(data, dict) or not isinstance(data.get('servers'), dict) or not data['servers']:
+        raise TopologyError("В топологии нет раздела servers")
+    catalog = data.get('bots', {})
+    file_patterns = {}
+    for bot_key, bot_config in catalog.items():
+        if 'file_patterns' in bot_config:
+            file_patterns[bot_key] = list(bot_config['file_patterns'])
+    servers = {}
+    for index, (server_key, server_data) in enumerate(data['servers'].items(), start=1):
+        if 'agent_url' not in server_data:
+            raise TopologyError(f"У сервера {server_key} не задан agent_url")
+        server_bots = server_data.get('bots', list(catalog))
+        if isinstance(server_bots, list):
+            server_bots = {bot_key: {} for bot_key in server_bots}
+        bots = {}
+        for bot_key, overrides in server_bots.items():
+            bot_config = dict(catalog.get(bot_key, {}), **(overrides or {}))
+            bot_config.setdefault('name', bot_key)
+            bot_config.setdefault('process_name', f'{bot_key}.py')
+            missing = [field for field in ('start_command', 'stop_command') if field not in bot_config]
+            if missing:
+                raise TopologyError(f"У бота {bot_key} на сервере {server_key} не заданы: {', '.join(missing)}")
+            bots[bot_key] = {field: bot_config[field] for field in BOT_FIELDS}
+            for field in BOT_OPTIONAL_FIELDS:
+                if field in bot_config:
+                    bots[bot_key][field] = bot_config[field]
+        server_config = {
+            'id': server_data.get('id', index),
+            'name': server_data.get('name', server_key),
+            'url': server_data.get('url', server_data['agent_url']),
+            'agent_url': server_data['agent_url'],
+            'is_primary': bool(server_data.get('is_primary', False)),
+            'root_path': server_data.get('root_path', data.get('root_path', '/home/user/bots')),
+            'bots': bots
+        }
+        for key in ('priority', 'weight', 'capacity'):
+            if key in server_data:
+                server_config[key] = server_data[key]
+        servers[server_key] = server_config
+    return Topology(servers, file_patterns, version=version, source=source)
+
+
+class TopologyManager:
+    """Загрузка топологии из файла и горячая перезагрузка по изменению mtime без остановки мониторинга"""
+
+    def __init__(self, path=None, poll_interval=None):
+        self.path = path or Config.TOPOLOGY_PATH
+        self.poll_interval = Config.TOPOLOGY_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.listeners = []
+        self.current = Topology(Config.SERVERS, source='env')
+        self.file_stamp = None
+        self.last_error = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def load(self):
+        # Ошибка в файле не ломает работающий парк: остаётся прежняя топология
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self.file_stamp:
+            return False
+        self.file_stamp = stamp
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                topology = parse_topology(json.load(f), version=self.current.version + 1, source=self.path)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.last_error = str(e)
+            logger.error(f"Ошибка загрузки топологии из {self.path}: {e}")
+            return False
+        self.apply(topology)
+        return True
+
+    def apply(self, topology):
+        previous = self.current
+        self.current = topology
+        self.last_error = None
+        # Словарь серверов заменяется целиком: читатели Config.SERVERS видят либо старый, либо новый парк
+        Config.SERVERS = topology.servers
+        for listener in self.listeners:
+            listener(topology, previous)
+        logger.info(f"Топология v{topology.version} загружена: {len(topology.servers)} серверов, {len(topology.bot_servers)} ботов")
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._watch, name='topology-watcher', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _watch(self):
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"Ошибка перезагрузки топологии: {e}")
+
+    def get_info(self):
+        info = self.current.get_info()
+        info['path'] = self.path
+        info['last_error'] = self.last_error
+        return info
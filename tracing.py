@@ -0,0 +1,156 @@
+import threading
+import time
+import uuid
+import logging
+from collections import deque
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ('trace', 'name', 'server', 'bot', 'start', 'end', 'success', 'attrs', 'children')
+
+    def __init__(self, trace, name, server=None, bot=None, start=None):
+        self.trace = trace
+        self.name = name
+        self.server = server
+        self.bot = bot
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.success = None
+        self.attrs = {}
+        self.children = []
+
+    def child(self, name, server=None, bot=None, start=None):
+        return self.trace.start_span(name, parent=self, server=server, bot=bot, start=start)
+
+    def finish(self, success=None, end=None, **attrs):
+        self.end = time.time() if end is None else end
+        self.success = success
+        self.attrs.update(attrs)
+        return self
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.time()) - self.start
+
+
+class FailoverTrace:
+    """Хронология одного переключения: интервалы (span) с общим trace_id; параллельные шаги — дочерние интервалы"""
+
+    def __init__(self, trigger, target=None, source=None, bot=None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.trigger = trigger
+        self.target = target
+        self.source = source
+        self.bot = bot
+        self.started_at = time.time()
+        self.finished_at = None
+        self.success = None
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def start_span(self, name, parent=None, server=None, bot=None, start=None):
+        span = Span(self, name, server, bot, start)
+        # Интервалы дописываются из потоков пула команд, поэтому под lock
+        with self.lock:
+            (parent.children if parent is not None else self.spans).append(span)
+        return span
+
+    def finish(self, success):
+        self.finished_at = time.time()
+        self.success = success
+
+    def _span_dict(self, span, origin):
+        data = {
+            'name': span.name,
+            'start': round(span.start - origin, 4),
+            'duration': round(span.duration, 4)
+        }
+        for key in ('server', 'bot', 'success'):
+            value = getattr(span, key)
+            if value is not None:
+                data[key] = value
+        if span.attrs:
+            data['attrs'] = span.attrs
+        if span.children:
+            data['children'] = [self._span_dict(child, origin) for child in sorted(span.children, key=lambda s: s.start)]
+        return data
+
+    def critical_path(self):
+        # Шаги верхнего уровня идут подряд (шаг, целиком прошедший внутри предыдущего, пути не удлиняет);
+        # у параллельных детей путь определяет тот, кто закончил последним
+        path = []
+        with self.lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        last_end = None
+        for span in spans:
+            if last_end is not None and span.end is not None and span.end <= last_end:
+                continue
+            last_end = span.end
+            while span is not None:
+                path.append(span)
+                span = max(span.children, key=lambda s: s.end or 0) if span.children else None
+        return path
+
+    def to_dict(self):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        origin = min([self.started_at] + [span.start for span in spans])
+        path = self.critical_path()
+        # Узкое место — самый долгий конечный шаг критического пути: конкретный сервер или бот
+        leaves = [span for span in path if not span.children]
+        bottleneck = max(leaves, key=lambda s: s.duration) if leaves else None
+        return {
+            'trace_id': self.trace_id,
+            'trigger': self.trigger,
+            'target': self.target,
+            'source': self.source,
+            'bot': self.bot,
+            'started_at': origin,
+            'finished_at': self.finished_at,
+            'duration': (self.finished_at or time.time()) - origin,
+            'success': self.success,
+            'spans': [self._span_dict(span, origin) for span in spans],
+            'critical_path': [
+                {'name': span.name, 'server': span.server, 'bot': span.bot, 'duration': round(span.duration, 4)}
+                for span in path
+            ],
+            'bottleneck': {
+                'name': bottleneck.name, 'server': bottleneck.server, 'bot': bottleneck.bot,
+                'duration': round(bottleneck.duration, 4)
+            } if bottleneck else None
+        }
+
+
+class TraceStore:
+    """Последние FAILOVER_TRACES_KEEP хронологий переключений в памяти"""
+
+    def __init__(self, keep=None):
+        self.lock = threading.Lock()
+        self.traces = deque(maxlen=keep or Config.FAILOVER_TRACES_KEEP)
+        self.listeners = []
+
+    def add(self, trace):
+        data = trace.to_dict()
+        with self.lock:
+            self.traces.append(data)
+        for listener in self.listeners:
+            try:
+                listener(data)
+            except Exception as e:
+                logger.error(f"Ошибка публикации хронологии {data['trace_id']}: {e}")
+        return data
+
+    def list(self, limit=None):
+        with self.lock:
+            traces = list(reversed(self.traces))
+        return traces[:limit] if limit else traces
+
+    def get(self, trace_id):
+        with self.lock:
+            for data in self.traces:
+                if data['trace_id'] == trace_id:
+                    return data
+        return None
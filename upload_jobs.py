@@ -0,0 +1,316 @@
+import mmap
+import os
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_PUBLISH_INTERVAL = 1.0  # секунды между публикациями прогресса для других воркеров
+
+
+class _ProgressReader:
+    """Потоковое тело multipart-запроса поверх общего буфера файла со счётчиком прочитанных байт"""
+
+    def __init__(self, parts, on_progress):
+        self.parts = parts
+        self.total = sum(len(p) for p in parts)
+        self.on_progress = on_progress
+        self.part_index = 0
+        self.offset = 0
+        self.position = 0
+
+    def __len__(self):
+        return self.total
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.total
+        chunks = []
+        while size > 0 and self.part_index < len(self.parts):
+            part = self.parts[self.part_index]
+            chunk = bytes(part[self.offset:self.offset + size])
+            self.offset += len(chunk)
+            size -= len(chunk)
+            chunks.append(chunk)
+            if self.offset >= len(part):
+                self.part_index += 1
+                self.offset = 0
+        data = b''.join(chunks)
+        if data:
+            self.position += len(data)
+            self.on_progress(self.position)
+        return data
+
+
+def _multipart_parts(boundary, fields, filename, payload):
+    safe_name = filename.replace('"', '%22')
+    head = b''
+    for name, value in fields.items():
+        head += (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'
+        ).encode('utf-8')
+    head += (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{safe_name}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode('utf-8')
+    tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return [head, memoryview(payload), tail]
+
+
+class UploadJobManager:
+    """Фоновая параллельная рассылка загруженных файлов по агентам с отслеживанием прогресса"""
+
+    def __init__(self, agent_client, max_workers=None, keep_jobs=None, journal=None):
+        self.agent_client = agent_client
+        self.journal = journal
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or Config.UPLOAD_MAX_WORKERS,
+            thread_name_prefix='upload'
+        )
+        self.keep_jobs = keep_jobs or Config.UPLOAD_JOBS_KEEP
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.published_at = {}
+        self.publish_lock = threading.Lock()
+
+    def create_job(self, filename, file_path, sha256, bot_id, servers):
+        job_id = uuid.uuid4().hex
+        size = os.path.getsize(file_path)
+        job = {
+            'id': job_id,
+            'filename': filename,
+            'sha256': sha256,
+            'bot_id': bot_id,
+            'size': size,
+            'status': 'running',
+            'created_at': time.time(),
+            'finished_at': None,
+            'servers': {
+                server_key: {
+                    'status': 'pending',
+                    'bytes_sent': 0,
+                    'bytes_total': size,
+                    'success': None,
+                    'restarted': None,
+                    'skipped': False,
+                    'error': None
+                }
+                for server_key in servers
+            }
+        }
+        with self.lock:
+            self.jobs[job_id] = job
+            while len(self.jobs) > self.keep_jobs:
+                self.jobs.popitem(last=False)
+
+        # Один буфер (mmap) на всю рассылку, все агенты читают из него без копирования
+        f = open(file_path, 'rb')
+        payload = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        remaining = [len(servers)]
+
+        def release():
+            with self.lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+                if done:
+                    job['status'] = 'completed'
+                    job['finished_at'] = time.time()
+            if done:
+                self._publish(job, force=True)
+                if isinstance(payload, mmap.mmap):
+                    payload.close()
+                f.close()
+
+        self._publish(job, force=True)
+        if not servers:
+            remaining[0] = 1
+            release()
+        for server_key, server_config in servers.items():
+            self.executor.submit(self._send_to_server, job, server_key, server_config, payload, release)
+        return job_id
+
+    def _send_to_server(self, job, server_key, server_config, payload, release):
+        result = job['servers'][server_key]
+        filename = job['filename']
+        bot_id = job['bot_id']
+        started = time.monotonic()
+        try:
+            agent_url = server_config['agent_url']
+            root_path = server_config.get('root_path', '/home/user/bots')
+            result['status'] = 'checking'
+            # Спрашиваем агента, какой хеш у него уже лежит и сколько байт докачано ранее
+            status_resp = self.agent_client.get(
+                agent_url,
+                '/artifact_status',
+                params={'filename': filename, 'target_path': root_path, 'sha256': job['sha256']},
+                timeout=Config.UPLOAD_TIMEOUT
+            )
+            if status_resp.status_code == 404:
+                # Агент без поддержки протокола артефактов — отправляем файл целиком
+                resp = self._send_whole_file(job, result, agent_url, root_path, filename, payload)
+                if resp.status_code != 200:
+                    result.update({'status': 'failed', 'success': False, 'error': f'HTTP {resp.status_code}'})
+                    return
+            elif status_resp.status_code != 200:
+                result.update({'status': 'failed', 'success': False, 'error': f'HTTP {status_resp.status_code}'})
+                return
+            else:
+                agent_status = status_resp.json()
+                if agent_status.get('sha256') == job['sha256']:
+                    result.update({'status': 'done', 'success': True, 'skipped': True, 'restarted': False})
+                    return
+                error = self._send_chunks(job, result, agent_url, root_path, payload, agent_status.get('received', 0))
+                if error:
+                    result.update({'status': 'failed', 'success': False, 'error': error})
+                    return
+            result['success'] = True
+            # После успешной загрузки — перезапуск только нужного бота
+            if bot_id and bot_id in server_config['bots']:
+                result['status'] = 'restarting'
+                restart_resp = self.agent_client.post(
+                    agent_url, '/restart_bot', json={'bot_id': bot_id}, timeout=Config.UPLOAD_TIMEOUT
+                )
+                if restart_resp.status_code == 200:
+                    result['restarted'] = True
+                else:
+                    result.update({'restarted': False, 'error': f'Ошибка перезапуска: {restart_resp.status_code}'})
+            else:
+                result.update({'restarted': False, 'error': 'Бот не найден по имени файла'})
+            result['status'] = 'done'
+        except Exception as e:
+            logger.error(f"Ошибка загрузки {filename} на сервер {server_key}: {e}")
+            result.update({'status': 'failed', 'success': False, 'error': str(e)})
+        finally:
+            metrics.UPLOAD_SECONDS.observe(time.monotonic() - started, server_key)
+            metrics.UPLOAD_TOTAL.inc(server_key, 'skipped' if result['skipped'] else 'success' if result['success'] else 'error')
+            metrics.UPLOAD_BYTES_TOTAL.inc(server_key, amount=max(result['bytes_sent'] - result.get('resumed_from', 0), 0))
+            self._publish(job, force=True)
+            if self.journal is not None:
+                self.journal.record(
+                    'upload', server_key, bot_id, filename=filename, sha256=job['sha256'], success=bool(result['success']),
+                    skipped=result['skipped'], restarted=result['restarted'], error=result['error'],
+                    duration=time.monotonic() - started
+                )
+            release()
+
+    def _send_whole_file(self, job, result, agent_url, root_path, filename, payload):
+        result['status'] = 'uploading'
+        boundary = uuid.uuid4().hex
+        parts = _multipart_parts(boundary, {'target_path': root_path, 'filename': filename}, filename, payload)
+        head_size = len(parts[0])
+
+        def on_progress(position):
+            # Прогресс считаем только по байтам самого файла, без заголовков multipart
+            result['bytes_sent'] = max(0, min(position - head_size, result['bytes_total']))
+            self._publish(job)
+
+        try:
+            return self.agent_client.post(
+                agent_url,
+                '/upload_file',
+                data=_ProgressReader(parts, on_progress),
+                headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                timeout=Config.UPLOAD_TIMEOUT
+            )
+        finally:
+            parts[1].release()
+
+    def _send_chunks(self, job, result, agent_url, root_path, payload, offset):
+        result['status'] = 'uploading'
+        result['resumed_from'] = offset
+        size = job['size']
+        # Отказы считаются подряд: продвижение докачки обнуляет счётчик, и редкие сбои длинной рассылки не копятся
+        failures = 0
+        resync = False
+        while offset < size:
+            result['bytes_sent'] = offset
+            self._publish(job)
+            try:
+                if resync:
+                    # После сбоя узнаём, сколько агент успел принять; его недоступность — такой же отказ, как у фрагмента
+                    status_resp = self.agent_client.get(
+                        agent_url,
+                        '/artifact_status',
+                        params={'filename': job['filename'], 'target_path': root_path, 'sha256': job['sha256']},
+                        timeout=Config.UPLOAD_TIMEOUT
+                    )
+                    if status_resp.status_code != 200:
+                        raise IOError(f'HTTP {status_resp.status_code}')
+                    offset = int(status_resp.json().get('received', 0))
+                    resync = False
+                    continue
+                resp = self.agent_client.post(
+                    agent_url,
+                    '/upload_chunk',
+                    params={'sha256': job['sha256'], 'offset': offset, 'total': size},
+                    data=payload[offset:offset + Config.UPLOAD_CHUNK_SIZE],
+                    headers={'Content-Type': 'application/octet-stream'},
+                    timeout=Config.UPLOAD_TIMEOUT
+                )
+                if resp.status_code not in (200, 409):
+                    raise IOError(f'HTTP {resp.status_code}')
+                # 409 — агент принял другое число байт, продолжаем с его позиции
+                received = int(resp.json()['received'])
+                if received > offset:
+                    failures = 0
+                offset = received
+            except Exception as e:
+                failures += 1
+                if failures > Config.UPLOAD_CHUNK_RETRIES:
+                    return f'Ошибка докачки с позиции {offset}: {e}'
+                delay = min(Config.UPLOAD_RETRY_BACKOFF * (2 ** (failures - 1)), Config.UPLOAD_TIMEOUT)
+                logger.warning(f"Ошибка отправки фрагмента {job['filename']} на {agent_url}, повтор через {delay:.1f} с: {e}")
+                resync = True
+                time.sleep(delay)
+        result['bytes_sent'] = size
+        commit_resp = self.agent_client.post(
+            agent_url,
+            '/upload_commit',
+            json={'sha256': job['sha256'], 'filename': job['filename'], 'target_path': root_path},
+            timeout=Config.UPLOAD_TIMEOUT
+        )
+        if commit_resp.status_code != 200:
+            return f'Ошибка подтверждения: HTTP {commit_resp.status_code}'
+        return None
+
+    def _publish(self, job, force=False):
+        # Состояние задачи уходит слушателям (общее хранилище воркеров): переходы сразу, прогресс — не чаще раза в секунду
+        if not self.listeners:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.published_at.get(job['id'], 0) < PROGRESS_PUBLISH_INTERVAL:
+                return
+            if job['status'] == 'completed':
+                self.published_at.pop(job['id'], None)
+            else:
+                self.published_at[job['id']] = now
+        # Снимок и запись под одним lock: более старое состояние не перезапишет более новое
+        with self.publish_lock:
+            snapshot = self.get_job(job['id'])
+            if snapshot is None:
+                return
+            for listener in self.listeners:
+                try:
+                    listener(snapshot)
+                except Exception as e:
+                    logger.error(f"Ошибка публикации рассылки {job['id']}: {e}")
+
+    def get_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = dict(job)
+            snapshot['servers'] = {k: dict(v) for k, v in job['servers'].items()}
+            return snapshot